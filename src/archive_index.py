@@ -0,0 +1,182 @@
+"""
+Random access to the csv files inside the raw week archives.
+
+For each ``raw/YYYY/YYYY-WW.tar.gz`` a sidecar ``YYYY-WW.index.json`` stores
+the offset and size of every tar member within the uncompressed stream.
+
+A ``YYYY-WW.gzidx`` file additionally stores zran-style gzip access points
+(the 32kb deflate window every ``GZIP_INDEX_SPACING`` bytes) created by the
+`indexed_gzip` package (see requirements.txt), so that reading a member only
+decompresses the member itself. If the package is missing, the member offsets
+still allow to skip parsing the tar headers but the gzip stream is
+decompressed up to the member.
+"""
+import io
+import os
+import json
+import gzip
+import tarfile
+import zlib
+from pathlib import Path
+from typing import Optional, Union, BinaryIO
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+
+GZIP_INDEX_SPACING = 1 << 20
+
+
+def index_filename(tar_filename: Union[str, Path]) -> Path:
+    tar_filename = Path(tar_filename)
+    return tar_filename.parent / (tar_filename.name.split(".")[0] + ".index.json")
+
+
+def gzip_index_filename(tar_filename: Union[str, Path]) -> Path:
+    tar_filename = Path(tar_filename)
+    return tar_filename.parent / (tar_filename.name.split(".")[0] + ".gzidx")
+
+
+def fingerprint(tar_filename: Union[str, Path]) -> str:
+    """
+    Cheap content fingerprint of a gzip file:
+    The file size and the gzip trailer (crc32 and size of uncompressed data)
+    """
+    with open(tar_filename, "rb") as fp:
+        fp.seek(0, os.SEEK_END)
+        size = fp.tell()
+        fp.seek(max(0, size - 8))
+        return f"{size}-{fp.read(8).hex()}"
+
+
+def build_index(tar_filename: Union[str, Path]) -> dict:
+    """
+    Creates the sidecar index file(s) for the tar file.
+
+    :return: dict, the index
+    """
+    members = dict()
+    with tarfile.open(tar_filename, "r|gz") as tf:
+        for member in tf:
+            if member.isfile():
+                members[member.name] = [member.offset_data, member.size]
+
+    index = {
+        "fingerprint": fingerprint(tar_filename),
+        "members": members,
+    }
+    with open(index_filename(tar_filename), "w") as fp:
+        json.dump(index, fp, indent=1)
+
+    if indexed_gzip is not None:
+        gz = indexed_gzip.IndexedGzipFile(str(tar_filename), spacing=GZIP_INDEX_SPACING)
+        try:
+            gz.build_full_index()
+            buffer = io.BytesIO()
+            gz.export_index(fileobj=buffer)
+        finally:
+            gz.close()
+        gzip_index_filename(tar_filename).write_bytes(zlib.compress(buffer.getvalue(), 9))
+
+    return index
+
+
+def load_index(tar_filename: Union[str, Path]) -> Optional[dict]:
+    """
+    Returns the index of the tar file, or None if it does not exist or is outdated.
+    """
+    filename = index_filename(tar_filename)
+    if not filename.exists():
+        return None
+
+    with open(filename) as fp:
+        index = json.load(fp)
+
+    if index.get("fingerprint") != fingerprint(tar_filename):
+        return None
+    return index
+
+
+def is_index_valid(tar_filename: Union[str, Path]) -> bool:
+    if load_index(tar_filename) is None:
+        return False
+    if indexed_gzip is not None and not gzip_index_filename(tar_filename).exists():
+        return False
+    return True
+
+
+def open_member(tar_filename: Union[str, Path], name: str) -> BinaryIO:
+    """
+    Opens a file inside the tar for reading.
+
+    Uses the sidecar index if present and falls back to the tarfile module.
+    The returned file owns all resources and must be closed by the caller.
+
+    :raises KeyError: if the member does not exist
+    """
+    index = load_index(tar_filename)
+    if index is None:
+        tf = tarfile.open(tar_filename)
+        try:
+            fp = tf.extractfile(name)
+        except Exception:
+            tf.close()
+            raise
+        return io.BufferedReader(MemberFile(fp, size=tf.getmember(name).size, owner=tf))
+
+    offset, size = index["members"][name]
+    gz = _open_gzip(tar_filename)
+    try:
+        gz.seek(offset)
+    except Exception:
+        gz.close()
+        raise
+    return io.BufferedReader(MemberFile(gz, size=size), buffer_size=1 << 16)
+
+
+def _open_gzip(tar_filename: Union[str, Path]) -> BinaryIO:
+    gzidx_filename = gzip_index_filename(tar_filename)
+    if indexed_gzip is not None and gzidx_filename.exists():
+        gz = indexed_gzip.IndexedGzipFile(str(tar_filename), spacing=GZIP_INDEX_SPACING)
+        try:
+            gz.import_index(fileobj=io.BytesIO(zlib.decompress(gzidx_filename.read_bytes())))
+        except Exception:
+            gz.close()
+            raise
+        return gz
+
+    return gzip.open(tar_filename, "rb")
+
+
+class MemberFile(io.RawIOBase):
+    """
+    Read-only view of ``size`` bytes from the current position of ``fileobj``.
+
+    Closing it closes the ``fileobj`` and the optional ``owner``.
+    """
+    def __init__(self, fileobj: BinaryIO, size: int, owner=None):
+        super().__init__()
+        self.fileobj = fileobj
+        self.owner = owner
+        self.remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        data = self.fileobj.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.close()
+            if self.owner is not None:
+                self.owner.close()
+        super().close()
@@ -0,0 +1,278 @@
+"""
+Benchmark suite on synthetic raw data, see `src/synthetic.py`.
+
+    PYTHONPATH=. python src/benchmark.py --scale 1 10 100
+
+For each scale, the raw data of `synthetic.TODAY` with the number of sources
+multiplied by the scale is generated once below ``benchmark/<scale>x/raw``.
+Each case then runs against that data and the duration, the throughput and the
+scaling relative to the smallest scale (1.0 is linear) are reported.
+
+The generated data is kept, so the benchmark can be repeated without
+the (slow) generation, e.g. to compare the timings before and after a change.
+"""
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import contextlib
+from pathlib import Path
+from typing import Optional, Tuple, Sequence, Callable, Dict, Generator
+
+import numpy as np
+import pandas as pd
+
+from src.data import Data, Metrics
+from src import synthetic, prepare_release
+from src.metrics_calc import calc_metrics, METRIC_ENGINES
+
+PATH = Path(__file__).resolve().parent.parent / "benchmark"
+
+
+def _get_table(engine: str) -> None:
+    for iso_week, source_id in Data().sources():
+        Data.get_table(iso_week, source_id)
+
+
+def _get_dataframe(engine: str) -> None:
+    for iso_week, source_id in Data().sources():
+        Data.get_dataframe(iso_week, source_id)
+
+
+def _iter_tables_iter(engine: str) -> None:
+    for iso_week, source_id, row_iter in Data().iter_tables_iter():
+        for row in row_iter:
+            pass
+
+
+def _calc_metrics(engine: str) -> None:
+    calc_metrics(Data(), engine=engine)
+
+
+def _update_metrics(engine: str) -> None:
+    prepare_release.update_metrics(engine=engine, force_recalc=True)
+
+
+def _metrics_dataframe(engine: str) -> Tuple[int, int]:
+    df = Metrics.dataframe()
+    return df.shape[0], df.size
+
+
+def _calc_weekly_summary(engine: str) -> None:
+    prepare_release.calc_weekly_summary(Data())
+
+
+# each case processes the whole dataset, unless it returns
+#   the number of rows and cells it has processed
+CASES: Dict[str, Callable[[str], Optional[Tuple[int, int]]]] = {
+    "get_table": _get_table,
+    "get_dataframe": _get_dataframe,
+    "iter_tables_iter": _iter_tables_iter,
+    "calc_metrics": _calc_metrics,
+    "update_metrics": _update_metrics,
+    "metrics_dataframe": _metrics_dataframe,
+    "calc_weekly_summary": _calc_weekly_summary,
+}
+
+
+@contextlib.contextmanager
+def data_path(path: Path) -> Generator[None, None, None]:
+    """
+    Points `Data` to the raw data in ``path/raw`` and the metrics to ``path/metrics``
+    for the duration of the context
+    """
+    saved = Data.PATH, Data.COMPILED_PATH, Data._meta, Metrics.PATH, prepare_release.METRICS_PATH
+    Data.PATH = path / "raw"
+    Data.COMPILED_PATH = path / "compiled"
+    Data._meta = None
+    Metrics.PATH = prepare_release.METRICS_PATH = path / "metrics"
+    try:
+        yield
+    finally:
+        Data.PATH, Data.COMPILED_PATH, Data._meta, Metrics.PATH, prepare_release.METRICS_PATH = saved
+
+
+def run_benchmark(
+        scales: Sequence[float] = (1, 10, 100),
+        cases: Optional[Sequence[str]] = None,
+        engine: str = "numpy",
+        repeat: int = 1,
+        path: Path = PATH,
+        index: bool = True,
+        verbose: bool = False,
+        **generate_kwargs,
+) -> dict:
+    """
+    Runs the benchmark cases on synthetic data of each scale.
+
+    :param scales: sequence of multipliers of the number of sources in `synthetic.TODAY`
+    :param cases: optional list of case names, defaults to all `CASES`,
+        they are run in the order of `CASES`
+    :param engine: str, the engine of the metrics calculation
+    :param repeat: int, run each case this many times and report the fastest run
+    :param path: Path, the directory of the generated data
+    :param index: bool, build the archive indices and the manifest of the raw data
+        like a release does, otherwise the tables are found by reading through the archives
+    :param verbose: bool, if False, the output of the cases is suppressed
+    :param generate_kwargs: passed to `synthetic.generate` to change the shape of today's data
+    :return: dict with "environment", "datasets" (the stats of each scale) and "results",
+        the list of each case and scale, see `report_dataframe`
+    """
+    cases = list(CASES) if cases is None else list(cases)
+    for name in cases:
+        if name not in CASES:
+            raise ValueError(f"Invalid case '{name}', expected one of {tuple(CASES)}")
+    # e.g. update_metrics provides the metrics for metrics_dataframe
+    cases = [name for name in CASES if name in cases]
+
+    sources = generate_kwargs.pop("sources", synthetic.TODAY["sources"])
+    report = dict(environment=_environment(engine), datasets=dict(), results=[])
+
+    for scale in scales:
+        scale_path = Path(path) / f"{scale:g}x"
+        print(f"generating {scale:g}x data in {scale_path}", file=sys.stderr)
+        stats = synthetic.generate(
+            scale_path / "raw", sources=max(1, round(sources * scale)), **generate_kwargs,
+        )
+        report["datasets"][f"{scale:g}x"] = stats
+
+        with data_path(scale_path):
+            if index:
+                with _output(verbose):
+                    prepare_release.update_archive_indices()
+                    prepare_release.update_raw_manifest()
+
+            for name in cases:
+                if name == "metrics_dataframe" and "update_metrics" not in cases:
+                    with _output(verbose):
+                        prepare_release.update_metrics(engine=engine)
+
+                print(f"running {name} on {scale:g}x", file=sys.stderr)
+                durations = []
+                for i in range(repeat):
+                    with _output(verbose):
+                        start = time.perf_counter()
+                        counts = CASES[name](engine)
+                        durations.append(time.perf_counter() - start)
+
+                report["results"].append(dict(
+                    case=name,
+                    scale=scale,
+                    seconds=min(durations),
+                    rows=stats["rows"] if counts is None else counts[0],
+                    cells=stats["cells"] if counts is None else counts[1],
+                    bytes=stats["bytes"] if counts is None else 0,
+                ))
+
+    return report
+
+
+def report_dataframe(report: dict) -> pd.DataFrame:
+    """
+    Returns the results of `run_benchmark` as DataFrame indexed by case and scale,
+    with the throughput in rows, cells and uncompressed megabytes per second
+    and the scaling of the duration relative to the smallest scale,
+    per processed cell, so 1.0 is linear and smaller values are better
+    """
+    df = pd.DataFrame(report["results"]).set_index(["case", "scale"]).sort_index()
+    seconds = df["seconds"].where(df["seconds"] > 0)
+    df["rows/s"] = (df["rows"] / seconds).round()
+    df["cells/s"] = (df["cells"] / seconds).round()
+    df["MB/s"] = (df["bytes"] / 2 ** 20 / seconds).round(1)
+
+    first = df.groupby(level="case")[["seconds", "cells"]].transform("first")
+    df["scaling"] = ((df["seconds"] / first["seconds"]) / (df["cells"] / first["cells"])).round(2)
+    df["seconds"] = df["seconds"].round(3)
+    return df.drop(columns=["bytes"])
+
+
+def _environment(engine: str) -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "engine": engine,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def _output(verbose: bool):
+    if verbose:
+        return contextlib.nullcontext()
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scale", type=float, nargs="+", default=[1, 10, 100],
+        help="Multipliers of the number of sources of today's data",
+    )
+    parser.add_argument(
+        "--case", type=str, nargs="+", default=None, choices=list(CASES),
+        help="The cases to run, defaults to all",
+    )
+    parser.add_argument(
+        "--engine", type=str, nargs="?", default="numpy", choices=METRIC_ENGINES,
+        help="The implementation of the metrics calculation",
+    )
+    parser.add_argument(
+        "--repeat", type=int, nargs="?", default=1,
+        help="Run each case this many times and report the fastest run",
+    )
+    parser.add_argument(
+        "--weeks", type=int, nargs="?", default=1,
+        help="Number of consecutive weeks of synthetic data",
+    )
+    for key, value in synthetic.TODAY.items():
+        parser.add_argument(
+            f"--{key.replace('_', '-')}", type=type(value), nargs="?", default=value,
+            help=f"Shape of today's data, default: {value}",
+        )
+    parser.add_argument(
+        "--compresslevel", type=int, nargs="?", default=9,
+        help="gzip level of the synthetic archives, 1 is much faster to generate",
+    )
+    parser.add_argument(
+        "--path", type=str, nargs="?", default=str(PATH),
+        help="Directory of the synthetic data",
+    )
+    parser.add_argument(
+        "--output", type=str, nargs="?", default=None,
+        help="Optional json file to store the results",
+    )
+    parser.add_argument(
+        "--no-index", type=bool, nargs="?", default=False, const=True,
+        help="Do not build the archive indices and manifest of the synthetic data",
+    )
+    parser.add_argument(
+        "--verbose", type=bool, nargs="?", default=False, const=True,
+        help="Show the output of the cases",
+    )
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        scales=args.scale,
+        cases=args.case,
+        engine=args.engine,
+        repeat=args.repeat,
+        path=Path(args.path),
+        index=not args.no_index,
+        verbose=args.verbose,
+        weeks=args.weeks,
+        compresslevel=args.compresslevel,
+        **{key: getattr(args, key) for key in synthetic.TODAY},
+    )
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=1)
+
+    print(report_dataframe(report).to_markdown(floatfmt=".10g"))
+
+
+if __name__ == "__main__":
+    main()
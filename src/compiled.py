@@ -0,0 +1,147 @@
+import os
+import json
+import shutil
+from pathlib import Path
+from typing import Optional, Union, Callable
+
+import numpy as np
+
+from src.matrix import TableMatrix
+from src.dates import strings_to_datetime64, slots_to_datetime64
+
+
+class CompiledTable:
+    """
+    Binary representation of one raw csv file (one source in one week).
+
+    Stored as a directory of numpy files which can be memory-mapped:
+
+        - ``dates.npy``: datetime64[s] snapshot timestamp of each row
+        - ``location_codes.npy``: index into ``locations.npy`` for each row
+        - ``locations.npy``: unicode array of the location ids
+        - ``slots.npy``: datetime64[s] of each date column
+        - ``matrix.npy``: uint8 array of shape (rows, ceil(slots / 8)),
+          the free-date flags packed with ``numpy.packbits``
+        - ``meta.json``: source_id and the fingerprint of the original archive
+    """
+
+    FILES = ("dates", "location_codes", "locations", "slots", "matrix")
+
+    def __init__(
+            self,
+            source_id: str,
+            dates: np.ndarray,
+            location_codes: np.ndarray,
+            locations: np.ndarray,
+            slots: np.ndarray,
+            matrix: np.ndarray,
+            fingerprint: Optional[str] = None,
+    ):
+        self.source_id = source_id
+        self.dates = dates
+        self.location_codes = location_codes
+        self.locations = locations
+        self.slots = slots
+        self.matrix = matrix
+        self.fingerprint = fingerprint
+
+    @property
+    def num_rows(self) -> int:
+        return self.dates.shape[0]
+
+    @property
+    def num_slots(self) -> int:
+        return self.slots.shape[0]
+
+    @classmethod
+    def from_matrix(
+            cls,
+            source_id: str,
+            table: TableMatrix,
+            fingerprint: Optional[str] = None,
+    ) -> "CompiledTable":
+        """
+        Create from a TableMatrix, e.g. as returned by ``Data.RowIter.read_matrix()``
+        """
+        locations, location_codes = np.unique(table.location_ids.astype(str), return_inverse=True)
+        return cls(
+            source_id=source_id,
+            dates=strings_to_datetime64(table.dates),
+            location_codes=location_codes.reshape(-1).astype(np.int32),
+            locations=locations,
+            slots=slots_to_datetime64(table.slots),
+            matrix=np.packbits(table.matrix, axis=1).reshape(len(table), (table.matrix.shape[1] + 7) // 8),
+            fingerprint=fingerprint,
+        )
+
+    @classmethod
+    def exists(cls, path: Union[str, Path]) -> bool:
+        return (Path(path) / "meta.json").exists()
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True) -> "CompiledTable":
+        """
+        Load from the directory.
+
+        :param mmap: bool, if True, the arrays are memory-mapped instead of read into memory
+        """
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text())
+        return cls(
+            source_id=meta["source_id"],
+            fingerprint=meta.get("fingerprint"),
+            **{
+                name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None)
+                for name in cls.FILES
+            }
+        )
+
+    def save(self, path: Union[str, Path]):
+        path = Path(path)
+        if path.exists():
+            shutil.rmtree(path)
+        os.makedirs(path)
+
+        for name in self.FILES:
+            np.save(path / f"{name}.npy", getattr(self, name))
+
+        # written last, so an interrupted save does not leave a valid-looking table
+        (path / "meta.json").write_text(json.dumps({
+            "source_id": self.source_id,
+            "fingerprint": self.fingerprint,
+        }))
+
+    def location_mask(self, accept: Callable[[str], bool]) -> Optional[np.ndarray]:
+        """
+        Returns a bool array of all rows whose location id is accepted
+        by the ``accept`` callable, or None if all are accepted
+        """
+        accepted = np.array([bool(accept(loc)) for loc in self.locations.tolist()], dtype=bool)
+        if accepted.all():
+            return None
+        return accepted[self.location_codes]
+
+    def unpacked_matrix(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns the bool matrix of shape (rows, slots).
+
+        :param rows: optional bool mask or index array to select rows
+        """
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        return np.unpackbits(matrix, axis=1, count=self.num_slots).view(bool)
+
+    def to_matrix(self, rows: Optional[np.ndarray] = None) -> TableMatrix:
+        """
+        Returns the (selected rows of the) table as TableMatrix
+        with datetime64 dates and slots.
+
+        :param rows: optional bool mask or index array to select rows
+        """
+        location_codes = self.location_codes if rows is None else self.location_codes[rows]
+        return TableMatrix(
+            source_ids=np.full(location_codes.shape[0], self.source_id, dtype=object),
+            location_ids=np.asarray(self.locations).astype(object)[location_codes],
+            dates=np.asarray(self.dates if rows is None else self.dates[rows]),
+            slots=np.asarray(self.slots),
+            matrix=self.unpacked_matrix(rows),
+        )
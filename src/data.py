@@ -1,31 +1,52 @@
-import glob
+import io
+import re
 import tarfile
 import csv
 import json
 import fnmatch
 import codecs
+import itertools
 import datetime
+import threading
+from queue import Queue, Full
+from multiprocessing import Pool
 from pathlib import Path
 from typing import List, Optional, Tuple, Generator, BinaryIO, Callable, Union, Dict, Sequence
 
 import pandas as pd
 import numpy as np
 
+from src import archive_index, metrics_columnar, manifest, instrument
+from src.compiled import CompiledTable
+from src.long_table import LongTable
+from src.table_cache import TableCache
+from src.matrix import TableMatrix, parse_block
+from src.dates import (
+    string_to_datetime, strings_to_datetime64, slots_to_datetime64, datetime64_to_strings, to_datetime_index,
+)
+
 
 IsoWeek = Tuple[int, int]
 StringFilter = Optional[Union[str, Sequence[str], Callable[[str], bool]]]
 
 
 def to_datetime(s: str) -> datetime.datetime:
-    return datetime.datetime.strptime(s[:19], "%Y-%m-%d %H:%M:%S")
+    return string_to_datetime(s[:19])
 
 
 class Data:
 
     PATH = Path(__file__).resolve().parent.parent / "raw"
+    COMPILED_PATH = Path(__file__).resolve().parent.parent / "compiled"
     _meta = None
+    # optional cache of get_table and get_dataframe results, see enable_cache()
+    _cache: Optional[TableCache] = None
 
     class RowIter:
+
+        # number of bytes to parse at once in the fast path
+        BLOCK_SIZE = 1 << 22
+
         def __init__(
                 self,
                 fp: BinaryIO,
@@ -36,38 +57,64 @@ class Data:
                 with_meta: bool = False,
         ):
             self.fp = fp
-            self.fp_text = codecs.getreader("utf-8")(self.fp)
             self.location_id = location_id
             self.as_int = as_int
             self.as_datetime = as_datetime
             self.empty = empty
             self.with_meta = with_meta
-            self._reader = csv.reader(self.fp_text)
-
-            self.columns = next(iter(self._reader))
+            self._reader = None
+            self._rows = iter(())
+            self._accept_location = _compile_filter(location_id)
+            # rows are rejected by their location_id bytes before parsing,
+            #   which is switched off once a quote char is encountered
+            self._prefilter = location_id is not None
+            self._accepted_locations: Dict[bytes, bool] = dict()
+
+            self.columns = next(csv.reader([self.fp.readline().decode("utf-8")]))
+            self.slots = self.columns[3:]
             if as_datetime:
-                for i in range(3, len(self.columns)):
-                    self.columns[i] = Data.string_to_datetime(self.columns[i])
+                self.columns[3:] = slots_to_datetime64(self.slots).tolist()
             if with_meta:
                 self.columns = self.columns[:3] + ["source_name", "location_name"] + self.columns[3:]
 
         def __iter__(self):
             return self
 
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            self.close()
+
+        def close(self):
+            """
+            Closes the file, which also happens once all rows have been iterated
+            """
+            self.fp.close()
+
         def __next__(self):
+            if self.fp.closed:
+                raise StopIteration
+            try:
+                return self._next_row()
+            except StopIteration:
+                self.close()
+                raise
+
+        def _next_row(self):
+            if self.as_int and self.empty is None:
+                return self._next_fast()
+
             while True:
-                row = next(self._reader)
+                row = self._next_csv_row()
 
                 # make location_id always str
                 row[2] = str(row[2])
 
-                if self.location_id is not None:
-                    if not _string_filter(row[2], self.location_id):
+                if self._accept_location is not None:
+                    if not self._accept_location(row[2]):
                         continue
 
-                if self.with_meta:
-                    row = row[:3] + [Data.get_meta(row[1], "name"), Data.get_meta(row[1], row[2], "name")] + row[3:]
-
                 if self.as_datetime:
                     row[0] = Data.string_to_datetime(row[0])
 
@@ -77,8 +124,199 @@ class Data:
                 elif self.as_int:
                     row = row[:3] + [0 if v == "" else 1 for v in row[3:]]
 
+                if self.with_meta:
+                    row = row[:3] + [Data.get_meta(row[1], "name"), Data.get_meta(row[1], row[2], "name")] + row[3:]
+
                 return row
 
+        def read_matrix(self) -> TableMatrix:
+            """
+            Reads all remaining rows into a TableMatrix.
+
+            The date columns are parsed vectorized in blocks of `BLOCK_SIZE` bytes.
+            Only the csv formatting and location filter are applied,
+            the as_int, as_datetime, empty and with_meta settings are ignored.
+            """
+            tables = []
+            while True:
+                table = self._read_block()
+                if table is None:
+                    break
+                if len(table):
+                    tables.append(table)
+
+            if not tables:
+                return TableMatrix.empty(self.slots)
+            return TableMatrix.concat(tables)
+
+        def iter_matrices(self, chunksize: int) -> Generator[TableMatrix, None, None]:
+            """
+            Reads the remaining rows as TableMatrix chunks of at most `chunksize` rows,
+            without holding more than one block of `BLOCK_SIZE` bytes of the file.
+
+            Same as `read_matrix` otherwise.
+            """
+            pending, num_pending = [], 0
+            while True:
+                table = self._read_block()
+                if table is None:
+                    break
+                start = 0
+                while start < len(table):
+                    part = table.select(slice(start, start + chunksize - num_pending))
+                    start += len(part)
+                    pending.append(part)
+                    num_pending += len(part)
+                    if num_pending >= chunksize:
+                        yield TableMatrix.concat(pending)
+                        pending, num_pending = [], 0
+
+            if pending:
+                yield TableMatrix.concat(pending)
+
+        def _next_fast(self):
+            while True:
+                try:
+                    return next(self._rows)
+                except StopIteration:
+                    pass
+
+                table = self._read_block()
+                if table is None:
+                    raise StopIteration
+
+                if self.as_datetime:
+                    dates = strings_to_datetime64(table.dates).tolist()
+                else:
+                    dates = table.dates.tolist()
+
+                if self.with_meta:
+                    self._rows = (
+                        [date, source_id, location_id,
+                         Data.get_meta(source_id, "name"), Data.get_meta(source_id, location_id, "name")] + values
+                        for date, source_id, location_id, values in zip(
+                            dates, table.source_ids.tolist(), table.location_ids.tolist(),
+                            table.matrix.view(np.uint8).tolist(),
+                        )
+                    )
+                else:
+                    self._rows = (
+                        [date, source_id, location_id] + values
+                        for date, source_id, location_id, values in zip(
+                            dates, table.source_ids.tolist(), table.location_ids.tolist(),
+                            table.matrix.view(np.uint8).tolist(),
+                        )
+                    )
+
+        def _read_block(self) -> Optional[TableMatrix]:
+            """
+            Reads the next block of lines, or returns None at the end of the file
+            """
+            prefiltered = False
+            if self._reader is not None:
+                # fell back to csv module
+                with instrument.stage("raw.parse_csv"):
+                    rows = list(itertools.islice(self._reader, 10_000))
+                    if not rows:
+                        return None
+                    table = self._rows_to_matrix(rows)
+                instrument.count("raw.parse_csv", rows=len(table), cells=table.matrix.size)
+            else:
+                with instrument.stage("raw.read"):
+                    lines = self.fp.readlines(self.BLOCK_SIZE)
+                if not lines:
+                    return None
+
+                if self._prefilter:
+                    with instrument.stage("raw.prefilter"):
+                        num_lines = len(lines)
+                        lines = self._filter_lines(lines)
+                        prefiltered = self._prefilter
+                    instrument.count("raw.prefilter", rows=num_lines)
+                    if not lines:
+                        return TableMatrix.empty(self.slots)
+
+                with instrument.stage("raw.parse"):
+                    block = b"".join(lines)
+                    if not block.endswith(b"\n"):
+                        block += b"\n"
+                    table = parse_block(block, self.slots)
+
+                if table is None:
+                    with instrument.stage("raw.parse_csv"):
+                        table = self._rows_to_matrix(list(csv.reader(codecs.iterdecode(lines, "utf-8"))))
+                        self._reader = self._csv_reader()
+                    instrument.count("raw.parse_csv", rows=len(table), cells=table.matrix.size)
+                else:
+                    instrument.count("raw.parse", rows=len(table), cells=table.matrix.size)
+
+            if self._accept_location is not None and not prefiltered and len(table):
+                mask = table.location_mask(self._accept_location)
+                if mask is not None:
+                    table = table.select(mask)
+
+            return table
+
+        def _filter_lines(self, lines: List[bytes]) -> List[bytes]:
+            """
+            Returns the lines whose location_id (the third field) is accepted,
+            without splitting the date columns.
+
+            Lines that can not be judged are kept for the parser and the location filter.
+            """
+            if any(b'"' in line for line in lines):
+                self._prefilter = False
+                return lines
+
+            accepted_locations = self._accepted_locations
+            accepted = []
+            for line in lines:
+                start = line.find(b",", line.find(b",") + 1) + 1
+                end = line.find(b",", start)
+                if start == 0 or end < 0:
+                    accepted.append(line)
+                    continue
+                location = line[start:end]
+                accept = accepted_locations.get(location)
+                if accept is None:
+                    accept = accepted_locations[location] = bool(self._accept_location(location.decode("utf-8")))
+                if accept:
+                    accepted.append(line)
+            return accepted
+
+        def _filtered_lines(self) -> Generator[bytes, None, None]:
+            """
+            Yields the remaining lines of the file, in blocks filtered by `_filter_lines`
+            """
+            while True:
+                lines = self.fp.readlines(self.BLOCK_SIZE)
+                if not lines:
+                    break
+                if self._prefilter:
+                    lines = self._filter_lines(lines)
+                yield from lines
+
+        def _csv_reader(self):
+            if self._prefilter:
+                return csv.reader(codecs.iterdecode(self._filtered_lines(), "utf-8"))
+            return csv.reader(codecs.iterdecode(self.fp, "utf-8"))
+
+        def _rows_to_matrix(self, rows: List[List[str]]) -> TableMatrix:
+            if not rows:
+                return TableMatrix.empty(self.slots)
+            return TableMatrix(
+                dates=np.array([row[0] for row in rows], dtype=object),
+                source_ids=np.array([row[1] for row in rows], dtype=object),
+                location_ids=np.array([str(row[2]) for row in rows], dtype=object),
+                slots=np.asarray(self.slots),
+                matrix=np.array([row[3:] for row in rows], dtype=object).reshape(len(rows), -1) != "",
+            )
+
+        def _next_csv_row(self) -> List[str]:
+            if self._reader is None:
+                self._reader = self._csv_reader()
+            return next(self._reader)
+
     def __init__(
             self,
             source_id: StringFilter = None,
@@ -141,7 +379,108 @@ class Data:
 
     @classmethod
     def string_to_datetime(cls, s: str) -> datetime.datetime:
-        return datetime.datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
+        return string_to_datetime(s)
+
+    @classmethod
+    def tar_filename(cls, iso_week: IsoWeek) -> Path:
+        iso_week_str = cls.iso_week_to_string(iso_week)
+        return cls.PATH / iso_week_str[:4] / f"{iso_week_str}.tar.gz"
+
+    @classmethod
+    def open_file(cls, iso_week: IsoWeek, source_id: str) -> BinaryIO:
+        """
+        Opens the csv file of a source in the given week.
+
+        If the sidecar index of the week's tar exists, the file is read
+        directly from its position within the archive. See `src/archive_index.py`.
+
+        The caller is responsible for closing the returned file.
+        """
+        return archive_index.open_member(cls.tar_filename(iso_week), f"{source_id}.csv")
+
+    @classmethod
+    def compiled_path(cls, iso_week: IsoWeek, source_id: str) -> Path:
+        iso_week_str = cls.iso_week_to_string(iso_week)
+        return cls.COMPILED_PATH / iso_week_str[:4] / iso_week_str / source_id
+
+    @classmethod
+    def compile(cls, iso_week: IsoWeek, source_id: str) -> CompiledTable:
+        """
+        Converts the csv file of a source in the given week into
+        the binary store at `COMPILED_PATH`, see `src/compiled.py`.
+
+        Once compiled, `get_table` and `get_dataframe` read from the store.
+        """
+        fingerprint = archive_index.fingerprint(cls.tar_filename(iso_week))
+        with cls.open_file(iso_week, source_id) as fp:
+            compiled = CompiledTable.from_matrix(
+                source_id, cls.RowIter(fp).read_matrix(), fingerprint=fingerprint,
+            )
+        compiled.save(cls.compiled_path(iso_week, source_id))
+        return compiled
+
+    @classmethod
+    def is_compiled(cls, iso_week: IsoWeek, source_id: str) -> bool:
+        path = cls.compiled_path(iso_week, source_id)
+        if not CompiledTable.exists(path):
+            return False
+        compiled = CompiledTable.load(path)
+        return compiled.fingerprint == archive_index.fingerprint(cls.tar_filename(iso_week))
+
+    @classmethod
+    def get_compiled(cls, iso_week: IsoWeek, source_id: str) -> Optional[CompiledTable]:
+        """
+        Returns the memory-mapped binary store of the source in the given week,
+        or None if it was not compiled or the archive has changed since.
+        """
+        path = cls.compiled_path(iso_week, source_id)
+        if not CompiledTable.exists(path):
+            return None
+        compiled = CompiledTable.load(path)
+        if compiled.fingerprint != archive_index.fingerprint(cls.tar_filename(iso_week)):
+            return None
+        return compiled
+
+    @classmethod
+    def enable_cache(cls, max_bytes: int = 1 << 30) -> TableCache:
+        """
+        Cache the results of `get_table` and `get_dataframe` in memory.
+
+        The cached objects are returned as-is on repeated calls
+        with the same arguments, so they must not be modified.
+        Entries are discarded if the week's archive has been modified.
+        Calls with a callable location filter are not cached.
+
+        :param max_bytes: int, the maximum (estimated) memory size of all cached tables,
+            the least-recently-used tables are evicted first
+        :return: the TableCache instance, see `TableCache.info()` for hit and miss counts
+        """
+        cls._cache = TableCache(max_bytes=max_bytes)
+        return cls._cache
+
+    @classmethod
+    def disable_cache(cls):
+        cls._cache = None
+
+    @classmethod
+    def cache_info(cls) -> Optional[dict]:
+        return cls._cache.info() if cls._cache is not None else None
+
+    @classmethod
+    def _cache_key(cls, *args) -> Optional[tuple]:
+        """
+        Returns the hashable cache key of the arguments or None if they can not be cached
+        """
+        if cls._cache is None:
+            return None
+        key = []
+        for arg in args:
+            if callable(arg):
+                return None
+            if isinstance(arg, (list, tuple)):
+                arg = tuple(arg)
+            key.append(arg)
+        return tuple(key)
 
     @classmethod
     def get_table(
@@ -154,11 +493,35 @@ class Data:
             empty: Optional[str] = None,
             with_meta: bool = False,
     ) -> Tuple[List, List[List]]:
-        iso_week_str = cls.iso_week_to_string(iso_week)
+        key = cls._cache_key("table", iso_week, source_id, location_id, as_int, as_datetime, empty, with_meta)
+        if key is not None:
+            table = cls._cache.get(key, cls.tar_filename(iso_week))
+            if table is None:
+                table = cls._get_table(iso_week, source_id, location_id, as_int, as_datetime, empty, with_meta)
+                cls._cache.put(key, cls.tar_filename(iso_week), table)
+            return table
 
-        with tarfile.open(cls.PATH / iso_week_str[:4] / f"{iso_week_str}.tar.gz") as tf:
-            fp = tf.extractfile(f"{source_id}.csv")
+        return cls._get_table(iso_week, source_id, location_id, as_int, as_datetime, empty, with_meta)
 
+    @classmethod
+    def _get_table(
+            cls,
+            iso_week: IsoWeek,
+            source_id: str,
+            location_id: StringFilter,
+            as_int: bool,
+            as_datetime: bool,
+            empty: Optional[str],
+            with_meta: bool,
+    ) -> Tuple[List, List[List]]:
+        compiled = cls.get_compiled(iso_week, source_id)
+        if compiled is not None:
+            return cls._compiled_to_table(
+                compiled, location_id=location_id, as_int=as_int, as_datetime=as_datetime,
+                empty=empty, with_meta=with_meta,
+            )
+
+        with cls.open_file(iso_week, source_id) as fp:
             columns, rows = cls._read_table(
                 fp=fp, as_int=as_int, as_datetime=as_datetime, empty=empty,
                 location_id=location_id, with_meta=with_meta
@@ -177,14 +540,17 @@ class Data:
             empty: Optional[str] = None,
             with_meta: bool = False,
     ) -> RowIter:
-        iso_week_str = cls.iso_week_to_string(iso_week)
+        """
+        Returns a RowIter over the table of a source in the given week.
 
-        with tarfile.open(cls.PATH / iso_week_str[:4] / f"{iso_week_str}.tar.gz") as tf:
-            fp = tf.extractfile(f"{source_id}.csv")
-            return cls.RowIter(
-                    fp=fp, as_int=as_int, as_datetime=as_datetime, empty=empty,
-                    location_id=location_id, with_meta=with_meta,
-            )
+        The file is closed once all rows have been iterated. Use the RowIter
+        as context manager or call its `close()` when stopping early.
+        """
+        fp = cls.open_file(iso_week, source_id)
+        return cls.RowIter(
+                fp=fp, as_int=as_int, as_datetime=as_datetime, empty=empty,
+                location_id=location_id, with_meta=with_meta,
+        )
 
     @classmethod
     def get_dataframe(
@@ -194,14 +560,191 @@ class Data:
             location_id: StringFilter = None,
             as_datetime: bool = True,
             with_meta: bool = False,
+            dtype: str = "int64",
+            sparse: bool = False,
+            chunksize: Optional[int] = None,
+    ) -> Union[pd.DataFrame, Generator[pd.DataFrame, None, None]]:
+        """
+        Returns the table of a source in the given week as DataFrame
+        with date, source_id and location_id as row index and the slots as columns.
+
+        :param dtype: str, the numpy dtype of the cells, e.g. "int64", "uint8" or "bool"
+        :param sparse: bool, if True, the columns are pandas.SparseDtype,
+            storing only the free cells
+        :param chunksize: int, if given, returns a generator of DataFrames
+            with at most `chunksize` rows each, read straight from the file
+            so that the whole table is never held in memory
+        """
+        if chunksize is not None:
+            return cls._iter_dataframe_chunks(
+                iso_week, source_id, location_id, as_datetime, with_meta, dtype, sparse, chunksize,
+            )
+
+        key = cls._cache_key("dataframe", iso_week, source_id, location_id, as_datetime, with_meta, dtype, sparse)
+        if key is not None:
+            df = cls._cache.get(key, cls.tar_filename(iso_week))
+            if df is None:
+                df = cls._get_dataframe(iso_week, source_id, location_id, as_datetime, with_meta, dtype, sparse)
+                cls._cache.put(key, cls.tar_filename(iso_week), df)
+            return df
+
+        return cls._get_dataframe(iso_week, source_id, location_id, as_datetime, with_meta, dtype, sparse)
+
+    @classmethod
+    def _get_dataframe(
+            cls,
+            iso_week: Tuple[int, int],
+            source_id: str,
+            location_id: StringFilter,
+            as_datetime: bool,
+            with_meta: bool,
+            dtype: str,
+            sparse: bool,
     ) -> pd.DataFrame:
-        columns, rows = cls.get_table(
-            iso_week=iso_week, 
-            source_id=source_id, location_id=location_id,
-            as_int=True, as_datetime=as_datetime,
-            with_meta=with_meta,
+        compiled = cls.get_compiled(iso_week, source_id)
+        if compiled is not None:
+            row_mask = None
+            if location_id is not None:
+                row_mask = compiled.location_mask(lambda loc: _string_filter(loc, location_id))
+            table = compiled.to_matrix(row_mask)
+
+        else:
+            with cls.open_file(iso_week, source_id) as fp:
+                table = cls.RowIter(fp, location_id=location_id).read_matrix()
+
+        return cls._matrix_to_dataframe(
+            table, as_datetime=as_datetime, with_meta=with_meta, dtype=dtype, sparse=sparse,
+        )
+
+    @classmethod
+    def _iter_dataframe_chunks(
+            cls,
+            iso_week: Tuple[int, int],
+            source_id: str,
+            location_id: StringFilter,
+            as_datetime: bool,
+            with_meta: bool,
+            dtype: str,
+            sparse: bool,
+            chunksize: int,
+    ) -> Generator[pd.DataFrame, None, None]:
+        compiled = cls.get_compiled(iso_week, source_id)
+        if compiled is not None:
+            rows = np.arange(compiled.num_rows)
+            if location_id is not None:
+                row_mask = compiled.location_mask(lambda loc: _string_filter(loc, location_id))
+                if row_mask is not None:
+                    rows = rows[row_mask]
+            tables = (
+                compiled.to_matrix(rows[start:start + chunksize])
+                for start in range(0, rows.shape[0], chunksize)
+            )
+            for table in tables:
+                yield cls._matrix_to_dataframe(
+                    table, as_datetime=as_datetime, with_meta=with_meta, dtype=dtype, sparse=sparse,
+                )
+
+        else:
+            with cls.open_file(iso_week, source_id) as fp:
+                for table in cls.RowIter(fp, location_id=location_id).iter_matrices(chunksize):
+                    yield cls._matrix_to_dataframe(
+                        table, as_datetime=as_datetime, with_meta=with_meta, dtype=dtype, sparse=sparse,
+                    )
+
+    @classmethod
+    def get_long_table(
+            cls,
+            iso_week: IsoWeek,
+            source_id: str,
+            location_id: StringFilter = None,
+    ) -> LongTable:
+        """
+        Returns only the free cells of a source in the given week
+        as (date, source_id, location_id, slot) records, see `src/long_table.py`.
+
+        The csv file is converted block by block without creating the wide table.
+        """
+        compiled = cls.get_compiled(iso_week, source_id)
+        if compiled is not None:
+            row_mask = None
+            if location_id is not None:
+                row_mask = compiled.location_mask(lambda loc: _string_filter(loc, location_id))
+            return LongTable.from_matrix(compiled.to_matrix(row_mask))
+
+        with cls.open_file(iso_week, source_id) as fp:
+            return cls._read_long_table(cls.RowIter(fp, location_id=location_id))
+
+    @classmethod
+    def _read_long_table(cls, row_iter: RowIter) -> LongTable:
+        tables = []
+        while True:
+            table = row_iter._read_block()
+            if table is None:
+                break
+            if len(table):
+                tables.append(LongTable.from_matrix(table))
+        return LongTable.concat(tables)
+
+    @classmethod
+    def location_history(
+            cls,
+            source_id: str,
+            location_id: StringFilter,
+            iso_week: Optional[IsoWeek] = None,
+            iso_week_gt: Optional[IsoWeek] = None,
+            iso_week_gte: Optional[IsoWeek] = None,
+            iso_week_lt: Optional[IsoWeek] = None,
+            iso_week_lte: Optional[IsoWeek] = None,
+            as_datetime: bool = True,
+            with_meta: bool = False,
+            dtype: str = "int64",
+            sparse: bool = False,
+            processes: int = 1,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Returns the snapshots of one or several locations of a source across weeks
+        as one DataFrame in the layout of `get_dataframe`.
+
+        Only the rows of the matching locations are decoded. The slot columns
+        are the sorted union of the slots of all weeks, slots that do not exist in a week
+        are 0.
+
+        :param source_id: str, the exact source id
+        :param location_id: filter, either wildcard string, or list of wildcard strings or
+            a callable(str) returning bool (which must be picklable if `processes` > 1)
+        :param dtype: str, the numpy dtype of the cells, see `get_dataframe`
+        :param sparse: bool, if True, the columns are pandas.SparseDtype, see `get_dataframe`
+        :param processes: int, if > 1, the weeks are decoded in parallel processes
+        :return: DataFrame or None if no rows exist
+        """
+        data = cls(
+            iso_week=iso_week, iso_week_gt=iso_week_gt, iso_week_gte=iso_week_gte,
+            iso_week_lt=iso_week_lt, iso_week_lte=iso_week_lte,
+        )
+        tasks = []
+        for week, tar_filename in data.compressed_files():
+            # with the manifest, skip the weeks without the source or location
+            entry = manifest.week_entry(cls.PATH, cls.iso_week_to_string(week))
+            if entry is not None:
+                member = next((m for m in entry["members"] if m["source_id"] == source_id), None)
+                if member is None or not any(_string_filter(loc, location_id) for loc in member["locations"]):
+                    continue
+            tasks.append((week, source_id, location_id))
+
+        if processes > 1 and len(tasks) > 1:
+            with Pool(processes) as pool:
+                tables = pool.map(_read_location_table, tasks)
+        else:
+            tables = [_read_location_table(task) for task in tasks]
+
+        tables = [t for t in tables if len(t)]
+        if not tables:
+            return None
+
+        table = TableMatrix.concat_aligned(tables)
+        return cls._matrix_to_dataframe(
+            table, as_datetime=as_datetime, with_meta=with_meta, dtype=dtype, sparse=sparse,
         )
-        return cls._table_to_dataframe(columns, rows, as_datetime=as_datetime)
 
     def filter(self) -> str:
         """Returns current filter as string"""
@@ -219,7 +762,7 @@ class Data:
         Returns a list of all compressed files and their associated iso week tuple
         """
         rows = []
-        for fn in sorted(glob.glob(str(self.PATH / "*" / "*.tar.gz"))):
+        for fn in manifest.archive_filenames(self.PATH):
             iso_week = self.string_to_iso_week(Path(fn).name.split(".")[0])
 
             if self.iso_week and iso_week != self.iso_week:
@@ -236,29 +779,109 @@ class Data:
             rows.append((iso_week, fn))
         return rows
 
-    def iter_files(self) -> Generator[Tuple[IsoWeek, str, BinaryIO], None, None]:
+    def iter_files(
+            self,
+            streaming: bool = True,
+            prefetch: int = 0,
+    ) -> Generator[Tuple[IsoWeek, str, BinaryIO], None, None]:
         """
         Iterates through all csv files inside the compressed tars.
+
+        :param streaming: bool, if True, the members of each tar are read in archive order
+            within a single decompression pass. The yielded file-io is only readable
+            until the next tuple is requested.
+            If False, the members are yielded in alphabetical order which
+            requires to decompress the tar once for listing and again for extraction.
+        :param prefetch: int, if > 0, the files are decompressed in a background thread
+            while the current file is processed. Up to `prefetch` decompressed files
+            are kept in memory and the yielded file-io stays readable.
         :return: generates tuples of iso-week, id-name, binary file-io
         """
+        if prefetch > 0:
+            return _prefetch_files(self._iter_files(streaming), prefetch)
+        return self._iter_files(streaming)
+
+    def _iter_files(self, streaming: bool) -> Generator[Tuple[IsoWeek, str, BinaryIO], None, None]:
         for iso_week, tar_filename in self.compressed_files():
-            with tarfile.open(tar_filename) as tf:
-                for csv_name in sorted(tf.getnames()):
-                    id_name = csv_name.split(".")[0]
-                    if self.source_id_not and _string_filter(id_name, self.source_id_not):
-                        continue
-                    if self.source_id and not _string_filter(id_name, self.source_id):
-                        continue
+            # with the manifest, archives without accepted members are not opened
+            #   and the stream is not decompressed beyond the last accepted member
+            num_accepted = None
+            entry = manifest.week_entry(self.PATH, self.iso_week_to_string(iso_week))
+            if entry is not None:
+                num_accepted = sum(1 for m in entry["members"] if self._accept_name(m["name"]))
+                if not num_accepted:
+                    continue
+
+            if streaming:
+                with tarfile.open(tar_filename, "r|gz") as tf:
+                    for member in tf:
+                        id_name = self._accept_member(member)
+                        if id_name:
+                            fp = tf.extractfile(member)
+                            if fp:
+                                yield iso_week, id_name, fp
+                            if num_accepted is not None:
+                                num_accepted -= 1
+                                if not num_accepted:
+                                    break
+            else:
+                with tarfile.open(tar_filename) as tf:
+                    for member in sorted(tf.getmembers(), key=lambda m: m.name):
+                        id_name = self._accept_member(member)
+                        if id_name:
+                            fp = tf.extractfile(member)
+                            if fp:
+                                yield iso_week, id_name, fp
+
+    def sources(self) -> List[Tuple[IsoWeek, str]]:
+        """
+        Returns a list of iso-week and source id of all csv files inside the compressed tars,
+        in the same order as `iter_files()` with streaming=True.
 
-                    fp = tf.extractfile(csv_name)
-                    if fp:
-                        yield iso_week, id_name, fp
+        The manifest or the sidecar index of each tar is used if it exists,
+        see `src/manifest.py` and `src/archive_index.py`.
+        """
+        rows = []
+        for iso_week, tar_filename in self.compressed_files():
+            entry = manifest.week_entry(self.PATH, self.iso_week_to_string(iso_week))
+            index = archive_index.load_index(tar_filename) if entry is None else None
+            if entry is not None:
+                names = [m["name"] for m in entry["members"]]
+            elif index is not None:
+                names = list(index["members"])
+            else:
+                with tarfile.open(tar_filename, "r|gz") as tf:
+                    names = [member.name for member in tf if member.isfile()]
+
+            for name in names:
+                id_name = self._accept_name(name)
+                if id_name:
+                    rows.append((iso_week, id_name))
+        return rows
+
+    def _accept_member(self, member: tarfile.TarInfo) -> Optional[str]:
+        """
+        Returns the source id of the tar member if it passes the source filters
+        """
+        if not member.isfile():
+            return None
+        return self._accept_name(member.name)
+
+    def _accept_name(self, name: str) -> Optional[str]:
+        id_name = name.split(".")[0]
+        if self.source_id_not and _string_filter(id_name, self.source_id_not):
+            return None
+        if self.source_id and not _string_filter(id_name, self.source_id):
+            return None
+        return id_name
 
     def iter_tables(
             self,
             as_int: bool = True,
             as_datetime: bool = False,
             empty: Optional[str] = None,
+            streaming: bool = True,
+            prefetch: int = 0,
     ) -> Generator[Tuple[IsoWeek, str, List[str], List[List]], None, None]:
         """
         Iterate through all tables in the dataset.
@@ -266,9 +889,11 @@ class Data:
         :param as_int: bool, convert "1" and "" into 1 and 0
         :param as_datetime: bool, convert first column to datetime
         :param empty: str, optionally replace "" with another string, supersedes 'as_int'
+        :param streaming: bool, read each tar in archive order in a single pass, see iter_files()
+        :param prefetch: int, number of files to decompress ahead in a background thread, see iter_files()
         :return: generates tuples of (iso_week, source_id, list of columns, list of rows)
         """
-        for iso_week, id, fp in self.iter_files():
+        for iso_week, id, fp in self.iter_files(streaming=streaming, prefetch=prefetch):
             columns, rows = self._read_table(fp=fp, as_int=as_int, as_datetime=as_datetime, empty=empty)
             yield iso_week, id, columns, rows
 
@@ -277,6 +902,8 @@ class Data:
             as_int: bool = True,
             as_datetime: bool = False,
             empty: Optional[str] = None,
+            streaming: bool = True,
+            prefetch: int = 0,
     ) -> Generator[Tuple[IsoWeek, str, RowIter], None, None]:
         """
         Iterate through all tables in the dataset and return a
@@ -285,35 +912,323 @@ class Data:
         :param as_int: bool, convert "1" and "" into 1 and 0
         :param as_datetime: bool, convert first column to datetime
         :param empty: str, optionally replace "" with another string, supersedes 'as_int'
+        :param streaming: bool, read each tar in archive order in a single pass, see iter_files().
+            In streaming mode, each RowIter must be consumed before requesting the next one.
+        :param prefetch: int, number of files to decompress ahead in a background thread, see iter_files().
+            Each RowIter then stays readable.
         :return: generates tuples of (iso_week, source_id, RowIter)
         """
-        for iso_week, source_id, fp in self.iter_files():
+        for iso_week, source_id, fp in self.iter_files(streaming=streaming, prefetch=prefetch):
             row_iter = self.RowIter(fp=fp, as_int=as_int, as_datetime=as_datetime, empty=empty)
             yield iso_week, source_id, row_iter
 
     def iter_dataframes(
             self,
             as_datetime: bool = True,
+            streaming: bool = True,
+            dtype: str = "int64",
+            sparse: bool = False,
+            chunksize: Optional[int] = None,
     ) -> Generator[Tuple[IsoWeek, str, pd.DataFrame], None, None]:
-        for iso_week, id, columns, rows in self.iter_tables(as_int=True):
-            df = self._table_to_dataframe(columns, rows, as_datetime=as_datetime)
-            yield iso_week, id, df
+        """
+        Iterate through all tables in the dataset as DataFrames, see `get_dataframe`.
+
+        :param chunksize: int, if given, each table is yielded in DataFrames
+            of at most `chunksize` rows, read straight from the file. The peak memory
+            then does not depend on the size of the tables.
+        """
+        for iso_week, id, fp in self.iter_files(streaming=streaming):
+            row_iter = self.RowIter(fp)
+            if chunksize is None:
+                tables = [row_iter.read_matrix()]
+            else:
+                tables = row_iter.iter_matrices(chunksize)
+
+            for table in tables:
+                df = self._matrix_to_dataframe(table, as_datetime=as_datetime, dtype=dtype, sparse=sparse)
+                yield iso_week, id, df
+
+    def iter_long(
+            self,
+            location_id: StringFilter = None,
+            streaming: bool = True,
+    ) -> Generator[Tuple[IsoWeek, str, LongTable], None, None]:
+        """
+        Iterate through all tables in the dataset as long tables, see `get_long_table`.
+
+        :param location_id: optional filter for the locations
+        :param streaming: bool, read each tar in archive order in a single pass, see iter_files()
+        """
+        for iso_week, id, fp in self.iter_files(streaming=streaming):
+            yield iso_week, id, self._read_long_table(self.RowIter(fp, location_id=location_id))
+
+    def dataframe(
+            self,
+            location_id: StringFilter = None,
+            as_datetime: bool = True,
+            with_meta: bool = False,
+            dtype: str = "int64",
+            sparse: bool = False,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Returns all tables in the dataset as one DataFrame in the layout of `get_dataframe`.
+
+        The slot columns are the sorted union of the slots of all tables, slots that
+        do not exist in a table are 0. The slot axis and the number of rows are
+        determined first and the result is allocated once and filled table by table,
+        without concatenating intermediate frames.
+
+        The columns and row counts are taken from the compiled store or the manifest.
+        Tables without compiled store or sidecar index are decoded block by block while filling,
+        in one pass over their archive. Archives without a valid manifest entry are read
+        once more before, to plan from their csv headers and line counts.
+
+        :param location_id: optional filter for the locations
+        :param dtype: str, the numpy dtype of the cells, see `get_dataframe`
+        :param sparse: bool, if True, the columns are pandas.SparseDtype, see `get_dataframe`
+        :return: DataFrame or None if no rows exist
+        """
+        plan = self._plan_dataframe(location_id)
+        if not plan:
+            return None
+
+        all_slots = np.unique(np.concatenate([p["slots"] for p in plan]))
+        # upper bound if the locations are filtered while filling
+        num_rows = sum(p["num_rows"] for p in plan)
+
+        matrix = np.zeros((num_rows, all_slots.shape[0]), dtype=dtype)
+        dates = np.empty(num_rows, dtype="datetime64[s]")
+        source_ids = np.empty(num_rows, dtype=object)
+        location_ids = np.empty(num_rows, dtype=object)
+
+        row = 0
+        week_files = dict()
+        try:
+            for p in plan:
+                columns = np.searchsorted(all_slots, p["slots"])
+                for table in self._iter_planned_matrices(p, location_id, week_files):
+                    end = row + len(table)
+                    matrix[row:end, columns] = table.matrix
+                    dates[row:end] = strings_to_datetime64(table.dates)
+                    source_ids[row:end] = table.source_ids
+                    location_ids[row:end] = table.location_ids
+                    row = end
+        finally:
+            for files in week_files.values():
+                files.close()
+
+        if not row:
+            return None
+
+        table = TableMatrix(
+            source_ids=source_ids[:row],
+            location_ids=location_ids[:row],
+            dates=dates[:row],
+            slots=all_slots,
+            matrix=matrix[:row],
+        )
+        return self._matrix_to_dataframe(
+            table, as_datetime=as_datetime, with_meta=with_meta, dtype=dtype, sparse=sparse,
+        )
+
+    def _plan_dataframe(self, location_id: StringFilter) -> List[dict]:
+        """
+        Returns a dict for each table of the dataset with
+        iso_week, source_id, slots (datetime64), num_rows (upper bound)
+        and the compiled store if it exists.
+
+        The slots and row counts are taken from the manifest if it is valid.
+        Tables that are not readable by index are marked with "decode" and
+        read in one pass per archive, see `_iter_planned_matrices`. Only for tables
+        missing in the manifest, the csv header is read and the rows are counted
+        in a previous pass.
+        """
+        plan = []
+        unplanned = dict()
+        for iso_week, source_id in self.sources():
+            p = {"iso_week": iso_week, "source_id": source_id}
+
+            compiled = self.get_compiled(iso_week, source_id)
+            if compiled is not None:
+                row_mask = None
+                if location_id is not None:
+                    row_mask = compiled.location_mask(lambda loc: _string_filter(loc, location_id))
+                p.update(
+                    compiled=compiled, row_mask=row_mask, slots=slots_to_datetime64(compiled.slots),
+                    num_rows=compiled.num_rows if row_mask is None else int(row_mask.sum()),
+                )
+                plan.append(p)
+                continue
+
+            entry = manifest.week_entry(self.PATH, self.iso_week_to_string(iso_week))
+            if entry is not None:
+                member = next(m for m in entry["members"] if m["source_id"] == source_id)
+                if location_id is not None and not any(
+                        _string_filter(loc, location_id) for loc in member["locations"]
+                ):
+                    continue
+                p["num_rows"] = member["num_rows"]
+                if member.get("slots") is not None:
+                    p["slots"] = manifest.runs_to_slots(member["slots"])
+
+                if archive_index.load_index(self.tar_filename(iso_week)) is not None:
+                    if "slots" not in p:
+                        with self.open_file(iso_week, source_id) as fp:
+                            p["slots"] = slots_to_datetime64(self.RowIter(fp).slots)
+                    plan.append(p)
+                    continue
+
+            p["decode"] = True
+            plan.append(p)
+            if "slots" in p:
+                continue
+            unplanned[(iso_week, source_id)] = p
+
+        # read the headers of the remaining tables in one pass per archive
+        for iso_week in sorted(set(week for week, _ in unplanned)):
+            for _, source_id, fp in self._week_data(iso_week).iter_files():
+                p = unplanned.get((iso_week, source_id))
+                if p is None:
+                    continue
+                p["slots"] = slots_to_datetime64(self.RowIter(fp).slots)
+                if "num_rows" not in p:
+                    p["num_rows"] = _count_lines(fp)
+
+        return [p for p in plan if "slots" in p and p["num_rows"]]
+
+    def _iter_planned_matrices(
+            self,
+            p: dict,
+            location_id: StringFilter,
+            week_files: Dict[IsoWeek, Generator[Tuple[IsoWeek, str, BinaryIO], None, None]],
+    ) -> Generator[TableMatrix, None, None]:
+        """
+        Yields the rows of a planned table as TableMatrix blocks.
+
+        The tables marked with "decode" are read from one streaming pass per archive,
+        which is kept in `week_files` between the tables of the same week.
+        """
+        if "compiled" in p:
+            yield p["compiled"].to_matrix(p["row_mask"])
+        elif p.get("decode"):
+            files = week_files.get(p["iso_week"])
+            if files is None:
+                files = week_files[p["iso_week"]] = self._week_data(p["iso_week"]).iter_files()
+            for _, source_id, fp in files:
+                if source_id == p["source_id"]:
+                    yield from self._iter_blocks(self.RowIter(fp, location_id=location_id))
+                    break
+        else:
+            with self.open_file(p["iso_week"], p["source_id"]) as fp:
+                yield from self._iter_blocks(self.RowIter(fp, location_id=location_id))
 
     @classmethod
-    def _table_to_dataframe(cls, columns, rows, as_datetime: bool) -> pd.DataFrame:
-        df = pd.DataFrame(rows, columns=columns)
+    def _iter_blocks(cls, row_iter: "Data.RowIter") -> Generator[TableMatrix, None, None]:
+        while True:
+            table = row_iter._read_block()
+            if table is None:
+                break
+            yield table
+
+    def _week_data(self, iso_week: IsoWeek) -> "Data":
+        return self.__class__(source_id=self.source_id, source_id_not=self.source_id_not, iso_week=iso_week)
+
+    @classmethod
+    def _matrix_to_dataframe(
+            cls,
+            table: TableMatrix,
+            as_datetime: bool,
+            with_meta: bool = False,
+            dtype: str = "int64",
+            sparse: bool = False,
+    ) -> pd.DataFrame:
+        dates, slots = table.dates, table.slots
         if as_datetime:
-            df["date"] = pd.to_datetime(df["date"])
+            dates, slots = to_datetime_index(dates), to_datetime_index(slots, slots=True)
+        else:
+            if np.issubdtype(dates.dtype, np.datetime64):
+                dates = datetime64_to_strings(dates)
+            if np.issubdtype(slots.dtype, np.datetime64):
+                slots = datetime64_to_strings(slots)
+            slots = list(slots)
+
+        index = {
+            "date": dates,
+            "source_id": table.source_ids,
+            "location_id": table.location_ids,
+        }
+        if with_meta:
+            index["source_name"] = [cls.get_meta(source_id, "name") for source_id in table.source_ids.tolist()]
+            index["location_name"] = [
+                cls.get_meta(source_id, location_id, "name")
+                for source_id, location_id in zip(table.source_ids.tolist(), table.location_ids.tolist())
+            ]
+
+        index = pd.MultiIndex.from_arrays(list(index.values()), names=list(index.keys()))
+        values = table.matrix.astype(dtype, copy=False)
+
+        if sparse:
+            fill_value = values.dtype.type(0)
+            # contiguous columns
+            values = np.asfortranarray(values)
+            df = pd.DataFrame(
+                {i: pd.arrays.SparseArray(values[:, i], fill_value=fill_value) for i in range(values.shape[1])},
+                index=index,
+            )
+            df.columns = slots
+            return df
 
-        index_columns = ["date", "source_id", "location_id"]
-        if "source_name" in columns:
-            index_columns += ["source_name", "location_name"]
-        df.set_index(index_columns, inplace=True)
+        return pd.DataFrame(values, index=index, columns=slots)
+
+    @classmethod
+    def _compiled_to_table(
+            cls,
+            compiled: CompiledTable,
+            location_id: StringFilter = None,
+            as_int: bool = False,
+            as_datetime: bool = False,
+            empty: Optional[str] = None,
+            with_meta: bool = False,
+    ) -> Tuple[List, List[List]]:
+        row_mask = None
+        if location_id is not None:
+            row_mask = compiled.location_mask(lambda loc: _string_filter(loc, location_id))
+
+        matrix = compiled.unpacked_matrix(row_mask)
+        dates = compiled.dates if row_mask is None else compiled.dates[row_mask]
+        location_codes = compiled.location_codes if row_mask is None else compiled.location_codes[row_mask]
+        locations = compiled.locations.tolist()
 
         if as_datetime:
-            df.columns = pd.to_datetime(df.columns)
+            columns = ["date", "source_id", "location_id"] + compiled.slots.tolist()
+            dates = dates.tolist()
+        else:
+            columns = ["date", "source_id", "location_id"] + datetime64_to_strings(compiled.slots)
+            dates = datetime64_to_strings(dates)
+
+        if empty is not None:
+            values = np.where(matrix, "1", empty).tolist()
+        elif as_int:
+            values = matrix.astype(np.int64).tolist()
+        else:
+            values = np.where(matrix, "1", "").tolist()
+
+        meta = []
+        if with_meta:
+            columns = columns[:3] + ["source_name", "location_name"] + columns[3:]
+            meta = [
+                [cls.get_meta(compiled.source_id, "name"), cls.get_meta(compiled.source_id, loc, "name")]
+                for loc in locations
+            ]
 
-        return df
+        rows = []
+        for date, code, row_values in zip(dates, location_codes.tolist(), values):
+            row = [date, compiled.source_id, locations[code]]
+            if with_meta:
+                row += meta[code]
+            rows.append(row + row_values)
+
+        return columns, rows
 
     @classmethod
     def _read_table(
@@ -334,6 +1249,97 @@ class Data:
         return columns, rows
 
 
+def _read_location_table(task: Tuple[IsoWeek, str, StringFilter]) -> TableMatrix:
+    """
+    Reads the rows of the matching locations of a source in one week,
+    returns an empty table if the source does not exist in that week
+    """
+    iso_week, source_id, location_id = task
+    compiled = Data.get_compiled(iso_week, source_id)
+    if compiled is not None:
+        row_mask = compiled.location_mask(lambda loc: _string_filter(loc, location_id))
+        return compiled.to_matrix(row_mask)
+
+    tar_filename = Data.tar_filename(iso_week)
+    name = f"{source_id}.csv"
+    index = archive_index.load_index(tar_filename)
+    if index is not None:
+        if name not in index["members"]:
+            return TableMatrix.empty([])
+        with Data.open_file(iso_week, source_id) as fp:
+            return Data.RowIter(fp, location_id=location_id).read_matrix()
+
+    # decompress only up to the member
+    with tarfile.open(tar_filename, "r|gz") as tf:
+        for member in tf:
+            if member.name == name:
+                return Data.RowIter(tf.extractfile(member), location_id=location_id).read_matrix()
+    return TableMatrix.empty([])
+
+
+def _count_lines(fp: BinaryIO, block_size: int = 1 << 22) -> int:
+    """
+    Returns the number of remaining lines in the file,
+    an upper bound of the number of csv rows
+    """
+    count, last = 0, b"\n"
+    for block in iter(lambda: fp.read(block_size), b""):
+        count += block.count(b"\n")
+        last = block[-1:]
+    return count + (last != b"\n")
+
+
+def _prefetch_files(
+        files: Generator[Tuple[IsoWeek, str, BinaryIO], None, None],
+        size: int,
+) -> Generator[Tuple[IsoWeek, str, BinaryIO], None, None]:
+    """
+    Reads the files of the generator in a background thread into memory
+    and yields them from a queue of at most `size` files.
+
+    The decompression in the zlib module releases the GIL,
+    so it runs in parallel to the processing of the yielded files.
+    """
+    queue = Queue(maxsize=size)
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _read():
+        try:
+            for iso_week, id_name, fp in files:
+                with instrument.stage("raw.prefetch"):
+                    content = fp.read()
+                if not _put((iso_week, id_name, io.BytesIO(content))):
+                    break
+        except BaseException as e:
+            _put(e)
+        finally:
+            files.close()
+            _put(None)
+
+    thread = threading.Thread(target=_read, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
 class Metrics:
 
     PATH = Path(__file__).resolve().parent.parent / "metrics"
@@ -380,11 +1386,14 @@ class Metrics:
             as_int: bool = False,
             multiindex: bool = False,
             with_meta: bool = False,
+            columnar: bool = True,
     ) -> Optional[pd.DataFrame]:
         """
         Returns a pandas.DataFrame with all calculated metrics.
 
         The metrics can optionally be filtered by type, source_id, location_id and weeks.
+        The filters are applied while reading, only the matching weeks, types and
+        columns are parsed.
 
         :param type: optional filter, either wildcard string, or list of wildcard strings or
             a callable(str) returning bool
@@ -399,11 +1408,28 @@ class Metrics:
             if True: all numbers are int
             if False: numbers are float and unfilled numbers (where no snapshot data was
             available) is NaN.
+        :param columnar: bool, if True, read the columnar copy of each week's metrics
+            if it exists and is up-to-date (see `src.metrics_columnar`), which is much faster
+            than parsing the csv files.
         :return: pandas DataFrame
         """
+        if source_id or source_id_not or location_id or location_id_not:
+            def accept_location(column: str) -> bool:
+                ids = column.split("/")
+                return (
+                    (not source_id or _string_filter(ids[0], source_id))
+                    and (not source_id_not or not _string_filter(ids[0], source_id_not))
+                    and (not location_id or _string_filter(ids[1], location_id))
+                    and (not location_id_not or not _string_filter(ids[1], location_id_not))
+                )
+            usecols = lambda c: c == "date" or accept_location(c)
+        else:
+            accept_location = usecols = None
+
         dataframes_weeks = []
+        all_columnar = True
 
-        for filename in sorted(glob.glob(str(cls.PATH / "????" / "*.tar.gz"))):
+        for filename in manifest.archive_filenames(cls.PATH):
             week = Data.string_to_iso_week(Path(filename).name.split(".")[0])
             if iso_week and week != iso_week:
                 continue
@@ -416,6 +1442,27 @@ class Metrics:
             if iso_week_lte and not week <= iso_week_lte:
                 break
 
+            # with the manifest, skip the weeks without matching types or columns
+            entry = manifest.week_entry(cls.PATH, Data.iso_week_to_string(week))
+            if entry is not None:
+                if not any(_string_filter(name.split(".")[0], type) for name in entry["members"]):
+                    continue
+                if accept_location is not None and not any(accept_location(c) for c in entry["columns"]):
+                    dates = manifest.runs_to_dates(entry["dates"])
+                    if len(dates):
+                        dataframes_weeks.append(pd.DataFrame(index=dates.rename("date"), dtype=float))
+                    continue
+
+            if columnar:
+                df = metrics_columnar.read_columnar(
+                    filename, type=lambda t: _string_filter(t, type), location=accept_location,
+                )
+                if df is not None:
+                    if len(df):
+                        dataframes_weeks.append(df)
+                    continue
+            all_columnar = False
+
             dataframes = dict()
             with tarfile.open(filename) as tf:
                 for csv_name in tf.getnames():
@@ -424,36 +1471,33 @@ class Metrics:
                         continue
                     #print("reading", filename, week, type)
                     fp = tf.extractfile(csv_name)
-                    df = pd.read_csv(fp).set_index("date")
+                    df = pd.read_csv(fp, usecols=usecols).set_index("date")
                     #df.replace(np.nan, 0, inplace=True)
                     df.columns = [f"{c}/{type_name}" for c in df.columns]
                     dataframes[type_name] = df
 
             if dataframes:
                 df = pd.concat(dataframes.values(), axis=1)
+                df.index = to_datetime_index(df.index.values).rename("date")
                 dataframes_weeks.append(df)
 
         if not dataframes_weeks:
             return
 
-        df = pd.concat(dataframes_weeks)
-
-        if source_id:
-            df = df.loc[:, [c for c in df.columns if _string_filter(c.split("/")[0], source_id)]]
-        if source_id_not:
-            df = df.loc[:, [c for c in df.columns if not _string_filter(c.split("/")[0], source_id_not)]]
-        if location_id:
-            df = df.loc[:, [c for c in df.columns if _string_filter(c.split("/")[1], location_id)]]
-        if location_id_not:
-            df = df.loc[:, [c for c in df.columns if not _string_filter(c.split("/")[1], location_id_not)]]
+        if all_columnar:
+            df = metrics_columnar.concat_weeks(dataframes_weeks)
+        else:
+            df = pd.concat(dataframes_weeks)
 
         if as_int:
             df.replace(np.nan, 0, inplace=True)
             df = df.astype(int)
 
-        df.sort_index(inplace=True)
-        df.sort_index(inplace=True, axis=1)
-        df.index = pd.to_datetime(df.index)
+        if not df.index.is_monotonic_increasing:
+            df.sort_index(inplace=True)
+        if not df.columns.is_monotonic_increasing:
+            df.sort_index(inplace=True, axis=1)
+        df.index = to_datetime_index(df.index.values).rename("date")
 
         if multiindex:
             cols = [c.split("/") for c in df.columns]
@@ -485,11 +1529,50 @@ class Metrics:
 def _string_filter(s: str, f: StringFilter):
     if f is None:
         return True
+    return _compile_filter(f)(s)
+
+
+# compiled string filters by pattern or tuple of patterns
+_compiled_filters: Dict[Union[str, Tuple[str, ...]], Callable[[str], bool]] = dict()
+MAX_COMPILED_FILTERS = 1000
+
+
+def _compile_filter(f: StringFilter) -> Optional[Callable[[str], bool]]:
+    """
+    Compiles a filter into a single callable, or returns None for no filter.
+
+    Patterns without wildcards are looked up in a set, all others
+    are combined into one regular expression. Compiled filters are memoized.
+    """
+    if f is None:
+        return None
     if isinstance(f, str):
-        return fnmatch.fnmatchcase(s, f)
+        key = f
     elif isinstance(f, Sequence):
-        return any(fnmatch.fnmatchcase(s, x) for x in f)
+        key = tuple(f)
     elif callable(f):
-        return f(s)
+        return f
     else:
         raise TypeError(f"Invalid filter type '{type(f).__name__}'")
+
+    accept = _compiled_filters.get(key)
+    if accept is None:
+        if len(_compiled_filters) >= MAX_COMPILED_FILTERS:
+            _compiled_filters.clear()
+        accept = _compiled_filters[key] = _build_filter((key, ) if isinstance(key, str) else key)
+    return accept
+
+
+def _build_filter(patterns: Tuple[str, ...]) -> Callable[[str], bool]:
+    names = frozenset(p for p in patterns if not _WILDCARDS.search(p))
+    wildcards = [p for p in patterns if _WILDCARDS.search(p)]
+    if not wildcards:
+        return names.__contains__
+
+    match = re.compile("|".join(fnmatch.translate(p) for p in wildcards)).match
+    if not names:
+        return lambda s: match(s) is not None
+    return lambda s: s in names or match(s) is not None
+
+
+_WILDCARDS = re.compile(r"[*?\[]")
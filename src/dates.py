@@ -0,0 +1,126 @@
+import datetime
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+
+# memoized parsed strings, shared by all tables
+#   (snapshot timestamps repeat for each location, date columns for each source)
+_datetime_cache: Dict[str, datetime.datetime] = dict()
+_datetime64_cache: Dict[str, int] = dict()
+MAX_CACHE_SIZE = 1_000_000
+
+# the digit positions within "%Y-%m-%d %H:%M:%S"
+_DIGITS = np.array([0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18])
+_SEPARATORS = {4: b"-", 7: b"-", 10: b" ", 13: b":", 16: b":"}
+
+
+def string_to_datetime(s: str) -> datetime.datetime:
+    """
+    Converts a "%Y-%m-%d %H:%M:%S" string to datetime, memoized.
+    """
+    dt = _datetime_cache.get(s)
+    if dt is None:
+        if len(_datetime_cache) >= MAX_CACHE_SIZE:
+            _datetime_cache.clear()
+        dt = _datetime_cache[s] = datetime.datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
+    return dt
+
+
+def strings_to_datetime64(strings: Union[Sequence[str], np.ndarray]) -> np.ndarray:
+    """
+    Converts a sequence of "%Y-%m-%d %H:%M:%S" strings to a datetime64[s] array.
+
+    The digits are extracted at their fixed offsets for all strings at once.
+
+    :raises ValueError: if any string does not match the format
+    """
+    if isinstance(strings, np.ndarray) and np.issubdtype(strings.dtype, np.datetime64):
+        return strings.astype("datetime64[s]")
+
+    try:
+        raw = np.array(strings, dtype="S").reshape(-1)
+    except UnicodeEncodeError:
+        raise ValueError("Invalid datetime strings, expected '%Y-%m-%d %H:%M:%S'")
+    if not raw.shape[0]:
+        return np.array([], dtype="datetime64[s]")
+    if raw.dtype.itemsize != 19:
+        raise ValueError("Invalid datetime strings, expected '%Y-%m-%d %H:%M:%S'")
+
+    chars = raw.view(np.uint8).reshape(-1, 19)
+    digits = chars[:, _DIGITS].astype(np.int64) - ord("0")
+    if (
+            (digits < 0).any() or (digits > 9).any()
+            or any((chars[:, pos] != ord(sep)).any() for pos, sep in _SEPARATORS.items())
+            or (np.char.str_len(raw) != 19).any()
+    ):
+        raise ValueError("Invalid datetime strings, expected '%Y-%m-%d %H:%M:%S'")
+
+    def _number(start: int, length: int) -> np.ndarray:
+        n = digits[:, start]
+        for i in range(1, length):
+            n = n * 10 + digits[:, start + i]
+        return n
+
+    year, month, day = _number(0, 4), _number(4, 2), _number(6, 2)
+    hour, minute, second = _number(8, 2), _number(10, 2), _number(12, 2)
+
+    month_start = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+    days_in_month = ((month_start + 1).astype("datetime64[D]") - month_start.astype("datetime64[D]")).astype(np.int64)
+    if (
+            (month < 1).any() or (month > 12).any() or (day < 1).any() or (day > days_in_month).any()
+            or (hour > 23).any() or (minute > 59).any() or (second > 59).any()
+    ):
+        raise ValueError("Invalid datetime strings, values out of range")
+
+    return (
+        month_start.astype("datetime64[D]").astype("datetime64[s]")
+        + ((day - 1) * 86400 + hour * 3600 + minute * 60 + second).astype("timedelta64[s]")
+    )
+
+
+def slots_to_datetime64(strings: Sequence[str]) -> np.ndarray:
+    """
+    Converts the date column headers to a datetime64[s] array.
+
+    Same as `strings_to_datetime64` but memoizes each string, as the
+    sources of a week mostly share the same date columns.
+    """
+    if isinstance(strings, np.ndarray) and np.issubdtype(strings.dtype, np.datetime64):
+        return strings.astype("datetime64[s]")
+
+    strings = [str(s) for s in strings]
+    missing = [s for s in strings if s not in _datetime64_cache]
+    if missing:
+        if len(_datetime64_cache) + len(missing) >= MAX_CACHE_SIZE:
+            _datetime64_cache.clear()
+        for s, value in zip(missing, strings_to_datetime64(missing).astype(np.int64).tolist()):
+            _datetime64_cache[s] = value
+
+    return np.array([_datetime64_cache[s] for s in strings], dtype=np.int64).astype("datetime64[s]")
+
+
+def datetime64_to_strings(dates: np.ndarray) -> List[str]:
+    return [
+        s.replace("T", " ")
+        for s in np.datetime_as_string(dates, unit="s").tolist()
+    ]
+
+
+def to_datetime_index(strings: Union[Sequence[str], np.ndarray], slots: bool = False) -> pd.DatetimeIndex:
+    """
+    Converts "%Y-%m-%d %H:%M:%S" strings (or datetime64 values) to a pandas.DatetimeIndex.
+
+    Falls back to `pandas.to_datetime` for other formats.
+    The index has nanosecond resolution like the one of `pandas.to_datetime`,
+    current pandas would otherwise keep the seconds of the datetime64[s] values.
+
+    :param slots: bool, if True, memoize each string, see `slots_to_datetime64`
+    """
+    try:
+        if slots:
+            return pd.DatetimeIndex(slots_to_datetime64(strings).astype("datetime64[ns]"))
+        return pd.DatetimeIndex(strings_to_datetime64(strings).astype("datetime64[ns]"))
+    except ValueError:
+        return pd.DatetimeIndex(pd.to_datetime(strings))
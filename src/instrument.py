@@ -0,0 +1,221 @@
+"""
+Timing and memory instrumentation of the processing stages.
+
+The stages in `Data`, `calc_metrics` and ``prepare_release.py`` are wrapped in
+
+    with instrument.stage("raw.parse", rows=..., cells=...):
+        ...
+
+which does nothing unless a `Recorder` is active:
+
+    with instrument.recording() as recorder:
+        ...
+    print(recorder.summary())
+
+For each stage the number of calls, the wall time, the cpu time of the calling thread,
+the rows and cells processed, the peak RSS of the process (0 on Windows) and, if `tracemalloc`
+is tracing, the peak of traced memory within the stage are recorded.
+
+Nested recordings (e.g. one for each week within one for the whole run)
+all receive the stages.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Union, List, Dict, Generator
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+STAGE_FIELDS = ("calls", "wall", "cpu", "rows", "cells", "peak_rss", "peak_traced")
+
+# the active recorders
+_recorders: List["Recorder"] = []
+# per thread stack of the peak traced memory of the running stages
+_local = threading.local()
+
+
+class Recorder:
+    """
+    Collects the values of each stage.
+
+    :param trace_memory: bool, if True, `tracemalloc` is started while recording
+        to measure the peak memory of each stage. This slows down the processing
+        considerably.
+    """
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, dict] = dict()
+        self.started = time.time()
+        self.wall = 0.
+        self._lock = threading.Lock()
+
+    def add(self, name: str, **values):
+        """
+        Adds the values to the stage, `peak_rss` and `peak_traced` are maximized
+        """
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {field: 0 for field in STAGE_FIELDS}
+            for key, value in values.items():
+                if key.startswith("peak_"):
+                    stage[key] = max(stage[key], value)
+                else:
+                    stage[key] += value
+
+    def merge(self, report: dict):
+        """
+        Adds all stages of a report, e.g. from another process
+        """
+        for name, values in report["stages"].items():
+            self.add(name, **values)
+
+    def to_dict(self) -> dict:
+        return {
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "wall": self.wall or time.time() - self.started,
+            "peak_rss": _peak_rss(),
+            "stages": {name: dict(values) for name, values in sorted(self.stages.items())},
+        }
+
+    def save(self, filename: Union[str, Path]):
+        filename = Path(filename)
+        os.makedirs(filename.parent, exist_ok=True)
+        with open(filename, "w") as fp:
+            json.dump(self.to_dict(), fp, indent=1)
+
+    def dataframe(self) -> pd.DataFrame:
+        """
+        Returns the stages as DataFrame with the memory in megabytes
+        and the rows and cells per second of wall time
+        """
+        df = pd.DataFrame(self.stages).T.reindex(columns=STAGE_FIELDS)
+        df.index.rename("stage", inplace=True)
+        for key in ("peak_rss", "peak_traced"):
+            df[key] = (df[key] / 2 ** 20).round(1)
+        wall = df["wall"].where(df["wall"] > 0)
+        df["rows/s"] = (df["rows"] / wall).round()
+        df["cells/s"] = (df["cells"] / wall).round()
+        return df
+
+    def summary(self) -> str:
+        return self.dataframe().to_markdown()
+
+
+@contextmanager
+def recording(
+        filename: Optional[Union[str, Path]] = None,
+        trace_memory: bool = False,
+) -> Generator[Recorder, None, None]:
+    """
+    Activates a new Recorder for the duration of the context
+    and stores its report as json if `filename` is given.
+    """
+    recorder = Recorder(trace_memory=trace_memory)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorders.remove(recorder)
+        recorder.wall = time.time() - recorder.started
+        if started_tracing:
+            tracemalloc.stop()
+        if filename is not None:
+            recorder.save(filename)
+
+
+@contextmanager
+def stage(name: str, rows: int = 0, cells: int = 0) -> Generator[None, None, None]:
+    """
+    Records the time and memory of the enclosed code as stage `name`
+    in all active recorders.
+    """
+    if not _recorders:
+        yield
+        return
+
+    tracing = tracemalloc.is_tracing()
+    peaks = _peak_stack()
+    if tracing:
+        # the parent stage keeps the peak before this stage resets it
+        if peaks:
+            peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    peaks.append(0)
+
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        values = {
+            "calls": 1,
+            "wall": time.perf_counter() - wall,
+            "cpu": time.thread_time() - cpu,
+            "rows": rows,
+            "cells": cells,
+            "peak_rss": _peak_rss(),
+        }
+        peak = peaks.pop()
+        if tracing:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            values["peak_traced"] = peak
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+
+        for recorder in list(_recorders):
+            recorder.add(name, **values)
+
+
+def count(name: str, rows: int = 0, cells: int = 0):
+    """
+    Adds processed rows and cells to a stage, e.g. when they are
+    only known after the stage has finished
+    """
+    for recorder in list(_recorders):
+        recorder.add(name, rows=rows, cells=cells)
+
+
+def merge(report: dict):
+    """
+    Adds the stages of a report, e.g. from another process, to all active recorders
+    """
+    for recorder in list(_recorders):
+        recorder.merge(report)
+
+
+def is_recording() -> bool:
+    return bool(_recorders)
+
+
+def _peak_stack() -> List[int]:
+    if not hasattr(_local, "peaks"):
+        _local.peaks = []
+    return _local.peaks
+
+
+def _peak_rss() -> int:
+    """
+    Peak resident set size of the process in bytes,
+    or 0 where the `resource` module is not available (Windows)
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, linux kilobytes
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,140 @@
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from src.matrix import TableMatrix
+from src.dates import strings_to_datetime64, slots_to_datetime64
+
+
+class LongTable:
+    """
+    The free dates of a raw table in long format, one record per free cell.
+
+    The source and location ids are stored as codes into
+    the ``source_ids`` and ``location_ids`` arrays.
+
+    :param dates: datetime64[s] array, the snapshot timestamp of each record
+    :param slots: datetime64[s] array, the free date of each record
+    :param source_codes: int32 array, index into ``source_ids`` for each record
+    :param source_ids: unicode array of the source ids
+    :param location_codes: int32 array, index into ``location_ids`` for each record
+    :param location_ids: unicode array of the location ids
+    """
+    def __init__(
+            self,
+            dates: np.ndarray,
+            slots: np.ndarray,
+            source_codes: np.ndarray,
+            source_ids: np.ndarray,
+            location_codes: np.ndarray,
+            location_ids: np.ndarray,
+    ):
+        self.dates = dates
+        self.slots = slots
+        self.source_codes = source_codes
+        self.source_ids = source_ids
+        self.location_codes = location_codes
+        self.location_ids = location_ids
+
+    def __len__(self) -> int:
+        return self.dates.shape[0]
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(records={len(self)}, sources={len(self.source_ids)}"
+            f", locations={len(self.location_ids)})"
+        )
+
+    @classmethod
+    def empty(cls) -> "LongTable":
+        return cls(
+            dates=np.array([], dtype="datetime64[s]"),
+            slots=np.array([], dtype="datetime64[s]"),
+            source_codes=np.array([], dtype=np.int32),
+            source_ids=np.array([], dtype=str),
+            location_codes=np.array([], dtype=np.int32),
+            location_ids=np.array([], dtype=str),
+        )
+
+    @classmethod
+    def from_matrix(cls, table: TableMatrix) -> "LongTable":
+        """
+        Create from the free cells of a TableMatrix
+        """
+        rows, columns = np.nonzero(table.matrix)
+        source_ids, source_codes = np.unique(table.source_ids.astype(str), return_inverse=True)
+        location_ids, location_codes = np.unique(table.location_ids.astype(str), return_inverse=True)
+        return cls(
+            dates=strings_to_datetime64(table.dates)[rows],
+            slots=slots_to_datetime64(table.slots)[columns],
+            source_codes=source_codes.reshape(-1).astype(np.int32)[rows],
+            source_ids=source_ids,
+            location_codes=location_codes.reshape(-1).astype(np.int32)[rows],
+            location_ids=location_ids,
+        )
+
+    @classmethod
+    def concat(cls, tables: Sequence["LongTable"]) -> "LongTable":
+        """
+        Concatenates the records and merges the id arrays
+        """
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+
+        source_ids, source_codes = _merge_codes([(t.source_ids, t.source_codes) for t in tables])
+        location_ids, location_codes = _merge_codes([(t.location_ids, t.location_codes) for t in tables])
+        return cls(
+            dates=np.concatenate([t.dates for t in tables]),
+            slots=np.concatenate([t.slots for t in tables]),
+            source_codes=source_codes,
+            source_ids=source_ids,
+            location_codes=location_codes,
+            location_ids=location_ids,
+        )
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Returns a DataFrame with the columns date, source_id, location_id (both categorical) and slot
+        """
+        return pd.DataFrame({
+            "date": self.dates,
+            "source_id": pd.Categorical.from_codes(self.source_codes, self.source_ids),
+            "location_id": pd.Categorical.from_codes(self.location_codes, self.location_ids),
+            "slot": self.slots,
+        })
+
+    def to_arrow(self) -> "pyarrow.Table":
+        """
+        Returns a pyarrow.Table with dictionary encoded ids, requires the `pyarrow` package
+        """
+        if pyarrow is None:
+            raise ImportError("LongTable.to_arrow() requires the pyarrow package")
+        return pyarrow.table({
+            "date": pyarrow.array(self.dates.astype(np.int64)).cast(pyarrow.timestamp("s")),
+            "source_id": pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(self.source_codes), pyarrow.array(self.source_ids.tolist(), pyarrow.string()),
+            ),
+            "location_id": pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(self.location_codes), pyarrow.array(self.location_ids.tolist(), pyarrow.string()),
+            ),
+            "slot": pyarrow.array(self.slots.astype(np.int64)).cast(pyarrow.timestamp("s")),
+        })
+
+
+def _merge_codes(pairs: Sequence[tuple]) -> tuple:
+    """
+    Merges (ids, codes) pairs into the union of ids and the concatenated, re-mapped codes
+    """
+    all_ids = np.unique(np.concatenate([ids.astype(str) for ids, codes in pairs]))
+    return all_ids, np.concatenate([
+        np.searchsorted(all_ids, ids.astype(str)).astype(np.int32)[codes]
+        for ids, codes in pairs
+    ])
@@ -0,0 +1,293 @@
+"""
+Manifest of the weekly archives of a data directory.
+
+``raw/manifest.json`` and ``metrics/manifest.json`` list each ``YYYY/YYYY-WW.tar.gz``
+with the fingerprint of the archive (see `src.archive_index.fingerprint`)
+and a description of its members, so that queries can be planned
+without opening any archive.
+
+Raw archives:
+
+    {"weeks": {"YYYY-WW": {
+        "filename": "YYYY/YYYY-WW.tar.gz",
+        "fingerprint": "...",
+        "members": [
+            {
+                "name": "source_id.csv", "source_id": "...",
+                "num_rows": 123, "num_snapshots": 12,
+                "min_date": "...", "max_date": "...",
+                "num_slots": 1234, "min_slot": "...", "max_slot": "...",
+                "slots": [["YYYY-MM-DD HH:MM:SS", step_seconds, count], ...],
+                "locations": ["location_id", ...]
+            },
+            ...
+        ]
+    }}}
+
+The members are listed in archive order. The ``slots`` are the date columns
+in csv order, stored as runs of equal steps, see `slots_to_runs`.
+
+Metrics archives:
+
+    {"weeks": {"YYYY-WW": {
+        "filename": "YYYY/YYYY-WW.tar.gz",
+        "fingerprint": "...",
+        "members": ["changed.csv", ...],
+        "columns": ["source_id/location_id", ...],
+        "dates": [["YYYY-MM-DD HH:MM:SS", count], ...]
+    }}}
+
+The ``columns`` and ``dates`` are the union of all members. The dates are stored
+as runs of consecutive 15-minute buckets.
+
+Both manifests also contain the ``"version"`` of their format, all entries are
+rebuilt when it changes.
+
+Both manifests are updated by ``prepare_release.py``. The archives themselves
+are always found by globbing the directory, the manifest only caches the
+description of each week. Archives that are missing in the manifest or have
+changed since are simply read without it.
+"""
+import io
+import os
+import csv
+import json
+import glob
+import tarfile
+from pathlib import Path
+from typing import Optional, Union, Callable, Dict, List, Tuple, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.archive_index import fingerprint
+from src.dates import to_datetime_index, datetime64_to_strings, slots_to_datetime64
+
+
+MANIFEST_FILENAME = "manifest.json"
+
+# increase whenever the entries change, older manifests are rebuilt by `update_manifest`
+MANIFEST_VERSION = 2
+
+BUCKET_SECONDS = 15 * 60
+
+# loaded manifests by filename: (mtime, manifest)
+_manifest_cache: Dict[str, Tuple[float, dict]] = dict()
+
+
+def manifest_filename(path: Union[str, Path]) -> Path:
+    return Path(path) / MANIFEST_FILENAME
+
+
+def load_manifest(path: Union[str, Path]) -> Optional[dict]:
+    """
+    Returns the manifest of the data directory or None if it does not exist.
+
+    The parsed file is cached until it is modified.
+    """
+    filename = manifest_filename(path)
+    try:
+        mtime = os.stat(filename).st_mtime
+    except FileNotFoundError:
+        return None
+
+    cached = _manifest_cache.get(str(filename))
+    if cached is None or cached[0] != mtime:
+        with open(filename) as fp:
+            cached = _manifest_cache[str(filename)] = (mtime, json.load(fp))
+    return cached[1]
+
+
+def week_entry(path: Union[str, Path], week: str) -> Optional[dict]:
+    """
+    Returns the manifest entry of the week ("YYYY-WW")
+    if it exists and matches the current archive.
+    """
+    manifest = load_manifest(path)
+    if manifest is None:
+        return None
+    entry = manifest["weeks"].get(week)
+    if entry is None:
+        return None
+    try:
+        if entry["fingerprint"] != fingerprint(Path(path) / entry["filename"]):
+            return None
+    except FileNotFoundError:
+        return None
+    return entry
+
+
+def archive_filenames(path: Union[str, Path]) -> List[str]:
+    """
+    Returns the sorted filenames of all weekly archives in the data directory.
+
+    The directory is always globbed, so archives added after the manifest
+    was built are found as well, see `week_entry`.
+    """
+    return sorted(glob.glob(str(Path(path) / "????" / "*.tar.gz")))
+
+
+def update_manifest(
+        path: Union[str, Path],
+        build_entry: Callable[[Path], dict],
+        force_recalc: bool = False,
+) -> dict:
+    """
+    Creates or updates the manifest of all weekly archives in the data directory.
+
+    Entries of unchanged archives are kept.
+
+    :param build_entry: callable(tar_filename) returning the entry,
+        either `build_raw_entry` or `build_metrics_entry`
+    :return: dict, the manifest
+    """
+    path = Path(path)
+    previous = (None if force_recalc else load_manifest(path)) or {"weeks": dict()}
+    if previous.get("version") != MANIFEST_VERSION:
+        previous = {"weeks": dict()}
+
+    weeks = dict()
+    for tar_filename in sorted(path.glob("????/*.tar.gz")):
+        week = tar_filename.name.split(".")[0]
+        entry = previous["weeks"].get(week)
+        if entry is None or entry["fingerprint"] != fingerprint(tar_filename):
+            print(f"updating manifest of {tar_filename}")
+            entry = {
+                "filename": f"{tar_filename.parent.name}/{tar_filename.name}",
+                "fingerprint": fingerprint(tar_filename),
+                **build_entry(tar_filename),
+            }
+        weeks[week] = entry
+
+    manifest = {"version": MANIFEST_VERSION, "weeks": weeks}
+    if manifest != previous:
+        filename = manifest_filename(path)
+        tmp_filename = filename.parent / f"{filename.name}.tmp"
+        with open(tmp_filename, "w") as fp:
+            json.dump(manifest, fp, indent=1)
+        os.replace(tmp_filename, filename)
+    return manifest
+
+
+def build_raw_entry(tar_filename: Union[str, Path]) -> dict:
+    """
+    Describes the csv files of a raw archive in a single decompression pass.
+    """
+    from src.data import Data
+
+    members = []
+    with tarfile.open(tar_filename, "r|gz") as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            table = Data.RowIter(tf.extractfile(member)).read_matrix()
+            dates = np.unique(table.dates.astype(str))
+            slots = np.unique(np.asarray(table.slots).astype(str))
+            members.append({
+                "name": member.name,
+                "source_id": member.name.split(".")[0],
+                "num_rows": len(table),
+                "num_snapshots": int(dates.shape[0]),
+                "min_date": str(dates[0]) if dates.shape[0] else None,
+                "max_date": str(dates[-1]) if dates.shape[0] else None,
+                "num_slots": len(table.slots),
+                "min_slot": str(slots[0]) if slots.shape[0] else None,
+                "max_slot": str(slots[-1]) if slots.shape[0] else None,
+                "slots": slots_to_runs(table.slots),
+                "locations": sorted(set(table.location_ids.astype(str).tolist())),
+            })
+    return {"members": members}
+
+
+def build_metrics_entry(tar_filename: Union[str, Path]) -> dict:
+    """
+    Describes the csv files of a metrics archive.
+    """
+    members = []
+    columns = set()
+    dates = set()
+    with tarfile.open(tar_filename, "r|gz") as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            members.append(member.name)
+            fp = io.BytesIO(tf.extractfile(member).read())
+            columns.update(next(csv.reader([fp.readline().decode("utf-8")]))[1:])
+            fp.seek(0)
+            dates.update(pd.read_csv(fp, usecols=["date"])["date"].tolist())
+
+    return {
+        "members": members,
+        "columns": sorted(columns),
+        "dates": dates_to_runs(to_datetime_index(sorted(dates)).values),
+    }
+
+
+def dates_to_runs(dates: np.ndarray) -> List[list]:
+    """
+    Compresses sorted dates into runs of consecutive 15-minute buckets.
+
+    :param dates: datetime64 array
+    :return: list of [first date as string, number of buckets]
+    """
+    seconds = dates.astype("datetime64[s]").astype(np.int64)
+    if not seconds.shape[0]:
+        return []
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(seconds) != BUCKET_SECONDS) + 1])
+    counts = np.diff(np.concatenate([starts, [seconds.shape[0]]]))
+    return [
+        [date, count]
+        for date, count in zip(datetime64_to_strings(dates[starts].astype("datetime64[s]")), counts.tolist())
+    ]
+
+
+def runs_to_dates(runs: List[list]) -> pd.DatetimeIndex:
+    """
+    Reverse of `dates_to_runs`
+    """
+    if not runs:
+        return pd.DatetimeIndex([])
+    starts = to_datetime_index([r[0] for r in runs]).values.astype("datetime64[s]")
+    return pd.DatetimeIndex(np.concatenate([
+        start + np.arange(count) * np.timedelta64(BUCKET_SECONDS, "s")
+        for start, (_, count) in zip(starts, runs)
+    ]).astype("datetime64[ns]"))
+
+
+def slots_to_runs(slots: Sequence[str]) -> Optional[List[list]]:
+    """
+    Compresses the date columns of a table into runs of equal steps, keeping their order.
+
+    :param slots: sequence of "%Y-%m-%d %H:%M:%S" strings
+    :return: list of [first slot as string, step in seconds, number of slots],
+        or None if the slots are not in that format
+    """
+    try:
+        dates = slots_to_datetime64(slots)
+    except ValueError:
+        return None
+    seconds = dates.astype(np.int64).tolist()
+    runs = []
+    start = 0
+    while start < len(seconds):
+        end = start + 1
+        step = seconds[end] - seconds[start] if end < len(seconds) else 0
+        while end < len(seconds) and seconds[end] - seconds[end - 1] == step:
+            end += 1
+        runs.append([start, step, end - start])
+        start = end
+    strings = datetime64_to_strings(dates[[r[0] for r in runs]])
+    return [[string, step, count] for string, (_, step, count) in zip(strings, runs)]
+
+
+def runs_to_slots(runs: List[list]) -> np.ndarray:
+    """
+    Reverse of `slots_to_runs`, returns a datetime64[s] array
+    """
+    if not runs:
+        return np.array([], dtype="datetime64[s]")
+    starts = slots_to_datetime64([r[0] for r in runs])
+    return np.concatenate([
+        start + np.arange(count) * np.timedelta64(step, "s")
+        for start, (_, step, count) in zip(starts, runs)
+    ])
@@ -0,0 +1,173 @@
+from typing import Optional, Union, Sequence, Callable
+
+import numpy as np
+
+from src.dates import strings_to_datetime64, slots_to_datetime64
+
+
+_NEWLINE, _CR, _COMMA, _ONE = (ord(c) for c in "\n\r,1")
+
+
+class TableMatrix:
+    """
+    A raw csv table (or a part of it) as numpy arrays.
+
+    :param source_ids: array of source id for each row
+    :param location_ids: array of location id for each row
+    :param dates: array of snapshot timestamps for each row,
+        either as "%Y-%m-%d %H:%M:%S" strings or as datetime64
+    :param slots: array of the date column headers,
+        either as "%Y-%m-%d %H:%M:%S" strings or as datetime64
+    :param matrix: bool array of shape (rows, slots), True for free dates
+    """
+    def __init__(
+            self,
+            source_ids: np.ndarray,
+            location_ids: np.ndarray,
+            dates: np.ndarray,
+            slots: np.ndarray,
+            matrix: np.ndarray,
+    ):
+        self.source_ids = source_ids
+        self.location_ids = location_ids
+        self.dates = dates
+        self.slots = slots
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @classmethod
+    def empty(cls, slots: Union[np.ndarray, Sequence]) -> "TableMatrix":
+        return cls(
+            source_ids=np.array([], dtype=object),
+            location_ids=np.array([], dtype=object),
+            dates=np.array([], dtype=object),
+            slots=np.asarray(slots),
+            matrix=np.zeros((0, len(slots)), dtype=bool),
+        )
+
+    @classmethod
+    def concat(cls, tables: Sequence["TableMatrix"]) -> "TableMatrix":
+        """
+        Concatenates the rows of tables with equal slots
+        """
+        if len(tables) == 1:
+            return tables[0]
+        return cls(
+            source_ids=np.concatenate([t.source_ids for t in tables]),
+            location_ids=np.concatenate([t.location_ids for t in tables]),
+            dates=np.concatenate([t.dates for t in tables]),
+            slots=tables[0].slots,
+            matrix=np.concatenate([t.matrix for t in tables]),
+        )
+
+    @classmethod
+    def concat_aligned(cls, tables: Sequence["TableMatrix"]) -> "TableMatrix":
+        """
+        Concatenates the rows of tables with different slots.
+
+        The slots of the result are the sorted union of all slots as datetime64,
+        slots that are missing in a table are not free.
+        """
+        slots = [slots_to_datetime64(t.slots) for t in tables]
+        all_slots = np.unique(np.concatenate(slots)) if slots else np.array([], dtype="datetime64[s]")
+
+        matrix = np.zeros((sum(len(t) for t in tables), all_slots.shape[0]), dtype=bool)
+        row = 0
+        for table, table_slots in zip(tables, slots):
+            matrix[row:row + len(table), np.searchsorted(all_slots, table_slots)] = table.matrix
+            row += len(table)
+
+        return cls(
+            source_ids=np.concatenate([t.source_ids for t in tables]) if tables else np.array([], dtype=object),
+            location_ids=np.concatenate([t.location_ids for t in tables]) if tables else np.array([], dtype=object),
+            dates=(
+                np.concatenate([strings_to_datetime64(t.dates) for t in tables])
+                if tables else np.array([], dtype="datetime64[s]")
+            ),
+            slots=all_slots,
+            matrix=matrix,
+        )
+
+    def select(self, rows: Union[np.ndarray, slice]) -> "TableMatrix":
+        """
+        Returns a table with only the selected rows
+
+        :param rows: bool mask, index array or slice
+        """
+        return self.__class__(
+            source_ids=self.source_ids[rows],
+            location_ids=self.location_ids[rows],
+            dates=self.dates[rows],
+            slots=self.slots,
+            matrix=self.matrix[rows],
+        )
+
+    def location_mask(self, accept: Callable[[str], bool]) -> Optional[np.ndarray]:
+        """
+        Returns a bool array of all rows whose location id is accepted
+        by the ``accept`` callable, or None if all are accepted.
+
+        The callable is evaluated once per distinct location.
+        """
+        locations, inverse = np.unique(self.location_ids.astype(str), return_inverse=True)
+        accepted = np.array([bool(accept(loc)) for loc in locations.tolist()], dtype=bool)
+        if accepted.all():
+            return None
+        return accepted[inverse.reshape(-1)]
+
+
+def parse_block(block: bytes, slots: Sequence) -> Optional[TableMatrix]:
+    """
+    Parses complete csv lines of the raw data format into a TableMatrix
+    without creating python objects for each cell.
+
+    The date columns must only contain "1" or nothing. Quoted values are not
+    supported. If the block does not fit the expected layout, None is returned
+    and the caller needs to fall back to the csv module.
+
+    :param block: bytes, one or more complete lines, the last one terminated by a newline
+    :param slots: the date column headers
+    """
+    num_slots = len(slots)
+    num_columns = num_slots + 3
+    if num_slots < 1 or not block.endswith(b"\n") or b'"' in block:
+        return None
+
+    buf = np.frombuffer(block, dtype=np.uint8)
+    line_ends = np.flatnonzero(buf == _NEWLINE)
+    line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+    num_rows = line_ends.shape[0]
+
+    # each line must contain exactly num_columns - 1 commas
+    commas = np.flatnonzero(buf == _COMMA)
+    if commas.shape[0] != num_rows * (num_columns - 1):
+        return None
+    if not np.array_equal(np.searchsorted(commas, line_starts), np.arange(num_rows) * (num_columns - 1)):
+        return None
+    commas = commas.reshape(num_rows, num_columns - 1)
+
+    # a date cell is free if it starts with a '1'
+    matrix = buf[commas[:, 2:] + 1] == _ONE
+
+    # the length of each line's date cells must match the number of '1's,
+    #   otherwise some cell contains something else
+    has_cr = buf[line_ends - 1] == _CR
+    if not np.array_equal(
+            line_ends - commas[:, 2] - 1,
+            num_slots - 1 + matrix.sum(axis=1) + has_cr,
+    ):
+        return None
+
+    field_ends = commas[:, :3]
+
+    starts = line_starts.tolist()
+    ends = field_ends.tolist()
+    return TableMatrix(
+        dates=np.array([block[s:e[0]].decode("utf-8") for s, e in zip(starts, ends)], dtype=object),
+        source_ids=np.array([block[e[0] + 1:e[1]].decode("utf-8") for e in ends], dtype=object),
+        location_ids=np.array([block[e[1] + 1:e[2]].decode("utf-8") for e in ends], dtype=object),
+        slots=np.asarray(slots),
+        matrix=matrix,
+    )
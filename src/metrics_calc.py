@@ -1,7 +1,13 @@
+import itertools
+import contextlib
 from functools import partial
+from multiprocessing import Pool
+from typing import Iterable, Any
 from tqdm import tqdm
 
 from src.data import *
+from src import instrument, archive_index
+from src.metrics_state import LocationState, SlotBitsets
 
 
 METRIC_TIMESPANS = (
@@ -99,144 +105,846 @@ class TimespanChecker:
         return days == day
 
 
+# functions to quantize seconds since epoch into hours, days and (monday-based) weeks
+#   for each timespan family, in order of METRIC_TIMESPANS
+_TIMESPAN_UNITS = (
+    lambda s: s // 3600,
+    lambda s: s // 86400,
+    lambda s: (s // 86400 - (s // 86400 + 3) % 7) // 7,
+)
+_TIMESPAN_VALUES = 5
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class TimespanTable:
+    """
+    Precomputed timespan classes of the date columns of one table.
+
+    For each (15-minute) snapshot bucket, the classes of all dates are calculated
+    once as int8 array of shape (3, dates), one row for the hour, day and week
+    timespans, containing the index into METRIC_TIMESPANS or -1.
+
+    Gives the same results as the TimespanChecker.
+
+    :param dates: the date column headers
+    """
+    def __init__(self, dates: Sequence[str]):
+        self.dates = list(dates)
+        try:
+            seconds = slots_to_datetime64(self.dates)
+        except ValueError:
+            seconds = np.array([to_datetime(d) for d in self.dates], dtype="datetime64[s]")
+        self.seconds = seconds.astype(np.int64)
+        self.date_units = np.stack([func(self.seconds) for func in _TIMESPAN_UNITS]).reshape(
+            len(_TIMESPAN_UNITS), len(self.dates)
+        )
+        self._offsets = (np.arange(len(_TIMESPAN_UNITS)) * _TIMESPAN_VALUES).reshape(-1, 1)
+        self._classes = dict()
+
+    @classmethod
+    def to_bucket(cls, d: datetime.datetime) -> int:
+        """
+        Returns the seconds since epoch of the datetime
+        """
+        return (d - _EPOCH) // datetime.timedelta(seconds=1)
+
+    def classes(self, bucket: int) -> np.ndarray:
+        """
+        Returns the timespan classes of all dates for the snapshot bucket
+
+        :param bucket: int, seconds since epoch
+        :return: int8 array of shape (3, dates)
+        """
+        classes = self._classes.get(bucket)
+        if classes is None:
+            units = np.array([func(bucket) for func in _TIMESPAN_UNITS]).reshape(-1, 1)
+            distance = self.date_units - units
+            classes = np.where(
+                (distance >= 0) & (distance < _TIMESPAN_VALUES),
+                distance + self._offsets,
+                -1,
+            ).astype(np.int8)
+            self._classes[bucket] = classes
+        return classes
+
+    def timespans(self, bucket: int, index: int) -> List[str]:
+        """
+        Returns the timespans of the date at `index` for the snapshot bucket
+        """
+        return [METRIC_TIMESPANS[c] for c in self.classes(bucket)[:, index].tolist() if c >= 0]
+
+    def count_row(self, bucket: int, row: Sequence) -> np.ndarray:
+        """
+        Count the free dates of one snapshot per timespan
+
+        :param bucket: int, seconds since epoch
+        :param row: sequence of free (1) / not-free (0) flags
+        :return: int array of shape (len(METRIC_TIMESPANS), )
+        """
+        classes = self.classes(bucket)[:, np.asarray(row, dtype=bool)]
+        return np.bincount(classes[classes >= 0], minlength=len(METRIC_TIMESPANS))
+
+    def count(self, buckets: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        """
+        Count the free dates of each snapshot per timespan
+
+        :param buckets: int64 array, seconds since epoch of each snapshot
+        :param matrix: bool array of shape (snapshots, dates)
+        :return: int array of shape (snapshots, len(METRIC_TIMESPANS))
+        """
+        num_rows = matrix.shape[0]
+        unique_buckets, inverse = np.unique(buckets, return_inverse=True)
+        classes = np.stack([
+            self.classes(b) for b in unique_buckets.tolist()
+        ]).reshape(len(unique_buckets), len(_TIMESPAN_UNITS), len(self.dates))
+
+        row_index = np.broadcast_to(np.arange(num_rows).reshape(-1, 1), matrix.shape)
+        counts = np.zeros(num_rows * len(METRIC_TIMESPANS), dtype=np.int64)
+        for family in range(len(_TIMESPAN_UNITS)):
+            family_classes = classes[:, family][inverse.reshape(-1)]
+            mask = matrix & (family_classes >= 0)
+            counts += np.bincount(
+                row_index[mask] * len(METRIC_TIMESPANS) + family_classes[mask],
+                minlength=counts.shape[0],
+            )
+        return counts.reshape(num_rows, len(METRIC_TIMESPANS))
+
+
+METRIC_NAMES = (
+    "changed",
+    "appointments",
+    "cancellations",
+    "free_dates",
+    *(f"free_dates_{ts}" for ts in METRIC_TIMESPANS),
+    *(f"appointments_{ts}" for ts in METRIC_TIMESPANS),
+    *(f"cancellations_{ts}" for ts in METRIC_TIMESPANS),
+)
+
+METRIC_ENGINES = ("python", "numpy")
+
+# increase whenever a change to the calculation changes the results,
+#   stored metrics of a different version are recalculated by prepare_release.py
+METRICS_VERSION = 1
+
+# number of rows of the chunks in which the raw tables are streamed
+#   through the python engine and the table summaries
+TABLE_CHUNKSIZE = 10_000
+
+# (timestamps, loc_ids, values) of each snapshot of a table,
+#   values has one column for each entry in METRIC_NAMES
+MetricRecords = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class TableSummary:
+    """
+    The weekly summary values of one raw table, accumulated from consecutive
+    blocks of rows (TableMatrix) so that the whole table is never needed at once.
+
+    A change is a snapshot of a location whose free dates differ from the
+    previous snapshot of the same location.
+    """
+    def __init__(self):
+        self.locations = set()
+        self.dates = set()
+        self.num_changes = 0
+        # the last row of each location
+        self._last_rows: Dict[str, np.ndarray] = dict()
+
+    @classmethod
+    def from_table(cls, table: TableMatrix) -> dict:
+        summary = cls()
+        summary.add(table)
+        return summary.to_dict()
+
+    def add(self, table: TableMatrix):
+        if not len(table):
+            return
+
+        dates = table.dates
+        if np.issubdtype(dates.dtype, np.datetime64):
+            dates = datetime64_to_strings(dates)
+        self.dates.update(np.unique(np.asarray(dates).astype(str)).tolist())
+
+        location_ids, location_index = np.unique(table.location_ids.astype(str), return_inverse=True)
+        location_index = location_index.reshape(-1)
+        self.locations.update(location_ids.tolist())
+
+        # rows of each location in consecutive order
+        order = np.argsort(location_index, kind="stable")
+        matrix, location_index = table.matrix[order], location_index[order]
+        same_location = location_index[1:] == location_index[:-1]
+        self.num_changes += int(((matrix[1:] != matrix[:-1]).any(axis=1) & same_location).sum())
+
+        # compare the first row of each location with the last row of the previous block
+        firsts = np.flatnonzero(np.concatenate([[True], ~same_location]))
+        lasts = np.concatenate([firsts[1:] - 1, [len(table) - 1]])
+        for location_id, first, last in zip(location_ids[location_index[firsts]].tolist(), firsts, lasts):
+            last_row = self._last_rows.get(location_id)
+            if last_row is not None and not np.array_equal(last_row, matrix[first]):
+                self.num_changes += 1
+            self._last_rows[location_id] = matrix[last]
+
+    def to_dict(self) -> dict:
+        return {
+            "num_locations": len(self.locations),
+            "num_snapshots": len(self.dates),
+            "num_changes": self.num_changes,
+            "min_date": min(self.dates) if self.dates else None,
+            "max_date": max(self.dates) if self.dates else None,
+        }
+
+
 def calc_metrics(
         data: Data,
-        stash: Optional[dict] = None
+        stash: Optional[dict] = None,
+        engine: str = "python",
+        processes: int = 1,
+        prefetch: int = 0,
+        table_summaries: Optional[Dict[Tuple[IsoWeek, str], dict]] = None,
 ) -> Dict[str, pd.DataFrame]:
+    """
+    Calculate the metrics of all tables in the dataset.
+
+    :param data: Data instance
+    :param stash: optional dict that keeps the state of each location
+        between consecutive calls (e.g. for consecutive weeks)
+    :param engine: str, "python" steps through each row and date,
+        "numpy" processes all snapshots of a location as a matrix.
+        Both engines produce the same results.
+    :param processes: int, if > 1, the sources of each week with a valid archive index
+        are calculated in parallel processes. The results are the same as with one process.
+    :param prefetch: int, number of tables to decompress ahead in a background thread,
+        see `Data.iter_files`. Only used if `processes` is 1.
+    :param table_summaries: optional dict that receives the `TableSummary` values
+        of each (iso_week, source_id) from the same decoded tables
+    """
+    if engine not in METRIC_ENGINES:
+        raise ValueError(f"Invalid engine '{engine}', expected one of {METRIC_ENGINES}")
 
     print(f"calculating metrics for {data}")
 
     if stash is None:
         stash = dict()
 
-    cur_free_dates = stash.get("free_dates") or dict()
-    cur_appointed_dates = stash.get("appointed_dates") or dict()
-    previous_timestamps = stash.get("previous_timestamps") or dict()
+    locations = stash.get("locations") or dict()
     previous_rows = stash.get("previous_rows") or dict()
 
-    metrics = {
-        "changed": dict(),
-        "appointments": dict(),
-        "cancellations": dict(),
-        "free_dates": dict(),
-        **{
-            f"free_dates_{ts}": dict()
-            for ts in METRIC_TIMESPANS
-        },
-        **{
-            f"appointments_{ts}": dict()
-            for ts in METRIC_TIMESPANS
-        },
-        **{
-            f"cancellations_{ts}": dict()
-            for ts in METRIC_TIMESPANS
-        },
+    metrics = {name: dict() for name in METRIC_NAMES}
+    records = []
+
+    if processes > 1:
+        _calc_tables_parallel(
+            data, engine, metrics, records, locations, previous_rows, processes, table_summaries,
+        )
+    else:
+        for week, source_id, row_iter in tqdm(data.iter_tables_iter(prefetch=prefetch)):
+            summary = _calc_table(
+                engine, source_id, row_iter, metrics, records, locations, previous_rows,
+                with_summary=table_summaries is not None,
+            )
+            if table_summaries is not None:
+                table_summaries[(week, source_id)] = summary
+
+    stash["locations"] = locations
+
+    with instrument.stage("metrics.dataframes"):
+        if engine == "numpy" and any(len(r[2]) for r in records):
+            return _records_to_dataframes(records)
+
+        for name, buckets in metrics.items():
+            df = pd.DataFrame(buckets).T
+            df.index = pd.to_datetime(df.index)
+            df.index.rename("date", inplace=True)
+            # avoid storing floats and NaNs, convert to str(int) or empty string
+            df = df.apply(lambda d: d.astype(str).apply(lambda v: v.split(".")[0])).replace("nan", "")
+            metrics[name] = df
+
+    return metrics
+
+
+def _calc_table(
+        engine: str,
+        source_id: str,
+        row_iter: Data.RowIter,
+        metrics: Dict[str, dict],
+        records: List[MetricRecords],
+        locations: Dict[str, LocationState],
+        previous_rows: Dict[str, list],
+        with_summary: bool = False,
+) -> Optional[dict]:
+    """
+    Calculates the metrics of one raw table and, if `with_summary`,
+    returns its `TableSummary` values from the same decoded rows.
+
+    The numpy engine needs all snapshots of a location at once and reads the whole table,
+    the python engine steps through chunks of `TABLE_CHUNKSIZE` rows.
+    """
+    summary = TableSummary() if with_summary else None
+
+    def add_summary(table: TableMatrix):
+        if summary is not None:
+            with instrument.stage("summary.table", rows=len(table), cells=table.matrix.size):
+                summary.add(table)
+
+    if engine == "numpy":
+        table = row_iter.read_matrix()
+        add_summary(table)
+        with instrument.stage("metrics.numpy", rows=len(table), cells=table.matrix.size):
+            records.append(_calc_table_numpy(
+                source_id, row_iter.slots, table,
+                locations, previous_rows,
+            ))
+    else:
+        def iter_rows():
+            for table in row_iter.iter_matrices(TABLE_CHUNKSIZE):
+                add_summary(table)
+                instrument.count("metrics.python", rows=len(table), cells=table.matrix.size)
+                yield from _table_rows(table)
+
+        with instrument.stage("metrics.python"):
+            _calc_table_python(
+                source_id, row_iter.slots, iter_rows(), metrics,
+                locations, previous_rows,
+            )
+
+    return summary.to_dict() if summary is not None else None
+
+
+def _calc_tables_parallel(
+        data: Data,
+        engine: str,
+        metrics: Dict[str, dict],
+        records: List[MetricRecords],
+        locations: Dict[str, LocationState],
+        previous_rows: Dict[str, list],
+        processes: int,
+        table_summaries: Optional[Dict[Tuple[IsoWeek, str], dict]] = None,
+):
+    """
+    Calculates the sources of each week in a process pool.
+
+    Each process gets the states of the source's locations and the results
+    are merged in the order of `Data.iter_files()`, so the buckets are
+    the same as in the sequential calculation.
+
+    Each process opens its table by the sidecar index of the archive.
+    Weeks without a valid index are calculated sequentially from one
+    streaming pass, instead of decompressing the archive up to each member.
+    """
+    with Pool(processes) as pool:
+        for iso_week, sources in itertools.groupby(data.sources(), key=lambda s: s[0]):
+            source_ids = [source_id for _, source_id in sources]
+            if not archive_index.is_index_valid(Data.tar_filename(iso_week)):
+                week_data = Data(iso_week=iso_week, source_id=source_ids)
+                for _, source_id, row_iter in tqdm(week_data.iter_tables_iter()):
+                    summary = _calc_table(
+                        engine, source_id, row_iter, metrics, records, locations, previous_rows,
+                        with_summary=table_summaries is not None,
+                    )
+                    if table_summaries is not None:
+                        table_summaries[(iso_week, source_id)] = summary
+                continue
+
+            tasks = [
+                (
+                    iso_week, source_id, engine,
+                    _select_source(locations, source_id),
+                    _select_source(previous_rows, source_id),
+                    table_summaries is not None,
+                    instrument.is_recording(),
+                )
+                for source_id in source_ids
+            ]
+            results = pool.imap(_calc_table_process, tasks)
+            for task, result in tqdm(zip(tasks, results), total=len(tasks)):
+                table_metrics, table_records, table_locations, table_previous_rows, summary, report = result
+                if table_summaries is not None:
+                    table_summaries[(iso_week, task[1])] = summary
+                if report is not None:
+                    instrument.merge(report)
+                with instrument.stage("metrics.merge"):
+                    _merge_buckets(metrics, table_metrics)
+                records.extend(table_records)
+                locations.update(table_locations)
+                previous_rows.update(table_previous_rows)
+
+
+def _calc_table_process(args):
+    iso_week, source_id, engine, locations, previous_rows, with_summary, with_report = args
+    metrics = {name: dict() for name in METRIC_NAMES}
+    records = []
+    with instrument.recording() if with_report else contextlib.nullcontext() as recorder:
+        with Data.open_file(iso_week, source_id) as fp:
+            summary = _calc_table(
+                engine, source_id, Data.RowIter(fp), metrics, records, locations, previous_rows,
+                with_summary=with_summary,
+            )
+    report = recorder.to_dict() if recorder is not None else None
+    return metrics, records, locations, previous_rows, summary, report
+
+
+def _select_source(mapping: Dict[str, Any], source_id: str) -> Dict[str, Any]:
+    """
+    Returns the entries of a loc_id mapping that belong to the source
+    """
+    prefix = f"{source_id}/"
+    return {
+        loc_id: value
+        for loc_id, value in mapping.items()
+        if loc_id.startswith(prefix)
     }
 
-    for week, source_id, row_iter in tqdm(data.iter_tables_iter()):
-        columns = row_iter.columns
-        dates = columns[3:]
-        # dates_dt = [to_datetime(d) for d in dates]
-        timespan_checker = TimespanChecker()
-
-        for org_row in tqdm(row_iter, desc=f"stepping through {source_id} rows"):# {rows[0][0][:10]} to {rows[-1][0][:10]}"):
-            timestamp = org_row[0]
-            timestamp_dt = to_datetime(timestamp)
-            # bucket into exact 15 minute steps
-            timestamp_dt = timestamp_dt.replace(minute=timestamp_dt.minute // 15 * 15, second=0, microsecond=0)
-            timestamp = str(timestamp_dt)
-
-            loc_id = f"{source_id}/{org_row[2]}"
-            date_row = org_row[3:]
-
-            # record appointments/cancellations only between snapshots
-            #   that are at most 16 minutes apart
-            if loc_id not in previous_timestamps:
-                do_calc_booking = False
+
+def _merge_buckets(metrics: Dict[str, dict], table_metrics: Dict[str, dict]):
+    for name, table_buckets in table_metrics.items():
+        buckets = metrics[name]
+        for timestamp, values in table_buckets.items():
+            if timestamp not in buckets:
+                buckets[timestamp] = dict()
+            for loc_id, value in values.items():
+                buckets[timestamp][loc_id] = buckets[timestamp].get(loc_id, 0) + value
+
+
+def calc_state(
+        data: Data,
+        stash: Optional[dict] = None,
+        prefetch: int = 0,
+) -> dict:
+    """
+    Update the location states in the stash like `calc_metrics` does,
+    without calculating the metrics, which is a lot faster.
+
+    :param data: Data instance
+    :param stash: optional dict, see `calc_metrics`
+    :param prefetch: int, see `calc_metrics`
+    :return: the stash
+    """
+    print(f"calculating state for {data}")
+
+    if stash is None:
+        stash = dict()
+
+    locations = stash.get("locations") or dict()
+
+    for week, source_id, row_iter in tqdm(data.iter_tables_iter(prefetch=prefetch)):
+        _calc_table_state(source_id, row_iter, locations)
+
+    stash["locations"] = locations
+    return stash
+
+
+def _calc_table_python(
+        source_id: str,
+        dates: List[str],
+        rows: Iterable[list],
+        metrics: Dict[str, dict],
+        locations: Dict[str, LocationState],
+        previous_rows: Dict[str, list],
+):
+    # dates_dt = [to_datetime(d) for d in dates]
+    with instrument.stage("metrics.timespans"):
+        timespan_table = TimespanTable(dates)
+    # the integer slot axis of the bitsets
+    slots, slot_index = np.unique(timespan_table.seconds, return_inverse=True)
+    slot_index = slot_index.reshape(-1).tolist()
+    slot_bits = [1 << i for i in slot_index]
+    bitsets: Dict[str, SlotBitsets] = dict()
+
+    for org_row in tqdm(rows, desc=f"stepping through {source_id} rows"):# {rows[0][0][:10]} to {rows[-1][0][:10]}"):
+        timestamp = org_row[0]
+        timestamp_dt = to_datetime(timestamp)
+        # bucket into exact 15 minute steps
+        timestamp_dt = timestamp_dt.replace(minute=timestamp_dt.minute // 15 * 15, second=0, microsecond=0)
+        timestamp = str(timestamp_dt)
+        bucket = timespan_table.to_bucket(timestamp_dt)
+
+        loc_id = f"{source_id}/{org_row[2]}"
+        date_row = org_row[3:]
+
+        if loc_id not in locations:
+            locations[loc_id] = LocationState()
+        state = locations[loc_id]
+        if loc_id not in bitsets:
+            bitsets[loc_id] = SlotBitsets(state, slots)
+        bits = bitsets[loc_id]
+
+        # record appointments/cancellations only between snapshots
+        #   that are at most 16 minutes apart
+        if state.timestamp is None:
+            do_calc_booking = False
+        else:
+            do_calc_booking = bucket - state.timestamp < 16 * 60
+        state.timestamp = bucket
+
+        # gather these values for current date-row
+        num_appointments = 0
+        num_cancellations = 0
+        num_free_dates = 0
+        num_free_dates_ts = dict(zip(METRIC_TIMESPANS, timespan_table.count_row(bucket, date_row).tolist()))
+        num_appointments_ts = dict()
+        num_cancellations_ts = dict()
+
+        for i, v in enumerate(date_row):
+            bit = slot_bits[i]
+
+            if v:
+                bits.free |= bit
+                num_free_dates += 1
+
+                if bits.appointed & bit:
+                    bits.appointed ^= bit
+                    if do_calc_booking:
+                        num_cancellations += 1
+                        num_cancellations_ts = {
+                            ts: num_cancellations_ts.get(ts, 0) + 1
+                            for ts in timespan_table.timespans(bucket, i)
+                        }
             else:
-                diff = timestamp_dt - previous_timestamps[loc_id]
-                do_calc_booking = diff.total_seconds() < 16 * 60
-            previous_timestamps[loc_id] = timestamp_dt
-
-            if loc_id not in cur_free_dates:
-                cur_free_dates[loc_id] = set()
-            if loc_id not in cur_appointed_dates:
-                cur_appointed_dates[loc_id] = set()
-
-            # gather these values for current date-row
-            num_appointments = 0
-            num_cancellations = 0
-            num_free_dates = 0
-            num_free_dates_ts = timespan_checker.test_row(timestamp, dates, date_row)
-            num_appointments_ts = dict()
-            num_cancellations_ts = dict()
-
-            for i, v in enumerate(date_row):
-                date = dates[i]
-
-                if v:
-                    cur_free_dates[loc_id].add(date)
-                    num_free_dates += 1
-
-                    if date in cur_appointed_dates[loc_id]:
-                        cur_appointed_dates[loc_id].remove(date)
-                        if do_calc_booking:
-                            num_cancellations += 1
-                            num_cancellations_ts = {
-                                ts: num_cancellations_ts.get(ts, 0) + v
-                                for ts, v in timespan_checker.test_date(timestamp, date).items()
+                if bits.free & bit:
+                    # do not count the first "appointed" date
+                    #   because it might just have disappeared in time
+                    if do_calc_booking:
+                        if not bits.is_boundary(slot_index[i]):
+                            num_appointments += 1
+                            num_appointments_ts = {
+                                ts: num_appointments_ts.get(ts, 0) + 1
+                                for ts in timespan_table.timespans(bucket, i)
                             }
-                else:
-                    if date in cur_free_dates[loc_id]:
-                        # do not count the first "appointed" date
-                        #   because it might just have disappeared in time
-                        if do_calc_booking:
-                            if date != min(*cur_free_dates[loc_id]) and date != max(*cur_free_dates[loc_id]):
-                                num_appointments += 1
-                                num_appointments_ts = {
-                                    ts: num_appointments_ts.get(ts, 0) + v
-                                    for ts, v in timespan_checker.test_date(timestamp, date).items()
-                                }
-
-                        cur_free_dates[loc_id].remove(date)
-                        cur_appointed_dates[loc_id].add(date)
-
-            # 0: date-row similar, 1: date-row changed
-            row_changed = 0
-            if previous_rows.get(loc_id):
-                if date_row != previous_rows[loc_id]:
-                    row_changed = 1
-            previous_rows[loc_id] = date_row
-
-            for buckets, value in (
-                    (metrics["changed"], row_changed),
-                    (metrics["appointments"], num_appointments),
-                    (metrics["cancellations"], num_cancellations),
-                    (metrics["free_dates"], num_free_dates),
-            ) + tuple(
-                    (metrics[f"free_dates_{ts}"], num_free_dates_ts.get(ts, 0))
-                    for ts in METRIC_TIMESPANS
-            ) + tuple(
-                (metrics[f"appointments_{ts}"], num_appointments_ts.get(ts, 0))
-                for ts in METRIC_TIMESPANS
-            ) + tuple(
-                (metrics[f"cancellations_{ts}"], num_appointments_ts.get(ts, 0))
-                for ts in METRIC_TIMESPANS
-            ):
-                if timestamp not in buckets:
-                    buckets[timestamp] = dict()
-                buckets[timestamp][loc_id] = buckets[timestamp].get(loc_id, 0) + value
 
-    stash["free_dates"] = cur_free_dates
-    stash["appointed_dates"] = cur_appointed_dates
-    stash["previous_timestamps"] = previous_timestamps
-
-    for name, buckets in metrics.items():
-        df = pd.DataFrame(buckets).T
-        df.index = pd.to_datetime(df.index)
-        df.index.rename("date", inplace=True)
-        # avoid storing floats and NaNs, convert to str(int) or empty string
-        df = df.apply(lambda d: d.astype(str).apply(lambda v: v.split(".")[0])).replace("nan", "")
-        metrics[name] = df
+                    bits.free ^= bit
+                    bits.appointed |= bit
+
+        # 0: date-row similar, 1: date-row changed
+        row_changed = 0
+        if previous_rows.get(loc_id):
+            if date_row != previous_rows[loc_id]:
+                row_changed = 1
+        previous_rows[loc_id] = date_row
+
+        for buckets, value in (
+                (metrics["changed"], row_changed),
+                (metrics["appointments"], num_appointments),
+                (metrics["cancellations"], num_cancellations),
+                (metrics["free_dates"], num_free_dates),
+        ) + tuple(
+                (metrics[f"free_dates_{ts}"], num_free_dates_ts.get(ts, 0))
+                for ts in METRIC_TIMESPANS
+        ) + tuple(
+            (metrics[f"appointments_{ts}"], num_appointments_ts.get(ts, 0))
+            for ts in METRIC_TIMESPANS
+        ) + tuple(
+            (metrics[f"cancellations_{ts}"], num_appointments_ts.get(ts, 0))
+            for ts in METRIC_TIMESPANS
+        ):
+            if timestamp not in buckets:
+                buckets[timestamp] = dict()
+            buckets[timestamp][loc_id] = buckets[timestamp].get(loc_id, 0) + value
+
+    for loc_id, bits in bitsets.items():
+        bits.store(locations[loc_id], slots)
+
+
+def _calc_table_numpy(
+        source_id: str,
+        dates: List[str],
+        table: TableMatrix,
+        locations: Dict[str, LocationState],
+        previous_rows: Dict[str, list],
+) -> MetricRecords:
+    """
+    Same as `_calc_table_python` but processes all snapshots of
+    each location as a boolean matrix of shape (snapshots, dates)
+    and returns the values of each snapshot instead of adding them to the buckets.
+
+    Falls back to the python engine if the timestamps can not be parsed
+    vectorized or the date columns are not strictly increasing.
+    """
+    parsed = _parse_table(table, dates)
+    if parsed is None:
+        metrics = {name: dict() for name in METRIC_NAMES}
+        _calc_table_python(
+            source_id, dates, _table_rows(table), metrics,
+            locations, previous_rows,
+        )
+        return _buckets_to_records(metrics)
+
+    buckets, slots = parsed
+    unique_buckets, bucket_index = np.unique(buckets, return_inverse=True)
+    bucket_strings = np.array(datetime64_to_strings(unique_buckets.astype("datetime64[s]")), dtype=object)
+
+    with instrument.stage("metrics.timespans"):
+        timespan_table = TimespanTable(dates)
+
+    values = np.zeros((len(table), len(METRIC_NAMES)), dtype=np.int64)
+
+    row_loc_ids, location_rows = _group_locations(source_id, table)
+    for loc_id, rows in location_rows:
+        values[rows] = _calc_location_numpy(
+            loc_id=loc_id,
+            slots=slots,
+            timespan_table=timespan_table,
+            buckets=buckets[rows],
+            matrix=table.matrix[rows],
+            state=locations.setdefault(loc_id, LocationState()),
+            previous_rows=previous_rows,
+        )
+
+    return (
+        bucket_strings[bucket_index.reshape(-1)],
+        row_loc_ids,
+        values,
+    )
+
+
+def _calc_table_state(
+        source_id: str,
+        row_iter: Data.RowIter,
+        locations: Dict[str, LocationState],
+):
+    """
+    Updates the location states like `_calc_table_numpy` but without calculating the metrics.
+
+    Only the last snapshot and the union of all previous snapshots
+    of each location are needed for that.
+    """
+    dates = row_iter.slots
+    table = row_iter.read_matrix()
+
+    parsed = _parse_table(table, dates)
+    if parsed is None:
+        _calc_table_python(
+            source_id, dates, _table_rows(table), {name: dict() for name in METRIC_NAMES},
+            locations, dict(),
+        )
+        return
+
+    buckets, slots = parsed
+    for loc_id, rows in _group_locations(source_id, table)[1]:
+        state = locations.setdefault(loc_id, LocationState())
+        free_0, appointed_0, other_free_dates = state.split(slots)
+        matrix = table.matrix[rows]
+        was_free = matrix[:-1].any(axis=0)
+        appointed = ~matrix[-1] & (was_free | free_0 | appointed_0)
+        state.timestamp = int(buckets[rows[-1]])
+        state.update(slots, matrix[-1], appointed, other_free_dates)
+
+
+def _parse_table(table: TableMatrix, dates: List[str]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Returns the 15-minute bucket of each snapshot and the dates, both as int64 seconds since epoch,
+    or None if the timestamps can not be parsed vectorized or the dates are not strictly increasing.
+    """
+    try:
+        timestamps = strings_to_datetime64([d[:19] for d in table.dates.tolist()]).astype(np.int64)
+        slots = slots_to_datetime64(dates).astype(np.int64)
+    except ValueError:
+        return None
+
+    if (np.diff(slots) <= 0).any():
+        return None
+
+    # bucket into exact 15 minute steps
+    return timestamps - timestamps % 900, slots
+
+
+def _table_rows(table: TableMatrix) -> Generator[list, None, None]:
+    """
+    Yields the rows of the table like the Data.RowIter with as_int=True
+    """
+    yield from (
+        [date, source_id, location_id] + values
+        for date, source_id, location_id, values in zip(
+            table.dates.tolist(), table.source_ids.tolist(), table.location_ids.tolist(),
+            table.matrix.view(np.uint8).tolist(),
+        )
+    )
+
+
+def _group_locations(
+        source_id: str,
+        table: TableMatrix,
+) -> Tuple[np.ndarray, List[Tuple[str, np.ndarray]]]:
+    """
+    Returns the loc_id ("source_id/location_id") of each row
+    and a list of (loc_id, row indices) for each location.
+    """
+    location_names, location_codes = np.unique(table.location_ids.astype(str), return_inverse=True)
+    location_codes = location_codes.reshape(-1)
+    loc_ids = np.array([f"{source_id}/{loc}" for loc in location_names.tolist()], dtype=object)
+
+    order = np.argsort(location_codes, kind="stable")
+    splits = np.cumsum(np.bincount(location_codes, minlength=len(location_names)))[:-1]
+    location_rows = [
+        (loc_ids[code], rows)
+        for code, rows in enumerate(np.split(order, splits))
+        if len(rows)
+    ]
+    return loc_ids[location_codes], location_rows
+
+
+def _calc_location_numpy(
+        loc_id: str,
+        slots: np.ndarray,
+        timespan_table: TimespanTable,
+        buckets: np.ndarray,
+        matrix: np.ndarray,
+        state: LocationState,
+        previous_rows: Dict[str, list],
+) -> np.ndarray:
+    """
+    Calculates the metric values of all snapshots of one location
+    and updates the location's state.
+
+    :param slots: sorted int64 array, the dates in seconds since epoch
+    :param buckets: int64 array, the 15-minute bucket of each snapshot in seconds since epoch
+    :param matrix: bool array of shape (snapshots, dates)
+    :return: int64 array of shape (snapshots, len(METRIC_NAMES))
+    """
+    num_rows, num_dates = matrix.shape
+    values = np.zeros((num_rows, len(METRIC_NAMES)), dtype=np.int64)
+
+    # state of the table's dates before the first snapshot
+    #   and the free dates that are not part of this table
+    free_0, appointed_0, other_free_dates = state.split(slots)
+
+    # record appointments/cancellations only between snapshots
+    #   that are at most 16 minutes apart
+    do_calc_booking = np.ones(num_rows, dtype=bool)
+    do_calc_booking[1:] = buckets[1:] - buckets[:-1] < 16 * 60
+    if state.timestamp is not None:
+        do_calc_booking[0] = buckets[0] - state.timestamp < 16 * 60
+    else:
+        do_calc_booking[0] = False
+
+    # free state before each snapshot
+    prev_free = np.empty_like(matrix)
+    prev_free[:1] = free_0
+    prev_free[1:] = matrix[:-1]
+
+    # a date is appointed after a snapshot if it's not free
+    #   but has been free or appointed before
+    was_free = np.zeros_like(matrix)
+    was_free[1:] = np.logical_or.accumulate(matrix[:-1], axis=0)
+    appointed = ~matrix & (was_free | free_0 | appointed_0)
+    prev_appointed = np.empty_like(matrix)
+    prev_appointed[:1] = appointed_0
+    prev_appointed[1:] = appointed[:-1]
+
+    # cancellations and free_dates
+    values[:, 2] = (matrix & prev_appointed).sum(axis=1) * do_calc_booking
+    values[:, 3] = matrix.sum(axis=1)
+
+    # free dates per timespan
+    values[:, 4:4 + len(METRIC_TIMESPANS)] = timespan_table.count(buckets, matrix)
+
+    # dates that have been free and are not anymore
+    candidates = ~matrix & prev_free
+    candidates[~do_calc_booking] = False
+    candidate_rows = np.flatnonzero(candidates.any(axis=1))
+    if candidate_rows.shape[0]:
+        row_matrix = matrix[candidate_rows]
+        row_candidates = candidates[candidate_rows]
+        # the set of free dates while stepping through the dates of a row
+        #   consists of the other dates, the already visited free dates
+        #   and the not yet visited previously free dates
+        num_before = np.cumsum(row_matrix, axis=1) - row_matrix
+        num_after = np.cumsum(prev_free[candidate_rows][:, ::-1], axis=1)[:, ::-1]
+        num_other_before = np.searchsorted(other_free_dates, slots, side="left")
+        num_other_after = other_free_dates.shape[0] - np.searchsorted(other_free_dates, slots, side="right")
+
+        # do not count the first "appointed" date
+        #   because it might just have disappeared in time
+        is_min = (num_before == 0) & (num_other_before == 0)
+        is_max = (num_after == 1) & (num_other_after == 0)
+        is_single = num_before + num_after + other_free_dates.shape[0] == 1
+        counted = row_candidates & (is_single | (~is_min & ~is_max))
+        values[candidate_rows, 1] = counted.sum(axis=1)
+
+        for row, counted_row in zip(candidate_rows.tolist(), counted):
+            indices = np.flatnonzero(counted_row)
+            if not indices.shape[0]:
+                continue
+            for spans in timespan_table.classes(int(buckets[row]))[:, indices]:
+                # like in the python engine, the timespan counts only reflect the
+                #   trailing run of appointments within the same timespan
+                #   and cancellations_{ts} is a copy of appointments_{ts}
+                last = spans[-1]
+                if last >= 0:
+                    different = np.flatnonzero(spans != last)
+                    run = spans.shape[0] - (different[-1] + 1 if different.shape[0] else 0)
+                    values[row, 4 + len(METRIC_TIMESPANS) + last] = run
+                    values[row, 4 + 2 * len(METRIC_TIMESPANS) + last] = run
+
+    # 0: date-row similar, 1: date-row changed
+    if num_dates:
+        values[1:, 0] = (matrix[1:] != matrix[:-1]).any(axis=1)
+        last_row = previous_rows.get(loc_id)
+        if last_row and last_row != matrix[0].view(np.uint8).tolist():
+            values[0, 0] = 1
+    elif previous_rows.get(loc_id):
+        values[0, 0] = 1
+    previous_rows[loc_id] = matrix[-1].view(np.uint8).tolist()
+
+    # update the state
+    state.timestamp = int(buckets[-1])
+    state.update(slots, matrix[-1], appointed[-1], other_free_dates)
+
+    return values
+
+
+def _buckets_to_records(metrics: Dict[str, dict]) -> MetricRecords:
+    keys = [
+        (timestamp, loc_id)
+        for timestamp, loc_values in metrics[METRIC_NAMES[0]].items()
+        for loc_id in loc_values
+    ]
+    values = np.array([
+        [metrics[name][timestamp][loc_id] for name in METRIC_NAMES]
+        for timestamp, loc_id in keys
+    ], dtype=np.int64).reshape(-1, len(METRIC_NAMES))
+    return (
+        np.array([k[0] for k in keys], dtype=object),
+        np.array([k[1] for k in keys], dtype=object),
+        values,
+    )
+
+
+def _records_to_dataframes(records: List[MetricRecords]) -> Dict[str, pd.DataFrame]:
+    """
+    Sums up the values of each timestamp and location and converts them to the
+    same DataFrames as created from the buckets of the python engine.
+    """
+    timestamps = np.concatenate([r[0] for r in records])
+    loc_ids = np.concatenate([r[1] for r in records])
+    values = np.concatenate([r[2] for r in records])
+
+    # all codes in order of first appearance, like the bucket dicts
+    timestamp_codes, timestamp_uniques = pd.factorize(timestamps)
+    loc_codes, loc_uniques = pd.factorize(loc_ids)
+    key_codes, key_uniques = pd.factorize(timestamp_codes * len(loc_uniques) + loc_codes)
+
+    order = np.argsort(key_codes, kind="stable")
+    starts = np.flatnonzero(np.diff(key_codes[order], prepend=-1))
+    sums = np.add.reduceat(values[order], starts, axis=0)
+
+    key_timestamps = key_uniques // len(loc_uniques)
+    key_locs = key_uniques % len(loc_uniques)
+
+    # let pandas decide about the column order of the nested dicts
+    structure = dict()
+    for timestamp, loc_id in zip(timestamp_uniques[key_timestamps].tolist(), loc_uniques[key_locs].tolist()):
+        structure.setdefault(timestamp, dict())[loc_id] = 0
+    columns = pd.DataFrame(structure).index
+
+    index = pd.to_datetime(pd.Index(timestamp_uniques))
+    index.rename("date", inplace=True)
+    column_index = columns.get_indexer(loc_uniques)[key_locs]
+
+    metrics = dict()
+    for i, name in enumerate(METRIC_NAMES):
+        # str(int) or empty string, as in the python engine
+        cells = np.full((len(timestamp_uniques), len(columns)), "", dtype=object)
+        cells[key_timestamps, column_index] = sums[:, i].astype(str).astype(object)
+        metrics[name] = pd.DataFrame(cells, index=index, columns=columns)
 
     return metrics
@@ -0,0 +1,203 @@
+"""
+Columnar copy of the metrics archives.
+
+Next to each ``metrics/YYYY/YYYY-WW.tar.gz`` an Arrow IPC (feather) file
+``YYYY-WW.feather`` can be stored, which contains the same numbers
+in long format, one row per snapshot bucket and location:
+
+    - ``date``: timestamp[s] of the 15-minute bucket
+    - ``location``: dictionary encoded "source_id/location_id"
+    - one int32 column for each metric type, null where no value exists
+
+Only buckets/locations with data are stored. The schema metadata contains
+the fingerprint of the tar file it was created from, so outdated files are ignored.
+
+Requires the `pyarrow` package, see requirements.txt.
+"""
+import os
+from pathlib import Path
+from typing import Optional, Union, Dict, Callable, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+from src.archive_index import fingerprint
+from src.dates import to_datetime_index
+
+
+def columnar_filename(tar_filename: Union[str, Path]) -> Path:
+    tar_filename = Path(tar_filename)
+    return tar_filename.parent / (tar_filename.name.split(".")[0] + ".feather")
+
+
+def is_available() -> bool:
+    return pyarrow is not None
+
+
+def metrics_to_table(metrics: Dict[str, pd.DataFrame]) -> "pyarrow.Table":
+    """
+    Converts the metrics frames of one week to the long format.
+
+    :param metrics: dict of metric type to DataFrame with "source_id/location_id" columns
+        and the date index, as returned by `calc_metrics` or read from the csv files.
+        Cells can be numbers, NaN, number strings or empty strings.
+    """
+    names = list(metrics)
+    index = metrics[names[0]].index if names else pd.Index([])
+    columns = metrics[names[0]].columns if names else pd.Index([])
+
+    values = [_to_float(metrics[name].reindex(index=index, columns=columns)) for name in names]
+    present = np.zeros((len(index), len(columns)), dtype=bool)
+    for v in values:
+        present |= ~np.isnan(v)
+    date_idx, loc_idx = np.nonzero(present)
+
+    dates = to_datetime_index(index.values).values.astype("datetime64[s]").astype(np.int64)
+
+    arrays = {
+        "date": pyarrow.array(dates[date_idx], pyarrow.int64()).cast(pyarrow.timestamp("s")),
+        "location": pyarrow.DictionaryArray.from_arrays(
+            pyarrow.array(loc_idx.astype(np.int32)),
+            pyarrow.array([str(c) for c in columns], pyarrow.string()),
+        ),
+    }
+    for name, v in zip(names, values):
+        v = v[date_idx, loc_idx]
+        nan = np.isnan(v)
+        arrays[name] = pyarrow.array(np.where(nan, 0, v).astype(np.int32), mask=nan)
+
+    return pyarrow.table(arrays)
+
+
+def write_columnar(metrics: Dict[str, pd.DataFrame], tar_filename: Union[str, Path]):
+    """
+    Store the metrics next to the (already written) tar file.
+    """
+    table = metrics_to_table(metrics)
+    table = table.replace_schema_metadata({
+        "fingerprint": fingerprint(tar_filename),
+    })
+    filename = columnar_filename(tar_filename)
+    tmp_filename = filename.parent / f"{filename.name}.tmp"
+    pyarrow.feather.write_feather(table, str(tmp_filename), compression="zstd")
+    os.replace(tmp_filename, filename)
+
+
+def is_columnar_valid(tar_filename: Union[str, Path]) -> bool:
+    return _columnar_schema(tar_filename) is not None
+
+
+def read_columnar(
+        tar_filename: Union[str, Path],
+        type: Optional[Callable[[str], bool]] = None,
+        location: Optional[Callable[[str], bool]] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Returns the metrics of one week in the layout of the csv files
+    (columns "source_id/location_id/type", date index and NaN where no value exists),
+    or None if the columnar file does not exist, is outdated or pyarrow is not installed.
+
+    :param type: optional callable(str) returning bool to select the metric types
+    :param location: optional callable(str) returning bool to select the locations
+        by their "source_id/location_id". Like with the csv files, the returned rows
+        are still those of all locations.
+    """
+    schema = _columnar_schema(tar_filename)
+    if schema is None:
+        return None
+
+    names = [n for n in schema.names[2:] if type is None or type(n)]
+    table = pyarrow.feather.read_table(
+        str(columnar_filename(tar_filename)), columns=["date", "location"] + names, memory_map=True,
+    )
+
+    dates, date_idx = np.unique(
+        table.column("date").cast(pyarrow.int64()).to_numpy(), return_inverse=True
+    )
+    location_column = table.column("location").unify_dictionaries()
+    loc_names = (
+        location_column.chunk(0).dictionary.to_pylist() if location_column.num_chunks else []
+    )
+    loc_idx = (
+        np.concatenate([c.indices.to_numpy(zero_copy_only=False) for c in location_column.chunks])
+        if location_column.num_chunks else np.array([], dtype=np.int32)
+    )
+
+    # keep only the accepted locations and renumber them
+    if location is not None:
+        accepted = np.array([bool(location(n)) for n in loc_names], dtype=bool)
+        loc_names = [n for n, a in zip(loc_names, accepted) if a]
+        selected = accepted[loc_idx]
+        loc_idx = (np.cumsum(accepted) - 1)[loc_idx]
+    else:
+        selected = np.ones(loc_idx.shape[0], dtype=bool)
+
+    shape = (dates.shape[0], len(loc_names))
+    rows = np.zeros(shape[0], dtype=bool)
+    blocks, columns = [], []
+    for name in names:
+        column = table.column(name)
+        rows[date_idx[column.is_valid().to_numpy()]] = True
+
+        matrix = np.full(shape, np.nan)
+        matrix[date_idx[selected], loc_idx[selected]] = column.to_numpy().astype(float)[selected]
+        # like the csv files, only contain the locations with values
+        loc_mask = (~np.isnan(matrix)).any(axis=0)
+        blocks.append(matrix[:, loc_mask])
+        columns += [f"{loc}/{name}" for loc, m in zip(loc_names, loc_mask) if m]
+
+    return pd.DataFrame(
+        np.hstack(blocks)[rows] if blocks else np.zeros((int(rows.sum()), 0)),
+        index=pd.DatetimeIndex(dates[rows].astype("datetime64[s]").astype("datetime64[ns]"), name="date"),
+        columns=columns,
+    )
+
+
+def concat_weeks(frames: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates the frames returned by `read_columnar` into
+    one preallocated frame with the sorted union of all columns.
+
+    Same result as ``pandas.concat(frames)`` but without reindexing each column.
+    """
+    columns = pd.Index(sorted(set().union(*(f.columns for f in frames))))
+    matrix = np.full((sum(len(f) for f in frames), len(columns)), np.nan)
+    row = 0
+    for f in frames:
+        matrix[row:row + len(f), columns.get_indexer(f.columns)] = f.to_numpy(dtype=float)
+        row += len(f)
+
+    return pd.DataFrame(
+        matrix,
+        index=pd.DatetimeIndex(np.concatenate([f.index.values for f in frames]), name="date"),
+        columns=columns,
+    )
+
+
+def _columnar_schema(tar_filename: Union[str, Path]) -> Optional["pyarrow.Schema"]:
+    if pyarrow is None:
+        return None
+    filename = columnar_filename(tar_filename)
+    if not filename.exists():
+        return None
+
+    with pyarrow.memory_map(str(filename)) as fp:
+        schema = pyarrow.ipc.open_file(fp).schema
+    meta = schema.metadata or dict()
+    if meta.get(b"fingerprint", b"").decode() != fingerprint(tar_filename):
+        return None
+    return schema
+
+
+def _to_float(df: pd.DataFrame) -> np.ndarray:
+    values = df.to_numpy()
+    if values.dtype == object:
+        values = np.where(values == "", np.nan, values)
+    return values.astype(float)
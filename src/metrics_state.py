@@ -0,0 +1,210 @@
+"""
+State of each location between consecutive tables (weeks) of the metrics calculation.
+
+The free and appointed dates are stored as sorted int64 arrays
+of seconds since epoch, which gives O(1) min/max and compact serialization.
+
+While stepping through the cells of one table, `SlotBitsets` represents the state
+as bitsets over the (sorted) dates of that table. Membership, min and max checks
+are then single integer operations.
+"""
+import json
+from pathlib import Path
+from typing import Optional, Union, Dict, Tuple, BinaryIO
+
+import numpy as np
+
+
+class LocationState:
+    """
+    The state of one location.
+
+    :param free_dates: sorted int64 array of the free dates (seconds since epoch)
+    :param appointed_dates: sorted int64 array of the dates that have been free before
+    :param timestamp: int, the 15-minute bucket (seconds since epoch) of the previous snapshot
+    """
+    __slots__ = ("free_dates", "appointed_dates", "timestamp")
+
+    def __init__(
+            self,
+            free_dates: Optional[np.ndarray] = None,
+            appointed_dates: Optional[np.ndarray] = None,
+            timestamp: Optional[int] = None,
+    ):
+        self.free_dates = np.array([], dtype=np.int64) if free_dates is None else free_dates
+        self.appointed_dates = np.array([], dtype=np.int64) if appointed_dates is None else appointed_dates
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return (
+            f"LocationState(free_dates={len(self.free_dates)}, appointed_dates={len(self.appointed_dates)}"
+            f", timestamp={self.timestamp})"
+        )
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, LocationState)
+            and self.timestamp == other.timestamp
+            and np.array_equal(self.free_dates, other.free_dates)
+            and np.array_equal(self.appointed_dates, other.appointed_dates)
+        )
+
+    def split(self, slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Split the state into the part that is covered by the dates of a table and the rest.
+
+        :param slots: sorted, unique int64 array of the table's dates (seconds since epoch)
+        :return: tuple of
+            - bool array, free flag of each slot
+            - bool array, appointed flag of each slot
+            - sorted int64 array of the free dates that are not part of the slots
+        """
+        free = _contains(self.free_dates, slots)
+        appointed = _contains(self.appointed_dates, slots)
+        other_free_dates = self.free_dates[~_contains(slots, self.free_dates)]
+        return free, appointed, other_free_dates
+
+    def update(
+            self,
+            slots: np.ndarray,
+            free: np.ndarray,
+            appointed: np.ndarray,
+            other_free_dates: np.ndarray,
+    ):
+        """
+        Merge the state of the table's dates back, the reverse of `split`.
+
+        :param slots: sorted, unique int64 array of the table's dates (seconds since epoch)
+        :param free: bool array, free flag of each slot
+        :param appointed: bool array, appointed flag of each slot
+        :param other_free_dates: sorted int64 array as returned by `split`
+        """
+        self.free_dates = np.union1d(other_free_dates, slots[free]).astype(np.int64)
+        self.appointed_dates = np.union1d(
+            self.appointed_dates[~_contains(slots, self.appointed_dates)],
+            slots[appointed],
+        ).astype(np.int64)
+
+
+class SlotBitsets:
+    """
+    The free and appointed dates of a location as python int bitsets,
+    where bit ``i`` is the i-th date of a table.
+
+    :param state: the LocationState
+    :param slots: sorted, unique int64 array of the table's dates (seconds since epoch)
+    """
+    __slots__ = ("free", "appointed", "num_other", "other_before", "other_after", "_other_free_dates")
+
+    def __init__(self, state: LocationState, slots: np.ndarray):
+        free, appointed, other_free_dates = state.split(slots)
+        self.free = mask_to_bits(free)
+        self.appointed = mask_to_bits(appointed)
+        self._other_free_dates = other_free_dates
+        self.num_other = other_free_dates.shape[0]
+        # number of other free dates before and after each slot
+        self.other_before = np.searchsorted(other_free_dates, slots, side="left").tolist()
+        self.other_after = (self.num_other - np.searchsorted(other_free_dates, slots, side="right")).tolist()
+
+    def is_boundary(self, slot: int) -> bool:
+        """
+        Returns True if the free date at the slot index is the first
+        or last of all free dates.
+
+        A single free date is not considered a boundary.
+        """
+        bit = 1 << slot
+        if self.free == bit and not self.num_other:
+            return False
+        return (
+            (not self.free & (bit - 1) and not self.other_before[slot])
+            or (not self.free >> (slot + 1) and not self.other_after[slot])
+        )
+
+    def store(self, state: LocationState, slots: np.ndarray):
+        """
+        Write the bitsets back into the LocationState
+        """
+        state.update(
+            slots=slots,
+            free=bits_to_mask(self.free, slots.shape[0]),
+            appointed=bits_to_mask(self.appointed, slots.shape[0]),
+            other_free_dates=self._other_free_dates,
+        )
+
+
+def mask_to_bits(mask: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+
+def bits_to_mask(bits: int, count: int) -> np.ndarray:
+    data = np.frombuffer(bits.to_bytes((count + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(data, count=count, bitorder="little").view(bool)
+
+
+def save_locations(
+        locations: Dict[str, LocationState],
+        file: Union[str, Path, BinaryIO],
+        meta: Optional[dict] = None,
+):
+    """
+    Store the states of all locations into a compressed numpy file.
+
+    :param meta: optional json-serializable dict, see `load_meta`
+    """
+    states = list(locations.values())
+    np.savez_compressed(
+        file,
+        meta=np.array(json.dumps(meta or dict())),
+        loc_ids=np.array(list(locations), dtype=str),
+        timestamps=np.array([s.timestamp if s.timestamp is not None else 0 for s in states], dtype=np.int64),
+        has_timestamp=np.array([s.timestamp is not None for s in states], dtype=bool),
+        free_counts=np.array([len(s.free_dates) for s in states], dtype=np.int64),
+        free_dates=_concat([s.free_dates for s in states]),
+        appointed_counts=np.array([len(s.appointed_dates) for s in states], dtype=np.int64),
+        appointed_dates=_concat([s.appointed_dates for s in states]),
+    )
+
+
+def load_locations(file: Union[str, Path, BinaryIO]) -> Dict[str, LocationState]:
+    """
+    Load the states of all locations as stored with `save_locations`.
+    """
+    with np.load(file) as data:
+        free_dates = np.split(data["free_dates"], np.cumsum(data["free_counts"])[:-1])
+        appointed_dates = np.split(data["appointed_dates"], np.cumsum(data["appointed_counts"])[:-1])
+        return {
+            loc_id: LocationState(
+                free_dates=free,
+                appointed_dates=appointed,
+                timestamp=timestamp if has_timestamp else None,
+            )
+            for loc_id, timestamp, has_timestamp, free, appointed in zip(
+                data["loc_ids"].tolist(), data["timestamps"].tolist(), data["has_timestamp"].tolist(),
+                free_dates, appointed_dates,
+            )
+        }
+
+
+def load_meta(file: Union[str, Path, BinaryIO]) -> dict:
+    """
+    Load only the meta dict as stored with `save_locations`.
+    """
+    with np.load(file) as data:
+        return json.loads(str(data["meta"]))
+
+
+def _contains(sorted_values: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Returns a bool array, True for each of `values` that is in `sorted_values`
+    """
+    if not sorted_values.shape[0]:
+        return np.zeros(values.shape[0], dtype=bool)
+    index = np.searchsorted(sorted_values, values).clip(0, sorted_values.shape[0] - 1)
+    return sorted_values[index] == values
+
+
+def _concat(arrays) -> np.ndarray:
+    if not arrays:
+        return np.array([], dtype=np.int64)
+    return np.concatenate(arrays).astype(np.int64)
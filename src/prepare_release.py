@@ -1,12 +1,19 @@
 import os
+import json
 import argparse
+import itertools
+import contextlib
+import hashlib
 from io import StringIO, BytesIO
-import warnings
 from multiprocessing import Pool
 from tqdm import tqdm
 
 from src.data import *
-from src.metrics_calc import calc_metrics
+from src import archive_index, metrics_columnar, manifest, instrument
+from src.metrics_calc import (
+    calc_metrics, calc_state, TableSummary, METRIC_ENGINES, METRICS_VERSION, TABLE_CHUNKSIZE,
+)
+from src.metrics_state import save_locations, load_locations, load_meta
 
 PATH: Path = Path(__file__).resolve().parent.parent
 METRICS_PATH = PATH / "metrics"
@@ -15,123 +22,404 @@ SNAPSHOTS_WEEKLY_FILE = METRICS_PATH / "summary-weekly.csv"
 SNAPSHOTS_SUM_FILE = METRICS_PATH / "summary.csv"
 
 
+def update_archive_indices(
+        force_recalc: bool = False,
+):
+    for iso_week, tar_filename in Data().compressed_files():
+        if not force_recalc and archive_index.is_index_valid(tar_filename):
+            continue
+        print(f"indexing {tar_filename}")
+        archive_index.build_index(tar_filename)
+
+
+def update_raw_manifest(
+        force_recalc: bool = False,
+):
+    manifest.update_manifest(Data.PATH, manifest.build_raw_entry, force_recalc=force_recalc)
+
+
+def update_metrics_manifest(
+        force_recalc: bool = False,
+):
+    manifest.update_manifest(METRICS_PATH, manifest.build_metrics_entry, force_recalc=force_recalc)
+
+
+def update_compiled(
+        force_recalc: bool = False,
+):
+    """
+    Compile each raw table whose binary store is missing or outdated, see `Data.compile`.
+
+    The archives are not decompressed for valid stores, the missing members
+    are opened by the sidecar index built by `update_archive_indices`.
+    """
+    for iso_week, source_id in Data().sources():
+        if not force_recalc and Data.is_compiled(iso_week, source_id):
+            continue
+        print(f"compiling {Data.iso_week_to_string(iso_week)} {source_id}")
+        Data.compile(iso_week, source_id)
+
+
+def update_columnar(
+        force_recalc: bool = False,
+):
+    """
+    Store the columnar copy of each metrics archive that is missing or outdated.
+    """
+    if not metrics_columnar.is_available():
+        print("pyarrow is not installed, skipping columnar metrics")
+        return
+
+    for filename in sorted(METRICS_PATH.glob("????/*.tar.gz")):
+        if not force_recalc and metrics_columnar.is_columnar_valid(filename):
+            continue
+        print(f"storing columnar {metrics_columnar.columnar_filename(filename)}")
+        metrics = dict()
+        with tarfile.open(filename) as tf:
+            for csv_name in tf.getnames():
+                metrics[csv_name.split(".")[0]] = pd.read_csv(tf.extractfile(csv_name)).set_index("date")
+        metrics_columnar.write_columnar(metrics, filename)
+
+
 def update_metrics(
         force_recalc: bool = False,
         processes: int = 1,
         source_id: StringFilter = None,
+        engine: str = "python",
+        source_processes: int = 1,
+        prefetch: int = 0,
+        table_summaries: Optional[Dict[Tuple[IsoWeek, str], dict]] = None,
+        profile_path: Optional[Path] = None,
 ):
-    iso_weeks = [f[0] for f in Data().compressed_files()]
-    assert iso_weeks, "no data found"
-
+    """
+    Calculate the metrics of each week that are not yet calculated or outdated.
+
+    A week is outdated if its raw archive or any previous raw archive
+    (which the carried-over stash depends on) or the METRICS_VERSION has changed
+    since the metrics were calculated, see `load_build_state`.
+
+    :param processes: int, number of parallel processes for the weeks
+    :param source_id: optional filter for the sources
+    :param engine: str, see `calc_metrics`
+    :param source_processes: int, number of parallel processes for the sources of each week,
+        only used if `processes` is 1
+    :param prefetch: int, number of tables to decompress ahead in a background thread,
+        see `Data.iter_files`
+    :param table_summaries: optional dict that receives the `TableSummary` values
+        of the calculated tables, to be passed to `update_weekly_summary`
+    :param profile_path: optional directory to store the instrumentation report
+        of each week, see `src/instrument.py`
+    :return: list of the calculated weeks
+    """
+    compressed_files = Data().compressed_files()
+    assert compressed_files, "no data found"
+
+    iso_weeks = [f[0] for f in compressed_files]
+    checkpoint_keys = _checkpoint_keys(compressed_files, source_id)
     base_filter = {"source_id": source_id}
+    state = load_build_state()
 
     weeks_to_calc = []
-    for week in iso_weeks:
-        path = METRICS_PATH / str(week[0])
-        filename = path / f"{Data.iso_week_to_string(week)}.tar.gz"
+    for week, tar_filename in compressed_files:
+        filename = metrics_filename(week)
+        week_state = state["weeks"].setdefault(Data.iso_week_to_string(week), dict())
 
         if force_recalc or not filename.exists():
-            data_filter = base_filter.copy()
-            data_filter["iso_week"] = week
-            weeks_to_calc.append((data_filter, path, filename))
+            weeks_to_calc.append(week)
+        elif "metrics" not in week_state:
+            # calculated before the build state existed
+            print(f"{filename} already exists")
+            week_state.update(raw=archive_index.fingerprint(tar_filename), metrics=checkpoint_keys[week])
+        elif week_state["metrics"] != checkpoint_keys[week]:
+            print(f"{filename} is outdated")
+            weeks_to_calc.append(week)
         else:
             print(f"{filename} already exists")
 
     if not weeks_to_calc:
-        return
+        save_build_state(state)
+        return []
 
     if processes <= 1:
-        stash = dict()
-        for data_filter, path, filename in weeks_to_calc:
-            data = Data(**data_filter)
-            metrics = calc_metrics(data, stash=stash)
-            _store_metrics(metrics, path, filename)
+        _calc_metrics_sequential(
+            iso_weeks, weeks_to_calc, base_filter, checkpoint_keys, engine=engine, force_recalc=force_recalc,
+            source_processes=source_processes, prefetch=prefetch, table_summaries=table_summaries,
+            profile_path=profile_path,
+        )
     else:
-        warnings.warn(
-            "Metrics with processes > 1 is only for development and not suited "
-            "for publishing. Each week should be analyzed in sequence."
+        # make sure that the checkpoint of each previous week exists
+        _calc_metrics_sequential(
+            iso_weeks[:iso_weeks.index(weeks_to_calc[-1])], [], base_filter, checkpoint_keys,
+            engine=engine, force_recalc=force_recalc, prefetch=prefetch, profile_path=profile_path,
         )
         pool = Pool(processes)
-        pool.map(_calc_metric_process, weeks_to_calc)
+        results = pool.map(_calc_metric_process, [
+            (
+                week,
+                iso_weeks[iso_weeks.index(week) - 1] if iso_weeks.index(week) else None,
+                base_filter, checkpoint_keys[week], engine, prefetch, table_summaries is not None, profile_path,
+            )
+            for week in weeks_to_calc
+        ])
+        for week_summaries, report in results:
+            if table_summaries is not None:
+                table_summaries.update(week_summaries)
+            if report is not None:
+                instrument.merge(report)
+
+    for week, tar_filename in compressed_files:
+        if week in weeks_to_calc:
+            state["weeks"][Data.iso_week_to_string(week)].update(
+                raw=archive_index.fingerprint(tar_filename), metrics=checkpoint_keys[week],
+            )
+    save_build_state(state)
+    return weeks_to_calc
+
+
+def update_checkpoints(
+        source_id: StringFilter = None,
+        prefetch: int = 0,
+        profile_path: Optional[Path] = None,
+):
+    """
+    Stores the missing or outdated checkpoint of each week without calculating metrics,
+    so that the next incremental `update_metrics` starts from the last week.
+
+    This reads the raw data of every week without a valid checkpoint once, see `calc_state`.
+    """
+    compressed_files = Data().compressed_files()
+    _calc_metrics_sequential(
+        [f[0] for f in compressed_files], [], {"source_id": source_id},
+        _checkpoint_keys(compressed_files, source_id),
+        engine="numpy", force_recalc=False, prefetch=prefetch, profile_path=profile_path,
+    )
+
+
+def _calc_metrics_sequential(
+        iso_weeks: List[IsoWeek],
+        weeks_to_calc: List[IsoWeek],
+        base_filter: dict,
+        checkpoint_keys: Dict[IsoWeek, str],
+        engine: str,
+        force_recalc: bool,
+        source_processes: int = 1,
+        prefetch: int = 0,
+        table_summaries: Optional[Dict[Tuple[IsoWeek, str], dict]] = None,
+        profile_path: Optional[Path] = None,
+):
+    """
+    Steps through all iso_weeks up to the last week to calculate
+    and carries the stash from week to week.
+
+    The metrics of weeks_to_calc are calculated and stored, the other weeks
+    only update the stash if their checkpoint is missing or outdated.
+    Each calculated stash is stored as checkpoint.
+
+    The stash is replayed from the last valid checkpoint before the first week to calculate.
+    Without any, e.g. on the first incremental run, `calc_state` reads the raw data
+    of all previous weeks once, which can also be done ahead with ``--build-checkpoints``.
+    """
+    start = 0
+    if weeks_to_calc:
+        first = iso_weeks.index(weeks_to_calc[0])
+        if not force_recalc:
+            start = next((
+                i + 1 for i in range(first - 1, -1, -1)
+                if is_checkpoint_valid(iso_weeks[i], checkpoint_keys[iso_weeks[i]])
+            ), 0)
+        if start < first:
+            print(
+                f"no checkpoint before {Data.iso_week_to_string(iso_weeks[first])}, replaying the location states"
+                f" of {first - start} previous weeks from their raw data"
+            )
+
+    stash = None
+    for i, week in enumerate(iso_weeks[start:], start):
+        if weeks_to_calc and week > weeks_to_calc[-1]:
+            break
+
+        do_metrics = week in weeks_to_calc
+        if not do_metrics and not force_recalc and is_checkpoint_valid(week, checkpoint_keys[week]):
+            stash = None
+            continue
+
+        if stash is None:
+            stash = load_checkpoint(iso_weeks[i - 1]) if i else dict()
+
+        data = Data(iso_week=week, **base_filter)
+        with _week_recording(profile_path, week):
+            if do_metrics:
+                metrics = calc_metrics(
+                    data, stash=stash, engine=engine, processes=source_processes, prefetch=prefetch,
+                    table_summaries=table_summaries,
+                )
+                _store_metrics(metrics, metrics_filename(week))
+            else:
+                with instrument.stage("metrics.state"):
+                    calc_state(data, stash=stash, prefetch=prefetch)
+
+            with instrument.stage("metrics.checkpoint"):
+                save_checkpoint(week, stash, checkpoint_keys[week])
 
 
 def _calc_metric_process(arg):
-    data_filter, path, filename = arg
-    data = Data(**data_filter)
-    metrics = calc_metrics(data, stash=None)
-    _store_metrics(metrics, path, filename)
+    week, previous_week, base_filter, checkpoint_key, engine, prefetch, with_summaries, profile_path = arg
+    stash = load_checkpoint(previous_week) if previous_week else dict()
+    data = Data(iso_week=week, **base_filter)
+    table_summaries = dict() if with_summaries else None
+    with _week_recording(profile_path, week) as recorder:
+        metrics = calc_metrics(data, stash=stash, engine=engine, prefetch=prefetch, table_summaries=table_summaries)
+        _store_metrics(metrics, metrics_filename(week))
+        with instrument.stage("metrics.checkpoint"):
+            save_checkpoint(week, stash, checkpoint_key)
+    return table_summaries, recorder.to_dict() if recorder is not None else None
+
+
+def profile_filename(profile_path: Path, iso_week: IsoWeek) -> Path:
+    return Path(profile_path) / str(iso_week[0]) / f"{Data.iso_week_to_string(iso_week)}.json"
+
+
+def _week_recording(profile_path: Optional[Path], iso_week: IsoWeek):
+    """
+    Records the stages of the week into the json report if `profile_path` is given
+    """
+    if profile_path is None:
+        return contextlib.nullcontext()
+    return instrument.recording(profile_filename(profile_path, iso_week))
+
+
+def metrics_filename(iso_week: IsoWeek) -> Path:
+    return METRICS_PATH / str(iso_week[0]) / f"{Data.iso_week_to_string(iso_week)}.tar.gz"
+
+
+def checkpoint_filename(iso_week: IsoWeek) -> Path:
+    """
+    The stash after calculating the metrics of the week
+    """
+    return METRICS_PATH / str(iso_week[0]) / f"{Data.iso_week_to_string(iso_week)}.state.npz"
+
+
+def _checkpoint_keys(compressed_files: List[Tuple[IsoWeek, str]], source_id: StringFilter) -> Dict[IsoWeek, str]:
+    """
+    The key of each week's checkpoint (and metrics) is a hash of the METRICS_VERSION,
+    the source filter and the fingerprints of all raw archives up to this week.
+    """
+    digest = hashlib.sha1(repr((METRICS_VERSION, source_id)).encode("utf-8"))
+    keys = dict()
+    for iso_week, tar_filename in compressed_files:
+        digest.update(archive_index.fingerprint(tar_filename).encode("utf-8"))
+        keys[iso_week] = digest.hexdigest()
+    return keys
+
+
+def build_state_filename() -> Path:
+    return METRICS_PATH / "build-state.json"
+
+
+def load_build_state() -> dict:
+    """
+    Returns the state of the last build:
+
+        {"version": METRICS_VERSION, "weeks": {"YYYY-WW": {
+            "raw": "fingerprint of the raw archive",
+            "metrics": "key of the calculated metrics",
+            "summary": "key of the weekly summary rows",
+        }}}
+
+    The keys are the checkpoint keys of the week, see `_checkpoint_keys`.
+    """
+    filename = build_state_filename()
+    if not filename.exists():
+        return {"version": METRICS_VERSION, "weeks": dict()}
+    with open(filename) as fp:
+        return json.load(fp)
+
 
+def save_build_state(state: dict):
+    filename = build_state_filename()
+    os.makedirs(filename.parent, exist_ok=True)
+    state = {**state, "version": METRICS_VERSION}
+    temp_filename = filename.with_name(f"{filename.name}.tmp")
+    with open(temp_filename, "w") as fp:
+        json.dump(state, fp, indent=1, sort_keys=True)
+    os.replace(temp_filename, filename)
 
-def _store_metrics(metrics: Dict[str, pd.DataFrame], path: Path, filename: Path):
+
+def is_checkpoint_valid(iso_week: IsoWeek, key: str) -> bool:
+    filename = checkpoint_filename(iso_week)
+    if not filename.exists():
+        return False
+    try:
+        return load_meta(filename).get("key") == key
+    except Exception:
+        return False
+
+
+def load_checkpoint(iso_week: IsoWeek) -> dict:
+    return {"locations": load_locations(checkpoint_filename(iso_week))}
+
+
+def save_checkpoint(iso_week: IsoWeek, stash: dict, key: str):
+    filename = checkpoint_filename(iso_week)
+    os.makedirs(filename.parent, exist_ok=True)
+    # write to a temporary file first so parallel processes never see a partial checkpoint
+    temp_filename = filename.with_name(f"{filename.name}.{os.getpid()}.tmp")
+    with open(temp_filename, "wb") as fp:
+        save_locations(stash["locations"], fp, meta={"key": key})
+    os.replace(temp_filename, filename)
+
+
+def _store_metrics(metrics: Dict[str, pd.DataFrame], filename: Path):
     print(f"compressing metrics into {filename}")
-    os.makedirs(path, exist_ok=True)
+    os.makedirs(filename.parent, exist_ok=True)
     with tarfile.open(filename, "w:gz") as tf:
         for name, df in metrics.items():
-            bin = df.to_csv().encode("utf-8")
+            with instrument.stage("store.to_csv", rows=len(df), cells=df.size):
+                bin = df.to_csv().encode("utf-8")
             bin_file = BytesIO(bin)
 
             info = tarfile.TarInfo(f"{name}.csv")
             info.size = len(bin)
-            tf.addfile(info, bin_file)
+            with instrument.stage("store.gzip"):
+                tf.addfile(info, bin_file)
 
 
-def calc_weekly_summary(data: Data) -> Optional[pd.DataFrame]:
-    print(f"calc weekly summary of {data}")
+def calc_weekly_summary(
+        data: Data,
+        prefetch: int = 0,
+        table_summaries: Optional[Dict[Tuple[IsoWeek, str], dict]] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Calculates the summary of each table in the dataset.
 
-    df_changes = dict()
-    for change_type in ("appointments", "cancellations"):
-        df = Metrics.dataframe(
-            type=change_type,
-            iso_week=data.iso_week,
-            iso_week_gt=data.iso_week_gt,
-            iso_week_gte=data.iso_week_gte,
-            iso_week_lt=data.iso_week_lt,
-            iso_week_lte=data.iso_week_lte,
-            as_int=True,
-        )
-        if df is not None:
-            # hard clip on appointments data
-            #   to throw out the complicated and nonsense stuff
-            df = df.clip(0, 1)
-            df["week"] = df.index.map(lambda d: d.isocalendar()[:2])
-            df = df.groupby("week").sum()
+    The raw tables are read in chunks of rows, see `TableSummary`.
 
-        df_changes[change_type] = df
+    :param prefetch: int, number of tables to decompress ahead in a background thread
+    :param table_summaries: optional dict with the `TableSummary` values of
+        (iso_week, source_id) as filled by `calc_metrics`. Only the other tables are read.
+    """
+    print(f"calc weekly summary of {data}")
 
-    stat_rows = []
-    for iso_week, source_id, columns, rows in tqdm(data.iter_tables(as_int=False)):
-
-        changes = 0
-        prev_dates_free = dict()
-        for row in rows:
-            loc_id = row[2]
-            dates_free = row[3:]
-            if loc_id in prev_dates_free:
-                if prev_dates_free[loc_id] != dates_free:
-                   changes += 1
-
-            prev_dates_free[loc_id] = dates_free
-
-        num_changes = {f"num_{change_type}": -1 for change_type in df_changes}
-        for change_type in df_changes:
-            if df_changes[change_type] is not None:
-                df = df_changes[change_type]
-                # filter this iso-week
-                df = df[df.index == iso_week]
-                # filter this source_id
-                df = df.loc[:, [c for c in df.columns if c.startswith(f"{source_id}/")]]
-                # get the sum
-                num_changes[f"num_{change_type}"] = df.sum().sum()
+    change_totals = {
+        change_type: _weekly_change_totals(data, change_type)
+        for change_type in ("appointments", "cancellations")
+    }
 
+    stat_rows = []
+    for iso_week, source_id, summary in tqdm(_iter_table_summaries(data, prefetch, table_summaries)):
+        num_changes = {
+            f"num_{change_type}": -1 if totals is None else totals.get((iso_week, source_id), 0)
+            for change_type, totals in change_totals.items()
+        }
         stat_rows.append({
             "week": "%s-%02d" % iso_week,
             "source_id": source_id,
-            "num_locations": len(set(row[2] for row in rows)),
-            "num_snapshots": len(set(row[0] for row in rows)),
-            "num_changes": changes,
+            "num_locations": summary["num_locations"],
+            "num_snapshots": summary["num_snapshots"],
+            "num_changes": summary["num_changes"],
             **num_changes,
-            "min_date": min(row[0] for row in rows),
-            "max_date": max(row[0] for row in rows),
+            "min_date": summary["min_date"],
+            "max_date": summary["max_date"],
         })
 
     if not stat_rows:
@@ -141,39 +429,130 @@ def calc_weekly_summary(data: Data) -> Optional[pd.DataFrame]:
     return df
 
 
+def _weekly_change_totals(data: Data, change_type: str) -> Optional[Dict[Tuple[IsoWeek, str], int]]:
+    """
+    Returns the sum of the metric of each (iso_week, source_id)
+    or None if no metrics exist
+    """
+    df = Metrics.dataframe(
+        type=change_type,
+        iso_week=data.iso_week,
+        iso_week_gt=data.iso_week_gt,
+        iso_week_gte=data.iso_week_gte,
+        iso_week_lt=data.iso_week_lt,
+        iso_week_lte=data.iso_week_lte,
+        as_int=True,
+    )
+    if df is None:
+        return None
+
+    # hard clip on appointments data
+    #   to throw out the complicated and nonsense stuff
+    df = df.clip(0, 1)
+    iso_dates = df.index.isocalendar()
+    df = df.groupby([iso_dates["year"].values, iso_dates["week"].values]).sum()
+    df = df.T.groupby(df.columns.str.split("/").str[0]).sum().T
+
+    return {
+        ((int(year), int(week)), source_id): int(value)
+        for (year, week, source_id), value in df.stack().items()
+    }
+
+
+def _iter_table_summaries(
+        data: Data,
+        prefetch: int,
+        table_summaries: Optional[Dict[Tuple[IsoWeek, str], dict]],
+) -> Generator[Tuple[IsoWeek, str, dict], None, None]:
+    if table_summaries is None:
+        for iso_week, source_id, row_iter in data.iter_tables_iter(prefetch=prefetch):
+            yield iso_week, source_id, _read_table_summary(row_iter)
+        return
+
+    for iso_week, sources in itertools.groupby(data.sources(), key=lambda s: s[0]):
+        summaries = {source_id: table_summaries.get((iso_week, source_id)) for _, source_id in sources}
+        missing = [source_id for source_id, summary in summaries.items() if summary is None]
+        if missing:
+            week_data = Data(iso_week=iso_week, source_id=missing)
+            for _, source_id, row_iter in week_data.iter_tables_iter(prefetch=prefetch):
+                summaries[source_id] = _read_table_summary(row_iter)
+        for source_id, summary in summaries.items():
+            yield iso_week, source_id, summary
+
+
+def _read_table_summary(row_iter: Data.RowIter) -> dict:
+    summary = TableSummary()
+    for table in row_iter.iter_matrices(TABLE_CHUNKSIZE):
+        with instrument.stage("summary.table", rows=len(table), cells=table.matrix.size):
+            summary.add(table)
+    return summary.to_dict()
+
+
 def update_weekly_summary(
         force_recalc: bool = False,
-):
+        prefetch: int = 0,
+        table_summaries: Optional[Dict[Tuple[IsoWeek, str], dict]] = None,
+) -> bool:
+    """
+    Calculates the weekly summary from the first week that has not been summarized
+    or whose raw archive has changed since, according to the build state, see `update_metrics`.
+
+    :param table_summaries: optional dict of the tables summarized by `update_metrics`,
+        see `calc_weekly_summary`
+
+    :return: bool, True if the summary has been written
+    """
     filename = SNAPSHOTS_WEEKLY_FILE
 
-    previous_stats = None
-    data = Data()  # full run over all weeks
+    compressed_files = Data().compressed_files()
+    keys = _checkpoint_keys(compressed_files, None)
+    state = load_build_state()
 
+    previous_stats = None
     if not force_recalc:
         try:
             previous_stats = (
                 pd.read_csv(filename)
                 .set_index(["week", "source_id"])
             )
-            max_date = previous_stats.index.get_level_values("week").max()
-            max_date = Data.string_to_iso_week(max_date)
-
-            data = Data(iso_week_gt=max_date)
-
         except Exception as e:
             previous_stats = None
 
-    stats = calc_weekly_summary(data)
-    if stats is None and previous_stats is not None:
+    first_week = compressed_files[0][0] if compressed_files else None
+    if previous_stats is not None:
+        summary_weeks = set(previous_stats.index.get_level_values("week"))
+        first_week = None
+        for week, key in keys.items():
+            week_state = state["weeks"].setdefault(Data.iso_week_to_string(week), dict())
+            if "summary" not in week_state and Data.iso_week_to_string(week) in summary_weeks:
+                # calculated before the build state existed
+                week_state["summary"] = key
+            # weeks without rows are not in the summary file but in the build state
+            if week_state.get("summary") != key:
+                first_week = week
+                break
+
+    if first_week is None:
         print(f"unchanged: {filename}")
-        return
+        save_build_state(state)
+        return False
 
+    stats = calc_weekly_summary(Data(iso_week_gte=first_week), prefetch=prefetch, table_summaries=table_summaries)
     if previous_stats is not None:
+        previous_stats = previous_stats[
+            previous_stats.index.get_level_values("week") < Data.iso_week_to_string(first_week)
+        ]
         stats = pd.concat([previous_stats, stats])
 
     print(f"writing weekly summary {filename}")
     stats.to_csv(filename)
 
+    for week, key in keys.items():
+        if week >= first_week:
+            state["weeks"].setdefault(Data.iso_week_to_string(week), dict())["summary"] = key
+    save_build_state(state)
+    return True
+
 
 def update_summary_and_readme():
     print("updating summary")
@@ -213,34 +592,112 @@ def update_summary_and_readme():
 
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--force-index", type=bool, nargs="?", default=False, const=True,
+        help="Force recreation of the random-access index files of the raw data",
+    )
+    parser.add_argument(
+        "--compile", type=bool, nargs="?", default=False, const=True,
+        help="Compile the raw data into the binary store for faster reading",
+    )
+    parser.add_argument(
+        "--build-checkpoints", type=bool, nargs="?", default=False, const=True,
+        help="Store the location states of all weeks before calculating the metrics,"
+             " which reads all raw data once if the checkpoints are missing",
+    )
     parser.add_argument(
         "--force-metrics", type=bool, nargs="?", default=False, const=True,
         help="Force recalculation of all metrics (takes a long time!)",
     )
+    parser.add_argument(
+        "--engine", type=str, nargs="?", default="python", choices=METRIC_ENGINES,
+        help="The implementation of the metrics calculation, both produce the same results",
+    )
+    parser.add_argument(
+        "--columnar", type=bool, nargs="?", default=False, const=True,
+        help="Store a columnar copy of the metrics for faster reading (requires pyarrow)",
+    )
     parser.add_argument(
         "--force-weekly", type=bool, nargs="?", default=False, const=True,
         help="Force recalculation of weekly summary",
     )
     parser.add_argument(
         "--processes", type=int, nargs="?", default=1,
-        help="Number of parallel processes (for each week) - for development only!",
+        help="Number of parallel processes (for each week)",
+    )
+    parser.add_argument(
+        "--source-processes", type=int, nargs="?", default=1,
+        help="Number of parallel processes for the sources within each week, if --processes is 1",
+    )
+    parser.add_argument(
+        "--prefetch", type=int, nargs="?", default=0,
+        help="Number of raw csv files to decompress ahead in a background thread",
     )
     parser.add_argument(
         "--source", type=str, nargs="+", default=None,
         help="Filter for source_id - for development only!",
     )
+    parser.add_argument(
+        "--profile", type=str, nargs="?", default=None,
+        help="Directory to store the timing and memory report of each calculated week and the whole run",
+    )
+    parser.add_argument(
+        "--trace-memory", type=bool, nargs="?", default=False, const=True,
+        help="Trace the peak memory of each stage with tracemalloc, if --profile is given (slow!)",
+    )
 
     args = parser.parse_args()
 
-    update_metrics(
-        force_recalc=args.force_metrics,
-        processes=args.processes,
-        source_id=args.source,
-    )
-    update_weekly_summary(
-        force_recalc=args.force_weekly,
-    )
-    update_summary_and_readme()
+    profile_path = Path(args.profile) if args.profile else None
+    if profile_path is None:
+        recording = contextlib.nullcontext()
+    else:
+        recording = instrument.recording(profile_path / "run.json", trace_memory=args.trace_memory)
+
+    with recording as recorder:
+        with instrument.stage("release.archive_indices"):
+            update_archive_indices(
+                force_recalc=args.force_index,
+            )
+        with instrument.stage("release.raw_manifest"):
+            update_raw_manifest()
+        if args.compile:
+            with instrument.stage("release.compiled"):
+                update_compiled()
+        # the raw tables are decoded once for the metrics and the weekly summary
+        table_summaries = dict()
+        if args.build_checkpoints:
+            with instrument.stage("release.checkpoints"):
+                update_checkpoints(source_id=args.source, prefetch=args.prefetch, profile_path=profile_path)
+        with instrument.stage("release.metrics"):
+            update_metrics(
+                force_recalc=args.force_metrics,
+                processes=args.processes,
+                source_id=args.source,
+                engine=args.engine,
+                source_processes=args.source_processes,
+                prefetch=args.prefetch,
+                table_summaries=table_summaries,
+                profile_path=profile_path,
+            )
+        if args.columnar:
+            with instrument.stage("release.columnar"):
+                update_columnar()
+        with instrument.stage("release.metrics_manifest"):
+            update_metrics_manifest()
+        with instrument.stage("release.weekly_summary"):
+            summary_changed = update_weekly_summary(
+                force_recalc=args.force_weekly,
+                prefetch=args.prefetch,
+                table_summaries=table_summaries,
+            )
+        if summary_changed or not SNAPSHOTS_SUM_FILE.exists():
+            with instrument.stage("release.summary_and_readme"):
+                update_summary_and_readme()
+
+    if recorder is not None:
+        print(f"\nstages (report in {profile_path}):")
+        print(recorder.summary())
 
 
 if __name__ == "__main__":
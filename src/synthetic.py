@@ -0,0 +1,290 @@
+"""
+Generator of synthetic raw data for the benchmarks, see `src/benchmark.py`.
+
+Writes ``YYYY/YYYY-WW.tar.gz`` archives and a ``metadata.json`` in the layout
+of the real ``raw/`` directory, so that `Data.PATH` can simply point to it.
+
+Each location has a set of free slots which is carried from one snapshot to
+the next. Between two snapshots, the slots of a location change with probability
+`changes`. Then some free slots are booked and some booked slots become free
+again so that about a fraction of `free` of the upcoming slots stays free.
+Slots in the past are never free.
+
+The defaults (`TODAY`) resemble the current scraper output of one week.
+The generated data is deterministic for the same parameters and each source
+does not depend on the number of sources, so a larger scale only adds sources.
+"""
+import io
+import os
+import glob
+import json
+import tarfile
+import datetime
+from pathlib import Path
+from typing import Union, List, Tuple
+
+import numpy as np
+
+from src import manifest
+from src.dates import datetime64_to_strings
+
+IsoWeek = Tuple[int, int]
+
+# shape of one week of today's data
+TODAY = dict(
+    sources=36,
+    locations=7,
+    slots=1100,
+    slot_minutes=5,
+    snapshot_minutes=15,
+    free=.18,
+    changes=.27,
+)
+
+CONFIG_FILENAME = "synthetic.json"
+
+# office hours of the slots, monday to friday
+_OPENING_HOURS = (8, 16)
+# probability of a free slot being booked when the slots of a location change
+_BOOKED = .02
+
+
+def generate(
+        path: Union[str, Path],
+        sources: int = TODAY["sources"],
+        locations: int = TODAY["locations"],
+        slots: int = TODAY["slots"],
+        slot_minutes: int = TODAY["slot_minutes"],
+        snapshot_minutes: int = TODAY["snapshot_minutes"],
+        free: float = TODAY["free"],
+        changes: float = TODAY["changes"],
+        iso_week: IsoWeek = (2021, 28),
+        weeks: int = 1,
+        seed: int = 23,
+        compresslevel: int = 9,
+        force: bool = False,
+) -> dict:
+    """
+    Writes synthetic raw data to `path`, unless it already contains
+    data generated with the same parameters.
+
+    :param path: str or Path, the directory to use as `Data.PATH`
+    :param sources: int, number of sources (csv files per week)
+    :param locations: int, number of locations per source
+    :param slots: int, number of date columns per table
+    :param slot_minutes: int, spacing of the date columns within the opening hours
+    :param snapshot_minutes: int, spacing of the snapshots
+    :param free: float, fraction of the upcoming slots that are free
+    :param changes: float, probability of a location's slots changing between two snapshots
+    :param iso_week: tuple of (year, week), the first week
+    :param weeks: int, number of consecutive weeks
+    :param seed: int, seed of the random generator
+    :param compresslevel: int, gzip level of the archives. The real data uses 9,
+        lower levels are much faster to write but slower to read
+    :param force: bool, rewrite existing data
+    :return: dict with the parameters and the number of "tables", "rows", "cells",
+        "free_cells", "bytes" (uncompressed) and "compressed_bytes"
+    """
+    path = Path(path)
+    config = dict(
+        sources=sources, locations=locations, slots=slots, slot_minutes=slot_minutes,
+        snapshot_minutes=snapshot_minutes, free=free, changes=changes,
+        iso_week=list(iso_week), weeks=weeks, seed=seed, compresslevel=compresslevel,
+    )
+    existing = load_config(path)
+    if existing is not None:
+        if not force and existing["config"] == config:
+            return existing
+        # remove the files of previously generated data
+        for filename in glob.glob(str(path / "????" / "*")) + [str(manifest.manifest_filename(path))]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    source_ids = [f"source{i:0{len(str(sources - 1))}d}" for i in range(sources)]
+    location_ids = [f"location{i:0{len(str(locations - 1))}d}" for i in range(locations)]
+
+    stats = dict(config=config, weeks=[], tables=0, rows=0, cells=0, free_cells=0, bytes=0, compressed_bytes=0)
+    for week in iter_weeks(iso_week, weeks):
+        week_str = "%s-%02d" % week
+        filename = path / week_str[:4] / f"{week_str}.tar.gz"
+        os.makedirs(filename.parent, exist_ok=True)
+
+        with tarfile.open(filename, "w:gz", compresslevel=compresslevel) as tf:
+            for source_index, source_id in enumerate(source_ids):
+                rng = np.random.default_rng([seed, week[0], week[1], source_index])
+                content, matrix = _source_table(
+                    rng=rng, iso_week=week, source_id=source_id, location_ids=location_ids,
+                    slots=slots, slot_minutes=slot_minutes, snapshot_minutes=snapshot_minutes,
+                    free=free, changes=changes,
+                )
+                info = tarfile.TarInfo(f"{source_id}.csv")
+                info.size = len(content)
+                info.mtime = int(_week_start(week).timestamp()) + 7 * 24 * 3600
+                info.mode = 0o644
+                tf.addfile(info, io.BytesIO(content))
+
+                stats["tables"] += 1
+                stats["rows"] += matrix.shape[0]
+                stats["cells"] += matrix.size
+                stats["free_cells"] += int(matrix.sum())
+                stats["bytes"] += len(content)
+
+        stats["weeks"].append(week_str)
+        stats["compressed_bytes"] += filename.stat().st_size
+
+    metadata = {
+        source_id: {
+            "name": f"Synthetic source {source_id}",
+            "scraper": "synthetic",
+            "url": "",
+            "locations": {
+                location_id: {
+                    "name": f"Synthetic location {location_id}",
+                    "services": [],
+                }
+                for location_id in location_ids
+            },
+        }
+        for source_id in source_ids
+    }
+    with open(path / "metadata.json", "w") as fp:
+        json.dump(metadata, fp, indent=2)
+
+    with open(path / CONFIG_FILENAME, "w") as fp:
+        json.dump(stats, fp, indent=1)
+
+    return stats
+
+
+def load_config(path: Union[str, Path]) -> Union[dict, None]:
+    """
+    Returns the dict returned by `generate` for the data in `path`, or None
+    """
+    filename = Path(path) / CONFIG_FILENAME
+    if not filename.exists():
+        return None
+    with open(filename) as fp:
+        return json.load(fp)
+
+
+def iter_weeks(iso_week: IsoWeek, weeks: int) -> List[IsoWeek]:
+    start = _week_start(iso_week)
+    return [
+        tuple((start + datetime.timedelta(weeks=i)).isocalendar()[:2])
+        for i in range(weeks)
+    ]
+
+
+def _week_start(iso_week: IsoWeek) -> datetime.datetime:
+    return datetime.datetime.strptime("%s-%02d-1" % tuple(iso_week), "%G-%V-%u")
+
+
+def slot_dates(iso_week: IsoWeek, slots: int, slot_minutes: int) -> np.ndarray:
+    """
+    The first `slots` dates within the opening hours, starting at monday of the week
+    """
+    per_day = (_OPENING_HOURS[1] - _OPENING_HOURS[0]) * 60 // slot_minutes
+    start = np.datetime64(_week_start(iso_week), "m")
+    days = np.arange(0, slots // per_day * 7 // 5 + 7)
+    days = days[(days % 7) < 5][:(slots + per_day - 1) // per_day]
+    dates = (
+        start + days[:, None] * 24 * 60 + _OPENING_HOURS[0] * 60
+        + np.arange(per_day)[None, :] * slot_minutes
+    ).reshape(-1)
+    return dates[:slots].astype("datetime64[s]")
+
+
+def _source_table(
+        rng: np.random.Generator,
+        iso_week: IsoWeek,
+        source_id: str,
+        location_ids: List[str],
+        slots: int,
+        slot_minutes: int,
+        snapshot_minutes: int,
+        free: float,
+        changes: float,
+) -> Tuple[bytes, np.ndarray]:
+    """
+    Returns the csv content and the free-slot matrix of one source in one week
+    """
+    dates = slot_dates(iso_week, slots, slot_minutes)
+    num_snapshots = 7 * 24 * 60 // snapshot_minutes
+    # each scraper starts at a slightly different time
+    snapshot_dates = (
+        np.datetime64(_week_start(iso_week), "s")
+        + int(rng.integers(0, snapshot_minutes * 60))
+        + np.arange(num_snapshots) * snapshot_minutes * 60
+    )
+
+    appear = _BOOKED * free / max(1e-6, 1. - free)
+    state = rng.random((len(location_ids), slots)) < free
+    matrix = np.empty((num_snapshots, len(location_ids), slots), dtype=bool)
+    for i, snapshot_date in enumerate(snapshot_dates):
+        upcoming = dates > snapshot_date
+        changed = (rng.random(len(location_ids)) < changes)[:, None]
+        booked = rng.random(state.shape) < _BOOKED
+        freed = rng.random(state.shape) < appear
+        state = np.where(changed, (state & ~booked) | (~state & freed), state) & upcoming
+        matrix[i] = state
+    matrix = matrix.reshape(-1, slots)
+
+    header = ",".join(["date", "source_id", "location_id"] + datetime64_to_strings(dates)) + "\r\n"
+
+    # all row prefixes have the same length, so the whole table
+    #   is assembled as one byte matrix where empty cells are zero
+    prefixes = np.frombuffer("".join(
+        f"{snapshot_date},{source_id},{location_id}"
+        for snapshot_date in datetime64_to_strings(snapshot_dates)
+        for location_id in location_ids
+    ).encode("ascii"), dtype=np.uint8).reshape(matrix.shape[0], -1)
+
+    cells = np.empty((matrix.shape[0], slots, 2), dtype=np.uint8)
+    cells[:, :, 0] = ord(",")
+    cells[:, :, 1] = matrix * ord("1")
+    line_end = np.broadcast_to(np.frombuffer(b"\r\n", dtype=np.uint8), (matrix.shape[0], 2))
+
+    body = np.concatenate([prefixes, cells.reshape(matrix.shape[0], -1), line_end], axis=1)
+    return header.encode("ascii") + body.tobytes().replace(b"\x00", b""), matrix
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "path", type=str,
+        help="Directory to write the raw data to",
+    )
+    for key, value in TODAY.items():
+        parser.add_argument(
+            f"--{key.replace('_', '-')}", type=type(value), nargs="?", default=value,
+            help=f"default: {value}",
+        )
+    parser.add_argument(
+        "--scale", type=float, nargs="?", default=1.,
+        help="Multiplier of the number of sources",
+    )
+    parser.add_argument(
+        "--weeks", type=int, nargs="?", default=1,
+        help="Number of consecutive weeks",
+    )
+    parser.add_argument(
+        "--seed", type=int, nargs="?", default=23,
+    )
+    parser.add_argument(
+        "--compresslevel", type=int, nargs="?", default=9,
+        help="gzip level, 1 is much faster to write",
+    )
+    args = parser.parse_args()
+
+    kwargs = {key: getattr(args, key) for key in TODAY}
+    kwargs["sources"] = max(1, round(kwargs["sources"] * args.scale))
+    stats = generate(
+        args.path, weeks=args.weeks, seed=args.seed, compresslevel=args.compresslevel, force=True, **kwargs,
+    )
+    print(json.dumps({key: value for key, value in stats.items() if key != "config"}, indent=1))
+
+
+if __name__ == "__main__":
+    main()
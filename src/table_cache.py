@@ -0,0 +1,124 @@
+"""
+In-process LRU cache for decoded tables, see `Data.enable_cache`.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union, Hashable, Any, Tuple
+
+import pandas as pd
+
+
+class TableCache:
+    """
+    Least-recently-used cache bounded by the estimated memory size of the values.
+
+    Each entry is stored together with the modification time of its source file
+    and is discarded on access if the file has changed.
+
+    :param max_bytes: int, the maximum estimated size of all cached values
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.info()})"
+
+    def info(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.num_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def get(self, key: Hashable, filename: Union[str, Path]) -> Optional[Any]:
+        """
+        Returns the cached value or None.
+
+        :param filename: the source file of the value
+        """
+        mtime = _mtime(filename)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != mtime:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, filename: Union[str, Path], value: Any, size: Optional[int] = None):
+        """
+        Stores the value and evicts the least-recently-used entries
+        until the size limit is met. Values larger than the limit are not stored.
+
+        :param filename: the source file of the value
+        :param size: optional size of the value in bytes, estimated otherwise
+        """
+        if size is None:
+            size = estimate_size(value)
+        mtime = _mtime(filename)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+
+            while self._entries and self.num_bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            self._entries[key] = (mtime, value, size)
+            self.num_bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def _remove(self, key: Hashable):
+        self.num_bytes -= self._entries.pop(key)[2]
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Estimates the memory size of a DataFrame or of the (columns, rows) tuple of `Data.get_table`
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[1], list):
+        columns, rows = value
+        size = sys.getsizeof(columns) + sum(sys.getsizeof(c) for c in columns)
+        if rows:
+            # the list object and one pointer per cell,
+            #   the cell values are mostly shared small ints or strings
+            size += len(rows) * (sys.getsizeof(rows[0]) + sys.getsizeof(rows[0][0]))
+        return size + sys.getsizeof(rows)
+
+    return sys.getsizeof(value)
+
+
+def _mtime(filename: Union[str, Path]) -> float:
+    try:
+        return os.stat(filename).st_mtime
+    except FileNotFoundError:
+        return -1.
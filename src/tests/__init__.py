@@ -1,3 +1,14 @@
+from .test_archive_index import *
+from .test_compiled import *
 from .test_data import *
+from .test_dates import *
 from .test_data_filter import *
+from .test_instrument import *
+from .test_long_table import *
+from .test_manifest import *
+from .test_matrix import *
 from .test_metrics import *
+from .test_metrics_state import *
+from .test_prepare_release import *
+from .test_synthetic import *
+from .test_table_cache import *
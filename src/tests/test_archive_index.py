@@ -0,0 +1,71 @@
+import unittest
+import tempfile
+import shutil
+
+from src.data import *
+from src import archive_index
+
+
+class TestArchiveIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.tar_filename = Path(self.tempdir.name) / "2026-20.tar.gz"
+        shutil.copy(Data.tar_filename((2026, 20)), self.tar_filename)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def read_members(self):
+        with tarfile.open(self.tar_filename) as tf:
+            return {
+                name: tf.extractfile(name).read()
+                for name in tf.getnames()
+            }
+
+    def test_open_member(self):
+        expected = self.read_members()
+        self.assertIsNone(archive_index.load_index(self.tar_filename))
+
+        archive_index.build_index(self.tar_filename)
+        self.assertTrue(archive_index.is_index_valid(self.tar_filename))
+
+        # the members are read from the gzip access points
+        self.assertTrue(archive_index.gzip_index_filename(self.tar_filename).exists())
+        with archive_index._open_gzip(self.tar_filename) as gz:
+            self.assertIsInstance(gz, archive_index.indexed_gzip.IndexedGzipFile)
+            self.assertGreater(len(list(gz.seek_points())), 0)
+        self.assertEqual(
+            sorted(expected),
+            sorted(archive_index.load_index(self.tar_filename)["members"]),
+        )
+        for name, content in expected.items():
+            with archive_index.open_member(self.tar_filename, name) as fp:
+                self.assertEqual(content, fp.read())
+
+        with self.assertRaises(KeyError):
+            archive_index.open_member(self.tar_filename, "frankfurt.csv")
+
+    def test_open_member_without_gzip_index(self):
+        expected = self.read_members()
+        archive_index.build_index(self.tar_filename)
+        archive_index.gzip_index_filename(self.tar_filename).unlink(missing_ok=True)
+
+        for name, content in expected.items():
+            with archive_index.open_member(self.tar_filename, name) as fp:
+                self.assertEqual(content, fp.read())
+
+    def test_outdated_index(self):
+        archive_index.build_index(self.tar_filename)
+        shutil.copy(Data.tar_filename((2026, 21)), self.tar_filename)
+        self.assertIsNone(archive_index.load_index(self.tar_filename))
+        self.assertFalse(archive_index.is_index_valid(self.tar_filename))
+
+        expected = self.read_members()
+        for name, content in expected.items():
+            with archive_index.open_member(self.tar_filename, name) as fp:
+                self.assertEqual(content, fp.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
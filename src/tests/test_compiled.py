@@ -0,0 +1,65 @@
+import unittest
+import tempfile
+
+from src.data import *
+
+
+class TestCompiled(unittest.TestCase):
+
+    WEEK = (2026, 20)
+    SOURCE_ID = "wuppertalgeo"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self._compiled_path = Data.COMPILED_PATH
+        Data.COMPILED_PATH = Path(self.tempdir.name)
+
+    def tearDown(self):
+        Data.COMPILED_PATH = self._compiled_path
+        self.tempdir.cleanup()
+
+    def test_compile(self):
+        self.assertFalse(Data.is_compiled(self.WEEK, self.SOURCE_ID))
+        self.assertIsNone(Data.get_compiled(self.WEEK, self.SOURCE_ID))
+
+        Data.compile(self.WEEK, self.SOURCE_ID)
+        self.assertTrue(Data.is_compiled(self.WEEK, self.SOURCE_ID))
+
+        compiled = Data.get_compiled(self.WEEK, self.SOURCE_ID)
+        self.assertIsInstance(compiled.matrix, np.memmap)
+        self.assertEqual(np.dtype("datetime64[s]"), compiled.dates.dtype)
+        self.assertEqual(np.dtype("datetime64[s]"), compiled.slots.dtype)
+
+    def test_get_table(self):
+        for kwargs in (
+                {},
+                {"as_int": True, "as_datetime": True},
+                {"as_int": True, "with_meta": True},
+                {"empty": "0", "location_id": "auskunft*"},
+                {"location_id": ["nothing"]},
+        ):
+            Data.COMPILED_PATH = Path(self.tempdir.name) / "nothing"
+            expected = Data.get_table(self.WEEK, self.SOURCE_ID, **kwargs)
+            Data.COMPILED_PATH = Path(self.tempdir.name)
+            if not Data.is_compiled(self.WEEK, self.SOURCE_ID):
+                Data.compile(self.WEEK, self.SOURCE_ID)
+
+            self.assertEqual(expected, Data.get_table(self.WEEK, self.SOURCE_ID, **kwargs), f"kwargs={kwargs}")
+
+    def test_get_dataframe(self):
+        for kwargs in (
+                {},
+                {"as_datetime": False},
+                {"with_meta": True, "location_id": "auskunft*"},
+        ):
+            Data.COMPILED_PATH = Path(self.tempdir.name) / "nothing"
+            expected = Data.get_dataframe(self.WEEK, self.SOURCE_ID, **kwargs)
+            Data.COMPILED_PATH = Path(self.tempdir.name)
+            if not Data.is_compiled(self.WEEK, self.SOURCE_ID):
+                Data.compile(self.WEEK, self.SOURCE_ID)
+
+            pd.testing.assert_frame_equal(expected, Data.get_dataframe(self.WEEK, self.SOURCE_ID, **kwargs))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -30,6 +30,19 @@ class TestData(unittest.TestCase):
         # the rest must be datetimes
         [datetime.datetime.strptime(c, "%Y-%m-%d %H:%M:%S") for c in columns[3:]]
 
+    def test_get_table_iter(self):
+        columns, rows = Data.get_table((2021, 28), "bonn")
+        for kwargs in ({}, {"as_int": True}):
+            row_iter = Data.get_table_iter((2021, 28), "bonn", **kwargs)
+            self.assertEqual(len(rows), len(list(row_iter)))
+            # the file is closed at the end of the rows
+            self.assertTrue(row_iter.fp.closed)
+            self.assertEqual([], list(row_iter))
+
+        with Data.get_table_iter((2021, 28), "bonn") as row_iter:
+            self.assertEqual(rows[0], next(row_iter))
+        self.assertTrue(row_iter.fp.closed)
+
     def test_get_table_int_and_datetime(self):
         columns, rows = Data.get_table((2021, 28), "bonn", as_int=True, as_datetime=True)
         self.assertEqual(
@@ -93,6 +106,69 @@ class TestData(unittest.TestCase):
             df.index[0],
         )
 
+    def test_get_dataframe_dtype(self):
+        df = Data.get_dataframe((2021, 28), "bonn")
+        for dtype in ("bool", "uint8"):
+            df2 = Data.get_dataframe((2021, 28), "bonn", dtype=dtype)
+            self.assertEqual({np.dtype(dtype)}, set(df2.dtypes))
+            pd.testing.assert_frame_equal(df, df2.astype(np.int64))
+
+            df2 = Data.get_dataframe((2021, 28), "bonn", dtype=dtype, sparse=True)
+            self.assertEqual({pd.SparseDtype(dtype)}, set(df2.dtypes))
+            self.assertLess(df2.memory_usage().sum(), df.memory_usage().sum())
+            pd.testing.assert_frame_equal(df, df2.sparse.to_dense().astype(np.int64))
+
+    def test_get_dataframe_chunks(self):
+        df = Data.get_dataframe((2021, 28), "bonn", location_id="meldewesen")
+        chunks = list(Data.get_dataframe((2021, 28), "bonn", location_id="meldewesen", chunksize=100))
+        self.assertEqual((len(df) + 99) // 100, len(chunks))
+        self.assertTrue(all(len(c) <= 100 for c in chunks))
+        pd.testing.assert_frame_equal(df, pd.concat(chunks))
+
+        data = Data(source_id="bonn", iso_week=(2021, 28))
+        chunks = list(data.iter_dataframes(chunksize=1000))
+        self.assertEqual(
+            {((2021, 28), "bonn")},
+            set((week, source_id) for week, source_id, c in chunks),
+        )
+        pd.testing.assert_frame_equal(
+            Data.get_dataframe((2021, 28), "bonn"),
+            pd.concat([c for week, source_id, c in chunks]),
+        )
+
+    def test_dataframe(self):
+        data = Data(source_id="bonn", iso_week_gte=(2021, 28), iso_week_lte=(2021, 29))
+        expected = pd.concat([df for week, source_id, df in data.iter_dataframes()]).fillna(0).astype(np.int64)
+        expected = expected[sorted(expected.columns)]
+        df = data.dataframe()
+        pd.testing.assert_frame_equal(expected, df, check_freq=False)
+
+        df = data.dataframe(location_id="m*", dtype="bool")
+        self.assertEqual({"meldewesen"}, set(df.index.get_level_values("location_id")))
+        self.assertEqual({np.dtype(bool)}, set(df.dtypes))
+        pd.testing.assert_frame_equal(
+            Data.location_history("bonn", "m*", iso_week_gte=(2021, 28), iso_week_lte=(2021, 29), dtype="bool"),
+            df,
+        )
+
+        self.assertIsNone(Data(source_id="bonn", iso_week=(2000, 1)).dataframe())
+
+    def test_dataframe_plan(self):
+        # tables without compiled store or sidecar index are only decoded while filling
+        data = Data(source_id="bonn", iso_week_gte=(2021, 28), iso_week_lte=(2021, 29))
+        plan = data._plan_dataframe(None)
+        self.assertEqual(data.sources(), [(p["iso_week"], p["source_id"]) for p in plan])
+        for p in plan:
+            self.assertTrue(p["decode"])
+            self.assertNotIn("table", p)
+            self.assertEqual(len(Data.get_dataframe(p["iso_week"], p["source_id"])), p["num_rows"])
+
+        # the row counts are an upper bound if the locations are filtered
+        self.assertGreater(
+            sum(p["num_rows"] for p in data._plan_dataframe("m*")),
+            len(data.dataframe(location_id="m*")),
+        )
+
     def test_get_dataframe_no_datetime(self):
         df = Data.get_dataframe((2021, 28), "bonn", as_datetime=False)
         self.assertEqual(
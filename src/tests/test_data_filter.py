@@ -45,5 +45,65 @@ class TestDataFilter(unittest.TestCase):
             ).iter_files())
         )
 
+    def test_iter_files_streaming(self):
+        data = Data(source_id_not="wuppertalgw", iso_week_gte=(2026, 20), iso_week_lte=(2026, 22))
+        streamed = [
+            (week, source_id, fp.read())
+            for week, source_id, fp in data.iter_files()
+        ]
+        self.assertEqual(
+            [((2026, 20), "kaiserslauternausl"), ((2026, 20), "wuppertalgeo"),
+             ((2026, 21), "kaiserslauternausl"), ((2026, 21), "wuppertalgeo"),
+             ((2026, 22), "kaiserslauternausl"), ((2026, 22), "wuppertalgeo")],
+            [(week, source_id) for week, source_id, content in streamed]
+        )
+        self.assertEqual(
+            streamed,
+            [
+                (week, source_id, fp.read())
+                for week, source_id, fp in data.iter_files(streaming=False)
+            ]
+        )
+
+    def test_iter_files_prefetch(self):
+        data = Data(source_id_not="wuppertalgw", iso_week_gte=(2026, 20), iso_week_lte=(2026, 22))
+        streamed = [
+            (week, source_id, fp.read())
+            for week, source_id, fp in data.iter_files()
+        ]
+        for prefetch in (1, 4):
+            # the files stay readable
+            prefetched = list(data.iter_files(prefetch=prefetch))
+            self.assertEqual(streamed, [(week, source_id, fp.read()) for week, source_id, fp in prefetched])
+
+        # stop the background thread early
+        for week, source_id, fp in data.iter_files(prefetch=1):
+            break
+        self.assertEqual(streamed[0], (week, source_id, fp.read()))
+
+    def test_sources(self):
+        data = Data(source_id_not="wuppertalgw", iso_week_gte=(2026, 20), iso_week_lte=(2026, 22))
+        self.assertEqual(
+            [(week, source_id) for week, source_id, fp in data.iter_files()],
+            data.sources(),
+        )
+
+    def test_location_history(self):
+        weeks = [(2026, 16), (2026, 17), (2026, 18)]
+        expected = pd.concat([
+            Data.get_dataframe(week, "wuppertalgeo", location_id="b*")
+            for week in weeks
+        ]).fillna(0).astype(np.int64)
+        expected = expected.loc[:, sorted(expected.columns)]
+
+        for processes in (1, 2):
+            df = Data.location_history(
+                "wuppertalgeo", "b*", iso_week_gte=weeks[0], iso_week_lte=weeks[-1], processes=processes,
+            )
+            pd.testing.assert_frame_equal(expected, df, check_names=False)
+
+        self.assertIsNone(Data.location_history("wuppertalgeo", "nothing", iso_week_lte=weeks[-1]))
+
+
 if __name__ == "__main__":
     unittest.main()
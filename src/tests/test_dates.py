@@ -0,0 +1,52 @@
+import unittest
+
+from src.data import *
+from src.dates import strings_to_datetime64, slots_to_datetime64, to_datetime_index
+
+
+class TestDates(unittest.TestCase):
+
+    def test_strings_to_datetime64(self):
+        strings = ["2021-07-12 00:03:33", "2024-02-29 23:59:59", "1999-12-31 00:00:00"]
+        expected = [datetime.datetime.strptime(s, "%Y-%m-%d %H:%M:%S") for s in strings]
+
+        for func in (strings_to_datetime64, slots_to_datetime64):
+            dates = func(strings)
+            self.assertEqual(np.dtype("datetime64[s]"), dates.dtype)
+            self.assertEqual(expected, dates.tolist())
+            self.assertEqual(expected, func(np.array(strings, dtype=object)).tolist())
+
+        self.assertEqual([], strings_to_datetime64([]).tolist())
+
+    def test_strings_to_datetime64_invalid(self):
+        for s in (
+                "2021-02-29 00:00:00",
+                "2021-13-01 00:00:00",
+                "2021-07-12 24:00:00",
+                "2021-07-12T00:03:33",
+                "2021-07-12 00:03:3",
+                "2021-07-12 00:03:33.5",
+                "2021-07-12",
+        ):
+            with self.assertRaises(ValueError, msg=s):
+                strings_to_datetime64(["2021-07-12 00:03:33", s])
+
+    def test_to_datetime_index(self):
+        self.assertEqual(
+            [pd.Timestamp(2021, 7, 12, 0, 3, 33)],
+            to_datetime_index(["2021-07-12 00:03:33"]).to_list()
+        )
+        # other formats are handled by pandas
+        self.assertEqual(
+            [pd.Timestamp(2021, 7, 12)],
+            to_datetime_index(["2021-07-12"]).to_list()
+        )
+        for slots in (False, True):
+            self.assertEqual(
+                np.dtype("datetime64[ns]"),
+                to_datetime_index(["2021-07-12 00:03:33"], slots=slots).dtype,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
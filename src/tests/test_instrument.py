@@ -0,0 +1,82 @@
+import json
+import unittest
+import unittest.mock
+import tempfile
+
+from src.data import *
+from src import instrument
+from src.metrics_calc import calc_metrics
+
+
+class TestInstrument(unittest.TestCase):
+
+    def test_stage(self):
+        # nothing is recorded without a recorder
+        with instrument.stage("nothing"):
+            pass
+        self.assertFalse(instrument.is_recording())
+
+        with instrument.recording() as outer:
+            with instrument.stage("outer", rows=1):
+                with instrument.recording() as inner:
+                    with instrument.stage("inner", rows=2, cells=4):
+                        pass
+                    instrument.count("inner", rows=1)
+        self.assertFalse(instrument.is_recording())
+
+        self.assertEqual(["inner", "outer"], sorted(outer.stages))
+        self.assertEqual(["inner"], sorted(inner.stages))
+        self.assertEqual(1, outer.stages["outer"]["calls"])
+        self.assertEqual((3, 4), (inner.stages["inner"]["rows"], inner.stages["inner"]["cells"]))
+        self.assertGreaterEqual(outer.stages["outer"]["wall"], outer.stages["inner"]["wall"])
+        self.assertGreater(outer.stages["outer"]["peak_rss"], 0)
+
+        outer.merge(inner.to_dict())
+        self.assertEqual(2, outer.stages["inner"]["calls"])
+
+
+    def test_peak_rss(self):
+        max_rss = instrument.resource.getrusage(instrument.resource.RUSAGE_SELF).ru_maxrss
+        with unittest.mock.patch.object(instrument.sys, "platform", "linux"):
+            self.assertGreaterEqual(instrument._peak_rss(), max_rss * 1024)
+        # macOS reports bytes
+        with unittest.mock.patch.object(instrument.sys, "platform", "darwin"):
+            self.assertLess(instrument._peak_rss(), max_rss * 1024)
+        # no resource module on Windows
+        with unittest.mock.patch.object(instrument, "resource", None):
+            self.assertEqual(0, instrument._peak_rss())
+            with instrument.recording() as recorder:
+                with instrument.stage("stage"):
+                    pass
+            self.assertEqual(0, recorder.stages["stage"]["peak_rss"])
+    def test_trace_memory(self):
+        with instrument.recording(trace_memory=True) as recorder:
+            with instrument.stage("outer"):
+                with instrument.stage("inner"):
+                    data = bytearray(10_000_000)
+                del data
+                with instrument.stage("small"):
+                    pass
+        self.assertGreaterEqual(recorder.stages["inner"]["peak_traced"], 10_000_000)
+        self.assertGreaterEqual(recorder.stages["outer"]["peak_traced"], 10_000_000)
+        self.assertLess(recorder.stages["small"]["peak_traced"], 10_000_000)
+
+    def test_metrics(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            filename = Path(tempdir) / "report.json"
+            with instrument.recording(filename) as recorder:
+                calc_metrics(Data(iso_week=(2026, 16), source_id="wuppertalgeo"), engine="numpy")
+
+            with open(filename) as fp:
+                report = json.load(fp)
+
+        self.assertEqual(recorder.to_dict()["stages"], report["stages"])
+        for name in ("raw.read", "raw.parse", "metrics.numpy", "metrics.timespans", "metrics.dataframes"):
+            self.assertIn(name, report["stages"])
+        self.assertGreater(report["stages"]["raw.parse"]["rows"], 0)
+        self.assertEqual(report["stages"]["raw.parse"]["cells"], report["stages"]["metrics.numpy"]["cells"])
+        self.assertIn("raw.parse", recorder.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()
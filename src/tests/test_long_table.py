@@ -0,0 +1,62 @@
+import unittest
+
+from src.data import *
+from src.long_table import LongTable
+
+
+class TestLongTable(unittest.TestCase):
+
+    def expected_records(self, iso_week: IsoWeek, source_id: str, location_id: StringFilter = None) -> list:
+        df = Data.get_dataframe(iso_week, source_id, location_id=location_id)
+        rows, columns = np.nonzero(df.values)
+        return sorted(
+            (df.index[r][0], df.index[r][1], df.index[r][2], df.columns[c])
+            for r, c in zip(rows, columns)
+        )
+
+    def records(self, table: LongTable) -> list:
+        df = table.to_dataframe()
+        return sorted(
+            (pd.Timestamp(d), s, l, pd.Timestamp(sl))
+            for d, s, l, sl in zip(df["date"], df["source_id"], df["location_id"], df["slot"])
+        )
+
+    def test_get_long_table(self):
+        table = Data.get_long_table((2021, 28), "bonn")
+        self.assertEqual(self.expected_records((2021, 28), "bonn"), self.records(table))
+        self.assertEqual(["fuhrerscheinwesen", "kfz-zulassungswesen", "meldewesen"], table.location_ids.tolist())
+        self.assertEqual(np.dtype("datetime64[s]"), table.slots.dtype)
+
+        table = Data.get_long_table((2021, 28), "bonn", location_id="m*")
+        self.assertEqual(self.expected_records((2021, 28), "bonn", "m*"), self.records(table))
+
+    def test_concat(self):
+        tables = [
+            Data.get_long_table((2021, 28), "bonn", location_id="m*"),
+            Data.get_long_table((2021, 28), "bonn", location_id="f*"),
+            LongTable.empty(),
+        ]
+        table = LongTable.concat(tables)
+        self.assertEqual(sum(len(t) for t in tables), len(table))
+        self.assertEqual(
+            sorted(self.records(tables[0]) + self.records(tables[1])),
+            self.records(table),
+        )
+
+    def test_iter_long(self):
+        tables = list(Data(source_id="bonn", iso_week=(2021, 28)).iter_long())
+        self.assertEqual([((2021, 28), "bonn")], [(week, source_id) for week, source_id, table in tables])
+        self.assertEqual(self.expected_records((2021, 28), "bonn"), self.records(tables[0][2]))
+
+    def test_to_arrow(self):
+        table = Data.get_long_table((2021, 28), "bonn")
+        df = table.to_arrow().to_pandas()
+        self.assertEqual(len(table), len(df))
+        self.assertEqual(self.records(table), sorted(
+            (pd.Timestamp(d), s, l, pd.Timestamp(sl))
+            for d, s, l, sl in zip(df["date"], df["source_id"], df["location_id"], df["slot"])
+        ))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import json
+import unittest
+import unittest.mock
+import tempfile
+import shutil
+
+from src.data import *
+from src import manifest
+
+
+class TestManifest(unittest.TestCase):
+
+    WEEKS = ((2026, 20), (2026, 21))
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self._data_path = Data.PATH
+        self._metrics_path = Metrics.PATH
+
+        for name, path in (("raw", Data.PATH), ("metrics", Metrics.PATH)):
+            for week in self.WEEKS:
+                filename = Path(str(Data.tar_filename(week)).replace(str(Data.PATH), str(path)))
+                os.makedirs(Path(self.tempdir.name) / name / filename.parent.name, exist_ok=True)
+                shutil.copy(filename, Path(self.tempdir.name) / name / filename.parent.name / filename.name)
+
+        Data.PATH = Path(self.tempdir.name) / "raw"
+        Metrics.PATH = Path(self.tempdir.name) / "metrics"
+
+    def tearDown(self):
+        Data.PATH = self._data_path
+        Metrics.PATH = self._metrics_path
+        self.tempdir.cleanup()
+
+    def test_raw_manifest(self):
+        expected_sources = Data().sources()
+        expected_files = [
+            (week, source_id, fp.read())
+            for week, source_id, fp in Data(source_id="wuppertalgeo").iter_files()
+        ]
+
+        manifest.update_manifest(Data.PATH, manifest.build_raw_entry)
+        entry = manifest.week_entry(Data.PATH, "2026-20")
+        self.assertEqual(
+            [source_id for week, source_id in expected_sources if week == (2026, 20)],
+            [m["source_id"] for m in entry["members"]],
+        )
+        for member in entry["members"]:
+            df = Data.get_dataframe((2026, 20), member["source_id"], as_datetime=False)
+            self.assertEqual(len(df), member["num_rows"])
+            self.assertEqual(len(df.columns), member["num_slots"])
+            self.assertEqual(
+                sorted(df.index.get_level_values("location_id").unique()),
+                member["locations"],
+            )
+            if len(df):
+                self.assertEqual(df.index.get_level_values("date").max(), member["max_date"])
+            self.assertEqual(
+                slots_to_datetime64(df.columns).tolist(),
+                manifest.runs_to_slots(member["slots"]).tolist(),
+            )
+
+        self.assertEqual(expected_sources, Data().sources())
+        self.assertEqual(
+            expected_files,
+            [
+                (week, source_id, fp.read())
+                for week, source_id, fp in Data(source_id="wuppertalgeo").iter_files()
+            ]
+        )
+        self.assertEqual([], list(Data(source_id="frankfurt").iter_files()))
+
+        # archives added after the manifest are found without an entry
+        shutil.copy(Data.tar_filename((2026, 20)), Data.PATH / "2026" / "2026-30.tar.gz")
+        self.assertEqual(list(self.WEEKS) + [(2026, 30)], [f[0] for f in Data().compressed_files()])
+        self.assertIsNone(manifest.week_entry(Data.PATH, "2026-30"))
+        self.assertEqual(
+            [source_id for week, source_id in expected_sources if week == (2026, 20)],
+            [source_id for week, source_id in Data(iso_week=(2026, 30)).sources()],
+        )
+        pd.testing.assert_frame_equal(
+            Data.get_dataframe((2026, 20), "wuppertalgeo"),
+            Data.get_dataframe((2026, 30), "wuppertalgeo"),
+        )
+        manifest.update_manifest(Data.PATH, manifest.build_raw_entry)
+        self.assertIsNotNone(manifest.week_entry(Data.PATH, "2026-30"))
+        self.assertEqual(list(self.WEEKS) + [(2026, 30)], [f[0] for f in Data().compressed_files()])
+
+        # a changed archive invalidates its entry
+        shutil.copy(Data.tar_filename((2026, 21)), Data.tar_filename((2026, 30)))
+        self.assertIsNone(manifest.week_entry(Data.PATH, "2026-30"))
+
+    def test_slots_to_runs(self):
+        slots = ["2021-07-12 08:00:00", "2021-07-12 08:05:00", "2021-07-12 08:10:00",
+                 "2021-07-13 08:00:00", "2021-07-12 07:00:00", "2021-07-12 07:30:00"]
+        runs = manifest.slots_to_runs(slots)
+        self.assertEqual(
+            [["2021-07-12 08:00:00", 300, 3], ["2021-07-13 08:00:00", -90000, 2], ["2021-07-12 07:30:00", 0, 1]],
+            runs,
+        )
+        self.assertEqual(slots, datetime64_to_strings(manifest.runs_to_slots(runs)))
+        self.assertEqual([], manifest.slots_to_runs([]))
+        self.assertIsNone(manifest.slots_to_runs(["2021-07-12"]))
+
+    def test_dataframe_plan(self):
+        data = Data(source_id="wupp*")
+        expected = data.dataframe(location_id="*a*")
+
+        # with the manifest, the archives are only read once while filling
+        manifest.update_manifest(Data.PATH, manifest.build_raw_entry)
+        with unittest.mock.patch.object(Data, "iter_files", autospec=True, side_effect=Data.iter_files) as iter_files:
+            df = data.dataframe(location_id="*a*")
+        self.assertEqual(len(self.WEEKS), iter_files.call_count)
+        pd.testing.assert_frame_equal(expected, df)
+
+        # a manifest of a previous version is rebuilt
+        filename = manifest.manifest_filename(Data.PATH)
+        previous = json.loads(filename.read_text())
+        for entry in previous["weeks"].values():
+            for member in entry["members"]:
+                del member["slots"]
+        del previous["version"]
+        filename.write_text(json.dumps(previous))
+        pd.testing.assert_frame_equal(expected, data.dataframe(location_id="*a*"))
+        self.assertEqual(manifest.MANIFEST_VERSION, manifest.update_manifest(Data.PATH, manifest.build_raw_entry)["version"])
+        self.assertIn("slots", manifest.week_entry(Data.PATH, "2026-20")["members"][0])
+
+    def test_metrics_manifest(self):
+        queries = (
+            dict(),
+            dict(type="free_dates"),
+            dict(type="nothing"),
+            dict(source_id="wuppertalgw", type="free_dates_*"),
+            dict(source_id="nothing"),
+        )
+        expected = [Metrics.dataframe(**q) for q in queries]
+
+        manifest.update_manifest(Metrics.PATH, manifest.build_metrics_entry)
+        entry = manifest.week_entry(Metrics.PATH, "2026-20")
+        self.assertEqual(49, len(entry["members"]))
+        pd.testing.assert_index_equal(
+            expected[0].loc["2026-05-11":"2026-05-17"].index,
+            manifest.runs_to_dates(entry["dates"]).rename("date"),
+        )
+
+        for query, df in zip(queries, expected):
+            if df is None:
+                self.assertIsNone(Metrics.dataframe(**query))
+            else:
+                pd.testing.assert_frame_equal(df, Metrics.dataframe(**query), check_dtype=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from io import BytesIO
+
+from src.data import *
+from src.matrix import parse_block
+from src import instrument
+
+
+CSV = (
+    b"date,source_id,location_id,2021-07-12 08:00:00,2021-07-12 08:05:00,2021-07-12 08:10:00\r\n"
+    b"2021-07-12 00:04:23,jena,197,1,,1\r\n"
+    b"2021-07-12 00:04:23,jena,198,,1,\r\n"
+    b"2021-07-12 00:19:27,jena,197,,,\r\n"
+    b"2021-07-12 00:19:27,jena,1,1,1,1\r\n"
+)
+SLOTS = ["2021-07-12 08:00:00", "2021-07-12 08:05:00", "2021-07-12 08:10:00"]
+
+
+class TestMatrix(unittest.TestCase):
+
+    def test_parse_block(self):
+        table = parse_block(CSV.split(b"\n", 1)[1], SLOTS)
+        self.assertEqual(
+            [[1, 0, 1], [0, 1, 0], [0, 0, 0], [1, 1, 1]],
+            table.matrix.astype(int).tolist()
+        )
+        self.assertEqual(["2021-07-12 00:04:23"] * 2 + ["2021-07-12 00:19:27"] * 2, table.dates.tolist())
+        self.assertEqual(["jena"] * 4, table.source_ids.tolist())
+        self.assertEqual(["197", "198", "197", "1"], table.location_ids.tolist())
+
+        # without carriage returns
+        table2 = parse_block(CSV.split(b"\n", 1)[1].replace(b"\r", b""), SLOTS)
+        self.assertEqual(table.matrix.tolist(), table2.matrix.tolist())
+
+    def test_parse_block_invalid(self):
+        lines = CSV.split(b"\n", 1)[1]
+        self.assertIsNone(parse_block(lines.replace(b",1,,1", b",1,,11"), SLOTS))
+        self.assertIsNone(parse_block(lines.replace(b",1,,1", b",1,x,"), SLOTS))
+        self.assertIsNone(parse_block(lines.replace(b",1,,1", b",1,,1,"), SLOTS))
+        self.assertIsNone(parse_block(lines.replace(b"jena,197", b"\"jena\",197"), SLOTS))
+        self.assertIsNone(parse_block(lines.rstrip(b"\n"), SLOTS))
+
+    def test_row_iter(self):
+        for data in (CSV, CSV.replace(b"jena,198", b"\"jena\",198")):
+            for kwargs in (
+                    {"as_int": True},
+                    {"as_int": True, "location_id": "197"},
+                    {"as_int": True, "as_datetime": True},
+            ):
+                fast = list(Data.RowIter(BytesIO(data), **kwargs))
+                # the csv path is used for 'empty'
+                reference = [
+                    row[:3] + [int(v) for v in row[3:]]
+                    for row in Data.RowIter(BytesIO(data), empty="0", **kwargs)
+                ]
+                self.assertEqual(reference, fast)
+
+        # chunks across block boundaries
+        data = CSV + CSV.split(b"\n", 1)[1] * 19
+        row_iter = Data.RowIter(BytesIO(data))
+        row_iter.BLOCK_SIZE = 100
+        chunks = list(row_iter.iter_matrices(3))
+        self.assertEqual([3] * 26 + [2], [len(c) for c in chunks])
+        self.assertEqual(
+            Data.RowIter(BytesIO(data)).read_matrix().matrix.tolist(),
+            np.concatenate([c.matrix for c in chunks]).tolist(),
+        )
+
+        table = Data.RowIter(BytesIO(CSV), location_id="19*").read_matrix()
+        self.assertEqual(["197", "198", "197"], table.location_ids.tolist())
+        self.assertEqual(SLOTS, table.slots.tolist())
+        self.assertEqual((3, 3), table.matrix.shape)
+
+    def test_row_iter_location_filter(self):
+        lines = CSV.split(b"\n", 1)[1] * 5
+        for data in (
+                CSV + lines,
+                # a quoted location switches off the filtering of the raw lines
+                CSV + lines + b"2021-07-12 00:34:27,jena,\"197\",1,1,\r\n" + lines,
+        ):
+            rows = list(Data.RowIter(BytesIO(data)))
+            for location_id in ("197", ["1", "19?"], ("[!1]*", "198"), [], "nothing", lambda s: s.endswith("8")):
+                accept = location_id if callable(location_id) else lambda s: any(
+                    fnmatch.fnmatchcase(s, p) for p in ([location_id] if isinstance(location_id, str) else location_id)
+                )
+                expected = [row for row in rows if accept(row[2])]
+
+                for block_size in (40, 1 << 22):
+                    for kwargs in ({}, {"as_int": True}):
+                        row_iter = Data.RowIter(BytesIO(data), location_id=location_id, **kwargs)
+                        row_iter.BLOCK_SIZE = block_size
+                        filtered = list(row_iter)
+                        if kwargs:
+                            filtered = [row[:3] + ["1" if v else "" for v in row[3:]] for row in filtered]
+                        self.assertEqual(expected, filtered)
+
+                    row_iter = Data.RowIter(BytesIO(data), location_id=location_id)
+                    row_iter.BLOCK_SIZE = block_size
+                    table = row_iter.read_matrix()
+                    self.assertEqual([row[2] for row in expected], table.location_ids.tolist())
+
+        # rejected rows are not parsed
+        with instrument.recording() as recorder:
+            Data.RowIter(BytesIO(CSV + lines), location_id="198").read_matrix()
+        self.assertEqual(24, recorder.stages["raw.prefilter"]["rows"])
+        self.assertEqual(6, recorder.stages["raw.parse"]["rows"])
+
+
+if __name__ == "__main__":
+    unittest.main()
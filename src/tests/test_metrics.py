@@ -1,7 +1,13 @@
+import shutil
+import tempfile
 import unittest
+import unittest.mock
 
 from src.data import *
-from src.metrics_calc import TimespanChecker, calc_metrics
+from src import metrics_calc, archive_index
+from src.metrics_calc import (
+    TimespanChecker, TimespanTable, TableSummary, calc_metrics, calc_state, METRIC_NAMES, METRIC_TIMESPANS,
+)
 
 
 class TestMetrics(unittest.TestCase):
@@ -36,6 +42,142 @@ class TestMetrics(unittest.TestCase):
         self.assertTimespan("0w", "2000-01-01 00:00:00", "2000-01-02 23:59:59", True)
         self.assertTimespan("1w", "2000-01-01 00:00:00", "2000-01-03 00:00:00", True)
 
+    def test_timespan_table(self):
+        dates = [
+            f"2000-01-{day:02} {hour:02}:{minute:02}:00"
+            for day in range(1, 32, 3)
+            for hour in range(0, 24, 5)
+            for minute in (0, 30)
+        ]
+        table = TimespanTable(dates)
+        checker = TimespanChecker()
+        for timestamp in ("1999-12-27 00:00:00", "2000-01-01 00:45:00", "2000-01-03 23:15:00"):
+            bucket = table.to_bucket(to_datetime(timestamp))
+            for i, date in enumerate(dates):
+                self.assertEqual(
+                    sorted(checker.test_date(timestamp, date)),
+                    sorted(table.timespans(bucket, i)),
+                    f"timespans of {timestamp} {date}",
+                )
+
+            row = [i % 3 == 0 for i in range(len(dates))]
+            expected = checker.test_row(timestamp, dates, row)
+            self.assertEqual(
+                [expected[ts] for ts in METRIC_TIMESPANS],
+                table.count_row(bucket, row).tolist(),
+            )
+            self.assertEqual(
+                [[expected[ts] for ts in METRIC_TIMESPANS]],
+                table.count(np.array([bucket]), np.array([row])).tolist(),
+            )
+
+    def test_engines_equal(self):
+        stashes = {"python": dict(), "numpy": dict()}
+        for week in ((2026, 16), (2026, 17)):
+            data = Data(iso_week=week, source_id="wuppertalgeo")
+            results = {
+                engine: calc_metrics(data, stash=stash, engine=engine)
+                for engine, stash in stashes.items()
+            }
+            self.assertEqual(list(METRIC_NAMES), list(results["numpy"]))
+            for name in METRIC_NAMES:
+                self.assertEqual(
+                    results["python"][name].to_csv(), results["numpy"][name].to_csv(),
+                    f"Metric {name} differs in week {week}",
+                )
+
+        self.assertEqual(stashes["python"], stashes["numpy"])
+
+    def test_python_engine_chunks(self):
+        data = Data(iso_week=(2026, 16), source_id="wuppertalgeo")
+        summaries = {"python": dict(), "numpy": dict()}
+        # the python engine steps through the table in chunks
+        with unittest.mock.patch.object(metrics_calc, "TABLE_CHUNKSIZE", 7):
+            results = {
+                engine: calc_metrics(data, engine=engine, table_summaries=table_summaries)
+                for engine, table_summaries in summaries.items()
+            }
+        for name in METRIC_NAMES:
+            self.assertEqual(results["python"][name].to_csv(), results["numpy"][name].to_csv())
+        self.assertEqual(summaries["numpy"], summaries["python"])
+        self.assertEqual([((2026, 16), "wuppertalgeo")], list(summaries["python"]))
+
+    def test_parallel_sources(self):
+        for engine in ("python", "numpy"):
+            stashes = {1: dict(), 2: dict()}
+            for week in ((2026, 16), (2026, 17)):
+                data = Data(iso_week=week)
+                results = {
+                    processes: calc_metrics(data, stash=stash, engine=engine, processes=processes)
+                    for processes, stash in stashes.items()
+                }
+                for name in METRIC_NAMES:
+                    self.assertEqual(
+                        results[1][name].to_csv(), results[2][name].to_csv(),
+                        f"Metric {name} differs in week {week} with engine {engine}",
+                    )
+
+            self.assertEqual(stashes[1], stashes[2])
+
+    def test_parallel_sources_index(self):
+        weeks = ((2026, 16), (2026, 17))
+        expected = calc_metrics(Data(iso_week_gte=weeks[0], iso_week_lte=weeks[1]), engine="numpy")
+
+        data_path = Data.PATH
+        with tempfile.TemporaryDirectory() as tempdir:
+            for week in weeks:
+                filename = Data.tar_filename(week)
+                (Path(tempdir) / filename.parent.name).mkdir(exist_ok=True)
+                shutil.copy(filename, Path(tempdir) / filename.parent.name / filename.name)
+            Data.PATH = Path(tempdir)
+            try:
+                # only the first week can be read in parallel, the other one is streamed
+                archive_index.build_index(Data.tar_filename(weeks[0]))
+                with unittest.mock.patch.object(
+                        Data, "iter_tables_iter", autospec=True, side_effect=Data.iter_tables_iter,
+                ) as iter_tables_iter:
+                    results = calc_metrics(Data(), engine="numpy", processes=2)
+                self.assertEqual([weeks[1]], [c[0][0].iso_week for c in iter_tables_iter.call_args_list])
+            finally:
+                Data.PATH = data_path
+
+        for name in METRIC_NAMES:
+            self.assertEqual(expected[name].to_csv(), results[name].to_csv(), name)
+
+    def test_calc_state(self):
+        metrics_stash, state_stash = dict(), dict()
+        for week in ((2026, 16), (2026, 17)):
+            data = Data(iso_week=week, source_id="wuppertalgw")
+            calc_metrics(data, stash=metrics_stash, engine="numpy")
+            calc_state(data, stash=state_stash)
+            self.assertEqual(metrics_stash["locations"], state_stash["locations"])
+
+    def test_table_summary(self):
+        columns, rows = Data.get_table((2026, 16), "wuppertalgeo")
+        changes, previous = 0, dict()
+        for row in rows:
+            if row[2] in previous and previous[row[2]] != row[3:]:
+                changes += 1
+            previous[row[2]] = row[3:]
+        expected = {
+            "num_locations": len(set(row[2] for row in rows)),
+            "num_snapshots": len(set(row[0] for row in rows)),
+            "num_changes": changes,
+            "min_date": min(row[0] for row in rows),
+            "max_date": max(row[0] for row in rows),
+        }
+        self.assertGreater(changes, 0)
+
+        with Data.open_file((2026, 16), "wuppertalgeo") as fp:
+            table = Data.RowIter(fp).read_matrix()
+        self.assertEqual(expected, TableSummary.from_table(table))
+
+        # the result does not depend on the size of the blocks
+        summary = TableSummary()
+        for start in range(0, len(table), 7):
+            summary.add(table.select(slice(start, start + 7)))
+        self.assertEqual(expected, summary.to_dict())
+
     def X_test_metrics(self):
         # something that does not exist returns None
         df = Metrics.dataframe("appointments", iso_week_lte=(2000, 1))
@@ -0,0 +1,75 @@
+import unittest
+from io import BytesIO
+
+import numpy as np
+
+from src.metrics_state import LocationState, SlotBitsets, save_locations, load_locations, load_meta
+
+
+class TestMetricsState(unittest.TestCase):
+
+    def test_split_update(self):
+        state = LocationState(
+            free_dates=np.array([10, 20, 30, 40], dtype=np.int64),
+            appointed_dates=np.array([5, 25], dtype=np.int64),
+        )
+        slots = np.array([20, 25, 30, 35], dtype=np.int64)
+
+        free, appointed, other_free_dates = state.split(slots)
+        self.assertEqual([True, False, True, False], free.tolist())
+        self.assertEqual([False, True, False, False], appointed.tolist())
+        self.assertEqual([10, 40], other_free_dates.tolist())
+
+        state.update(
+            slots,
+            free=np.array([False, True, False, True]),
+            appointed=np.array([True, False, True, False]),
+            other_free_dates=other_free_dates,
+        )
+        self.assertEqual([10, 25, 35, 40], state.free_dates.tolist())
+        self.assertEqual([5, 20, 30], state.appointed_dates.tolist())
+
+    def test_bitsets(self):
+        slots = np.array([20, 30, 40], dtype=np.int64)
+
+        bits = SlotBitsets(LocationState(free_dates=np.array([20, 30, 40], dtype=np.int64)), slots)
+        self.assertEqual(0b111, bits.free)
+        self.assertTrue(bits.is_boundary(0))
+        self.assertFalse(bits.is_boundary(1))
+        self.assertTrue(bits.is_boundary(2))
+
+        bits = SlotBitsets(LocationState(free_dates=np.array([10, 30, 50], dtype=np.int64)), slots)
+        self.assertEqual(0b010, bits.free)
+        self.assertFalse(bits.is_boundary(1))
+
+        # a single free date is not a boundary
+        bits = SlotBitsets(LocationState(free_dates=np.array([30], dtype=np.int64)), slots)
+        self.assertFalse(bits.is_boundary(1))
+
+        state = LocationState()
+        bits.free, bits.appointed = 0b101, 0b010
+        bits.store(state, slots)
+        self.assertEqual([20, 40], state.free_dates.tolist())
+        self.assertEqual([30], state.appointed_dates.tolist())
+
+    def test_save_load(self):
+        locations = {
+            "a/1": LocationState(
+                free_dates=np.array([1, 2, 3], dtype=np.int64),
+                appointed_dates=np.array([4], dtype=np.int64),
+                timestamp=900,
+            ),
+            "a/2": LocationState(),
+            "b/1": LocationState(free_dates=np.array([5], dtype=np.int64), timestamp=0),
+        }
+        file = BytesIO()
+        save_locations(locations, file, meta={"key": "abc"})
+        file.seek(0)
+        self.assertEqual(locations, load_locations(file))
+        file.seek(0)
+        self.assertEqual({"key": "abc"}, load_meta(file))
+
+        file = BytesIO()
+        save_locations({}, file)
+        file.seek(0)
+        self.assertEqual({}, load_locations(file))
@@ -0,0 +1,257 @@
+import io
+import json
+import os
+import unittest
+import unittest.mock
+import tempfile
+import shutil
+
+from src.data import *
+from src import prepare_release, metrics_columnar
+from src.metrics_state import save_locations
+
+
+class TestPrepareRelease(unittest.TestCase):
+
+    WEEKS = ((2026, 16), (2026, 17), (2026, 18))
+    SOURCE_ID = "wuppertalgeo"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self._data_path = Data.PATH
+        self._compiled_path = Data.COMPILED_PATH
+        self._metrics_path = prepare_release.METRICS_PATH
+        self._metrics_data_path = Metrics.PATH
+
+        raw_path = Path(self.tempdir.name) / "raw"
+        for week in self.WEEKS:
+            filename = Data.tar_filename(week)
+            os.makedirs(raw_path / filename.parent.name, exist_ok=True)
+            shutil.copy(filename, raw_path / filename.parent.name / filename.name)
+
+        Data.PATH = raw_path
+        Data.COMPILED_PATH = Path(self.tempdir.name) / "compiled"
+        prepare_release.METRICS_PATH = Metrics.PATH = Path(self.tempdir.name) / "metrics"
+
+    def tearDown(self):
+        Data.PATH = self._data_path
+        Data.COMPILED_PATH = self._compiled_path
+        prepare_release.METRICS_PATH = self._metrics_path
+        Metrics.PATH = self._metrics_data_path
+        self.tempdir.cleanup()
+
+    def read_metrics(self) -> Dict[IsoWeek, Dict[str, bytes]]:
+        metrics = dict()
+        for week in self.WEEKS:
+            with tarfile.open(prepare_release.metrics_filename(week)) as tf:
+                metrics[week] = {
+                    member.name: tf.extractfile(member).read()
+                    for member in tf.getmembers()
+                }
+        return metrics
+
+    def test_checkpoints(self):
+        prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+        expected = self.read_metrics()
+        for week in self.WEEKS:
+            self.assertTrue(prepare_release.checkpoint_filename(week).exists())
+
+        # recalculate a single week from the previous checkpoint
+        prepare_release.metrics_filename(self.WEEKS[1]).unlink()
+        prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+        self.assertEqual(expected, self.read_metrics())
+
+        # recalculate the last weeks in parallel with a missing checkpoint
+        for week in self.WEEKS[1:]:
+            prepare_release.metrics_filename(week).unlink()
+        prepare_release.checkpoint_filename(self.WEEKS[0]).unlink()
+        prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy", processes=2)
+        self.assertEqual(expected, self.read_metrics())
+
+        # outdated checkpoints are recalculated
+        save_locations({}, prepare_release.checkpoint_filename(self.WEEKS[0]), meta={"key": "outdated"})
+        for week in self.WEEKS[1:]:
+            prepare_release.metrics_filename(week).unlink()
+        prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+        self.assertEqual(expected, self.read_metrics())
+
+    def test_checkpoints_replay(self):
+        prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+        expected = self.read_metrics()
+
+        # the states are only replayed from the last checkpoint before the calculated week
+        prepare_release.checkpoint_filename(self.WEEKS[0]).unlink()
+        prepare_release.metrics_filename(self.WEEKS[2]).unlink()
+        with unittest.mock.patch.object(prepare_release, "calc_state") as calc_state:
+            prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+            calc_state.assert_not_called()
+        self.assertEqual(expected, self.read_metrics())
+
+        # the missing checkpoints can be built ahead
+        for week in self.WEEKS:
+            prepare_release.checkpoint_filename(week).unlink(missing_ok=True)
+        prepare_release.update_checkpoints(source_id=self.SOURCE_ID)
+        for week in self.WEEKS:
+            self.assertTrue(prepare_release.checkpoint_filename(week).exists())
+        prepare_release.metrics_filename(self.WEEKS[2]).unlink()
+        with unittest.mock.patch.object(prepare_release, "calc_state") as calc_state:
+            prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+            calc_state.assert_not_called()
+        self.assertEqual(expected, self.read_metrics())
+
+    def test_build_state(self):
+        self.assertEqual(list(self.WEEKS), prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy"))
+        self.assertEqual([], prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy"))
+
+        # metrics from before the build state are kept
+        prepare_release.build_state_filename().unlink()
+        self.assertEqual([], prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy"))
+
+        # a changed raw archive recalculates its week and all following weeks
+        filename = Data.tar_filename(self.WEEKS[1])
+        with tarfile.open(filename) as tf:
+            members = [(member, tf.extractfile(member).read()) for member in tf.getmembers()]
+        with tarfile.open(filename, "w:gz") as tf:
+            for member, content in members[:-1]:
+                tf.addfile(member, io.BytesIO(content))
+        self.assertEqual(
+            list(self.WEEKS[1:]),
+            prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy"),
+        )
+
+        # a new metrics version recalculates everything
+        with unittest.mock.patch.object(prepare_release, "METRICS_VERSION", -1):
+            self.assertEqual(
+                list(self.WEEKS),
+                prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy"),
+            )
+            self.assertEqual(-1, prepare_release.load_build_state()["version"])
+
+    def test_weekly_summary(self):
+        filename = Path(self.tempdir.name) / "summary-weekly.csv"
+        with unittest.mock.patch.object(prepare_release, "SNAPSHOTS_WEEKLY_FILE", filename):
+            prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+            self.assertTrue(prepare_release.update_weekly_summary())
+            expected = filename.read_text()
+            self.assertFalse(prepare_release.update_weekly_summary())
+
+            # only the changed week and the following weeks are recalculated
+            state = prepare_release.load_build_state()
+            state["weeks"][Data.iso_week_to_string(self.WEEKS[1])]["summary"] = "outdated"
+            prepare_release.save_build_state(state)
+            with unittest.mock.patch.object(
+                    prepare_release, "calc_weekly_summary", wraps=prepare_release.calc_weekly_summary,
+            ) as calc:
+                self.assertTrue(prepare_release.update_weekly_summary())
+                self.assertEqual(self.WEEKS[1], calc.call_args[0][0].iso_week_gte)
+            self.assertEqual(expected, filename.read_text())
+
+            # a week without rows is summarized once
+            filename_empty = Data.PATH / "2026" / "2026-19.tar.gz"
+            with tarfile.open(filename_empty, "w:gz"):
+                pass
+            self.assertTrue(prepare_release.update_weekly_summary())
+            self.assertFalse(prepare_release.update_weekly_summary())
+            self.assertEqual(expected, filename.read_text())
+            filename_empty.unlink()
+
+        # the tables summarized by the metrics calculation are not read again
+        table_summaries = dict()
+        prepare_release.update_metrics(engine="numpy", force_recalc=True, table_summaries=table_summaries)
+        self.assertEqual(set(Data().sources()), set(table_summaries))
+        expected = prepare_release.calc_weekly_summary(Data())
+        with unittest.mock.patch.object(prepare_release, "_read_table_summary") as read:
+            df = prepare_release.calc_weekly_summary(Data(), table_summaries=table_summaries)
+            read.assert_not_called()
+        pd.testing.assert_frame_equal(expected, df)
+
+    def test_profile(self):
+        profile_path = Path(self.tempdir.name) / "profile"
+        for processes in (1, 2):
+            prepare_release.update_metrics(
+                source_id=self.SOURCE_ID, engine="numpy", force_recalc=True,
+                processes=processes, profile_path=profile_path,
+            )
+            for week in self.WEEKS:
+                with open(prepare_release.profile_filename(profile_path, week)) as fp:
+                    report = json.load(fp)
+                for name in ("raw.parse", "metrics.numpy", "store.to_csv", "store.gzip"):
+                    self.assertIn(name, report["stages"])
+
+    def test_compiled(self):
+        prepare_release.update_archive_indices()
+        prepare_release.update_compiled()
+        for iso_week, source_id in Data().sources():
+            self.assertTrue(Data.is_compiled(iso_week, source_id))
+
+        # only the missing stores are compiled, without decompressing the archives
+        shutil.rmtree(Data.compiled_path(self.WEEKS[1], self.SOURCE_ID))
+        with unittest.mock.patch.object(Data, "compile", wraps=Data.compile) as compile, \
+                unittest.mock.patch.object(Data, "iter_files") as iter_files:
+            prepare_release.update_compiled()
+        compile.assert_called_once_with(self.WEEKS[1], self.SOURCE_ID)
+        iter_files.assert_not_called()
+        self.assertTrue(Data.is_compiled(self.WEEKS[1], self.SOURCE_ID))
+
+    def assert_filtered_metrics(self, columnar: bool):
+        df = Metrics.dataframe(columnar=columnar)
+        df_filtered = Metrics.dataframe(
+            location_id=["b*", "f*"], source_id_not="nothing", columnar=columnar,
+        )
+        self.assertEqual(
+            [c for c in df.columns if c.split("/")[1][0] in "bf"],
+            list(df_filtered.columns),
+        )
+        pd.testing.assert_frame_equal(df.loc[:, df_filtered.columns], df_filtered)
+
+    def test_metrics_filters(self):
+        prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+        # only the csv columns of the matching locations are parsed
+        self.assert_filtered_metrics(columnar=False)
+
+        df = Metrics.dataframe(columnar=False)
+        df_filtered = Metrics.dataframe(type="free_dates", iso_week_gte=self.WEEKS[1], columnar=False)
+        self.assertEqual(
+            [c for c in df.columns if c.endswith("/free_dates")],
+            list(df_filtered.columns),
+        )
+        pd.testing.assert_frame_equal(
+            df.loc[df_filtered.index, df_filtered.columns],
+            df_filtered,
+        )
+        self.assertGreaterEqual(df_filtered.index.min(), pd.Timestamp("2026-04-20"))
+        self.assertEqual(0, len(Metrics.dataframe(location_id="nothing", columnar=False).columns))
+
+    def test_metrics_index_name(self):
+        prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+        self.assertEqual("date", Metrics.dataframe(columnar=False).index.name)
+
+        prepare_release.update_metrics_manifest()
+        prepare_release.update_columnar()
+        for columnar in (False, True):
+            for kwargs in (dict(), dict(location_id="nothing"), dict(type="changed", iso_week=self.WEEKS[1])):
+                self.assertEqual("date", Metrics.dataframe(columnar=columnar, **kwargs).index.name, kwargs)
+
+    def test_columnar(self):
+        prepare_release.update_metrics(source_id=self.SOURCE_ID, engine="numpy")
+        prepare_release.update_columnar()
+        for week in self.WEEKS:
+            self.assertTrue(metrics_columnar.is_columnar_valid(prepare_release.metrics_filename(week)))
+
+        for kwargs in (
+                dict(),
+                dict(type="free_dates_*", as_int=True),
+                dict(location_id="bescheinigungen", iso_week_gte=self.WEEKS[1]),
+                dict(location_id_not="*karten*", type=["changed", "appointments_*"]),
+        ):
+            expected = Metrics.dataframe(columnar=False, **kwargs)
+            df = Metrics.dataframe(**kwargs)
+            self.assertGreater(len(df), 0)
+            pd.testing.assert_frame_equal(expected, df, check_dtype=False)
+
+        # filters are applied while reading but give the same result
+        self.assert_filtered_metrics(columnar=True)
+
+        # a changed metrics archive invalidates the columnar file
+        shutil.copy(prepare_release.metrics_filename(self.WEEKS[0]), prepare_release.metrics_filename(self.WEEKS[1]))
+        self.assertFalse(metrics_columnar.is_columnar_valid(prepare_release.metrics_filename(self.WEEKS[1])))
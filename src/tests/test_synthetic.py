@@ -0,0 +1,83 @@
+import unittest
+import tempfile
+
+from src.data import *
+from src import synthetic, benchmark
+
+
+class TestSynthetic(unittest.TestCase):
+
+    KWARGS = dict(sources=3, locations=2, slots=50, snapshot_minutes=60, weeks=2, compresslevel=1)
+
+    def test_generate(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = Path(tempdir)
+            stats = synthetic.generate(path / "small" / "raw", **self.KWARGS)
+            self.assertEqual(["2021-28", "2021-29"], stats["weeks"])
+            self.assertEqual(2 * 3 * 2 * 7 * 24, stats["rows"])
+            self.assertEqual(stats["rows"] * 50, stats["cells"])
+            self.assertLess(0, stats["free_cells"])
+            self.assertLess(stats["free_cells"], stats["cells"] * synthetic.TODAY["free"])
+
+            # existing data is not generated again
+            self.assertEqual(stats, synthetic.generate(path / "small" / "raw", **self.KWARGS))
+
+            with benchmark.data_path(path / "small"):
+                self.assertEqual("Synthetic source source0", Data.get_meta("source0", "name"))
+                sources = Data().sources()
+                self.assertEqual(
+                    [((2021, 28), "source0"), ((2021, 28), "source1"), ((2021, 28), "source2"),
+                     ((2021, 29), "source0"), ((2021, 29), "source1"), ((2021, 29), "source2")],
+                    sources,
+                )
+                tables = [Data.get_dataframe(*s) for s in sources]
+                self.assertEqual(stats["rows"], sum(df.shape[0] for df in tables))
+                self.assertEqual(stats["cells"], sum(df.size for df in tables))
+                self.assertEqual(stats["free_cells"], sum(int(df.values.sum()) for df in tables))
+                self.assertEqual(
+                    ["location0", "location1"],
+                    sorted(tables[0].index.get_level_values("location_id").unique()),
+                )
+
+                # slots in the past are never free
+                df = tables[0]
+                dates = df.index.get_level_values("date").values
+                self.assertFalse((df.values.astype(bool) & (df.columns.values[None, :] <= dates[:, None])).any())
+
+            # a larger scale only adds sources
+            synthetic.generate(path / "large" / "raw", **{**self.KWARGS, "sources": 4})
+            with benchmark.data_path(path / "large"):
+                pd.testing.assert_frame_equal(tables[0], Data.get_dataframe(*sources[0]))
+                self.assertEqual(8, len(Data().sources()))
+
+    def test_benchmark(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            report = benchmark.run_benchmark(
+                scales=(1, 2), cases=["get_table", "metrics_dataframe"], path=Path(tempdir), **self.KWARGS,
+            )
+        self.assertEqual(["1x", "2x"], list(report["datasets"]))
+        self.assertEqual(Path(__file__).resolve().parent.parent.parent / "raw", Data.PATH)
+
+        df = benchmark.report_dataframe(report)
+        self.assertEqual(
+            [("get_table", 1), ("get_table", 2), ("metrics_dataframe", 1), ("metrics_dataframe", 2)],
+            df.index.to_list(),
+        )
+        self.assertEqual(
+            [report["datasets"]["1x"]["rows"], report["datasets"]["2x"]["rows"]],
+            df.loc["get_table", "rows"].to_list(),
+        )
+        self.assertEqual(1., df.loc[("get_table", 1), "scaling"])
+        self.assertTrue((df["cells/s"] > 0).all())
+
+    def test_benchmark_order(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            report = benchmark.run_benchmark(
+                scales=(1, ), cases=["metrics_dataframe", "update_metrics"], path=Path(tempdir), **self.KWARGS,
+            )
+        self.assertEqual(["update_metrics", "metrics_dataframe"], [r["case"] for r in report["results"]])
+        self.assertGreater(report["results"][1]["cells"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import unittest
+import tempfile
+import shutil
+
+from src.data import *
+from src.table_cache import TableCache, estimate_size
+
+
+class TestTableCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self._data_path = Data.PATH
+        filename = Data.tar_filename((2026, 20))
+        os.makedirs(Path(self.tempdir.name) / filename.parent.name)
+        shutil.copy(filename, Path(self.tempdir.name) / filename.parent.name / filename.name)
+        Data.PATH = Path(self.tempdir.name)
+
+    def tearDown(self):
+        Data.PATH = self._data_path
+        Data.disable_cache()
+        self.tempdir.cleanup()
+
+    def test_lru(self):
+        filename = Data.tar_filename((2026, 20))
+        cache = TableCache(max_bytes=100)
+        cache.put("a", filename, "a", size=40)
+        cache.put("b", filename, "b", size=40)
+        self.assertEqual("a", cache.get("a", filename))
+        cache.put("c", filename, "c", size=40)
+        self.assertIsNone(cache.get("b", filename))
+        self.assertEqual("a", cache.get("a", filename))
+        self.assertEqual("c", cache.get("c", filename))
+        # too large
+        cache.put("d", filename, "d", size=101)
+        self.assertIsNone(cache.get("d", filename))
+        self.assertEqual(
+            {"entries": 2, "bytes": 80, "max_bytes": 100, "hits": 3, "misses": 2, "evictions": 1},
+            cache.info(),
+        )
+
+    def test_data_cache(self):
+        expected_table = Data.get_table((2026, 20), "wuppertalgeo", as_int=True)
+        expected_df = Data.get_dataframe((2026, 20), "wuppertalgeo", location_id=["b*"])
+        self.assertIsNone(Data.cache_info())
+
+        Data.enable_cache(max_bytes=1 << 26)
+        for i in range(3):
+            table = Data.get_table((2026, 20), "wuppertalgeo", as_int=True)
+            self.assertEqual(expected_table, table)
+            df = Data.get_dataframe((2026, 20), "wuppertalgeo", location_id=["b*"])
+            pd.testing.assert_frame_equal(expected_df, df)
+        self.assertIs(table, Data.get_table((2026, 20), "wuppertalgeo", as_int=True))
+        self.assertEqual(2, Data.cache_info()["misses"])
+        self.assertEqual(5, Data.cache_info()["hits"])
+        self.assertGreater(Data.cache_info()["bytes"], estimate_size(expected_df))
+
+        # other arguments are different entries
+        self.assertNotEqual(expected_table, Data.get_table((2026, 20), "wuppertalgeo", as_int=False))
+        self.assertEqual(3, Data.cache_info()["misses"])
+
+        # callable filters are not cached
+        Data.get_dataframe((2026, 20), "wuppertalgeo", location_id=lambda loc: loc.startswith("b"))
+        self.assertEqual(3, Data.cache_info()["entries"])
+
+        # a modified archive invalidates the entries
+        filename = Data.tar_filename((2026, 20))
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNot(table, Data.get_table((2026, 20), "wuppertalgeo", as_int=True))
+        self.assertEqual(4, Data.cache_info()["misses"])
+
+
+if __name__ == "__main__":
+    unittest.main()